@@ -39,6 +39,7 @@ class GCPPlatform(BasePlatform):
     def __init__(self):
 
         self._fs = None
+        self._storage_client = None
         self.name = "GCP"
         self.fs_prefix = "gs://"
 
@@ -87,6 +88,49 @@ class GCPPlatform(BasePlatform):
     def glob(self, path):
         return self.fs.glob(path)
 
+    @property
+    def storage_client(self):
+        if self._storage_client is None:
+            from google.cloud import storage
+
+            self._storage_client = storage.Client()
+        return self._storage_client
+
+    def _blob(self, path):
+        bucket, name = path.removeprefix(self.fs_prefix).split("/", 1)
+        return self.storage_client.bucket(bucket), name
+
+    def read_generation(self, path):
+        """
+        The bytes of an object and their generation, (None, 0) if it does not exist
+        """
+        from google.api_core.exceptions import NotFound, PreconditionFailed
+
+        bucket, name = self._blob(path)
+        while True:
+            blob = bucket.get_blob(name)
+            if blob is None:
+                return None, 0
+            try:
+                data = blob.download_as_bytes(if_generation_match=blob.generation)
+                return data, blob.generation
+            except (NotFound, PreconditionFailed):
+                continue  # Replaced or removed while being read
+
+    def write_if_generation(self, path, data, generation):
+        """
+        Upload the bytes of an object if it is still at the given generation (0 if it
+        did not exist). Returns False if it was written meanwhile.
+        """
+        from google.api_core.exceptions import PreconditionFailed
+
+        bucket, name = self._blob(path)
+        try:
+            bucket.blob(name).upload_from_string(data, if_generation_match=generation)
+        except PreconditionFailed:
+            return False
+        return True
+
     def walk(self, path):
         return self.fs.walk(path)
 
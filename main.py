@@ -8,6 +8,7 @@ from python_roh.set_secrets import set_secrets
 from cloud.utils import log
 from python_roh.src.config import *
 from python_roh.entry import main_entry
+from tools.http_client import HTTP_CLIENT
 
 app = Flask(__name__)
 
@@ -48,11 +49,13 @@ if __name__ == "__main__":
     host = os.environ.get("HOST", "0.0.0.0")
     if serve_as == "cloud_run":
         log("Starting the Flask app for Cloud Run")
+        HTTP_CLIENT.warm_up()
         app.run(host=host, port=port)
     elif serve_as == "dash_app":
         log("Starting the Dash app")
         from python_roh.dash.app import app
 
+        HTTP_CLIENT.warm_up()
         app.run_server(host=host, port=port)
     else:
         with open("payload.json", "r") as f:
@@ -1,17 +1,40 @@
-import requests
+import asyncio
 
 from cloud.utils import log
 from python_roh.src.config import *
-from tools import Parquet, Firestore
+from tools import Parquet, Firestore, HTTP_CLIENT, ASYNC_HTTP_CLIENT
 
 
 def try_get_cast_for_current_performance(performance_id):
     url = f"https://www.rbo.org.uk/api/account-activities?ids={performance_id}"
-    cast_page = requests.get(url)
+    cast_page = HTTP_CLIENT.get(url)
     try:
         cast_page_json = cast_page.json()
     except ValueError:
         return None
+    return process_cast_json(cast_page_json, url, performance_id)
+
+
+async def atry_get_cast_for_current_performance(performance_id):
+    url = f"https://www.rbo.org.uk/api/account-activities?ids={performance_id}"
+    cast_page = await ASYNC_HTTP_CLIENT.get(url)
+    try:
+        cast_page_json = cast_page.json()
+    except ValueError:
+        return None
+    return process_cast_json(cast_page_json, url, performance_id)
+
+
+async def aget_casts_for_performances(performance_ids):
+    """
+    Query the casts of several performances at once
+    """
+    return await asyncio.gather(
+        *[atry_get_cast_for_current_performance(x) for x in performance_ids]
+    )
+
+
+def process_cast_json(cast_page_json, url, performance_id):
     data = cast_page_json.get("data")
     if not data:
         return None
@@ -52,7 +75,7 @@ def try_get_cast_for_current_performance(performance_id):
 
 def handle_new_past_casts(events_df):
     log("Processing new past casts")
-    existing_casts = Parquet(CASTS_PARQUET_LOCATION).read(use_bigquery=False)
+    existing_casts = Parquet(CASTS_PARQUET_LOCATION).read(columns=["performance_id"])
     known_uncast_events = Firestore(MISSING_CASTS_LOCATION).read()
     time_now = pd.Timestamp.now(tz="Europe/London") - pd.Timedelta("2D")
     past_events_df = events_df.query(
@@ -75,22 +98,18 @@ def handle_new_past_casts(events_df):
         f"Processing {len(new_past_events_df)} new past events: {new_past_events_df.title.unique()}"
     )
 
-    cast_dfs = []
-    for performance_id in new_past_performance_ids:
-        cast_df = try_get_cast_for_current_performance(performance_id)
-        if cast_df.empty:
-            continue
-        cast_dfs.append(cast_df)
+    all_casts = ASYNC_HTTP_CLIENT.run(
+        aget_casts_for_performances(new_past_performance_ids)
+    )
+    cast_dfs = [x for x in all_casts if x is not None and not x.empty]
 
     if not cast_dfs:
         log("No new cast data to process")
         return
 
     cast_df = pd.concat(cast_dfs, ignore_index=True)
-
-    new_existing_casts = pd.concat([existing_casts, cast_df], ignore_index=True)
-    new_existing_casts.name = new_existing_casts.name.str.strip()
-    Parquet(CASTS_PARQUET_LOCATION).write(new_existing_casts)
+    cast_df = cast_df.assign(name=cast_df.name.str.strip())
+    Parquet(CASTS_PARQUET_LOCATION).upsert(cast_df)
     log(f"Saved {len(cast_df)} new cast entries to parquet: {cast_df.slug.unique()}")
     return cast_df
 
@@ -141,13 +160,12 @@ def load_seen_events_df(seen_performance_ids):
             ("title", "!=", "Friends Rehearsals"),
             ("performanceId", "in", seen_performance_ids),
         ],
-        use_bigquery=True,
+        use_bigquery=False,
     )
     return seen_events_df
 
 
 def get_seen_casts(seen_casts_df, seen_events_df):
-    seen_casts = Parquet(CASTS_PARQUET_LOCATION).read()
     seen_casts = seen_casts_df.query("performance_id in @seen_events_df.performanceId")
     # This column doesn't exist in the parquet, only in the "seen" casts in Firestore
     seen_casts = seen_casts.drop(columns=["timestamp"], errors="ignore")
@@ -1,18 +1,20 @@
 import dash
 import pandas as pd
-from dash import dcc, html
+from dash import dcc, html, Patch
 from dash_svg import Svg, G, Path
 from python_roh.src.config import *
 from dash.exceptions import PreventUpdate
 from dash.dependencies import Input, Output, State, ClientsideFunction
 
 from main import main_entry
+from python_roh.entry import reclassify_seats_entry
 from python_roh.dash.assets.vars import GITHUB_LOGO_SVG_PATH
 from python_roh.casts import (
     try_get_cast_for_current_performance,
     get_previously_seen_casts,
 )
 from tools import Firestore, Parquet
+from python_roh.src.graphics import Graphics, price_band_labels, hall_band_points
 
 app = dash.Dash(__name__)
 
@@ -70,6 +72,8 @@ app.layout = html.Div(
         dcc.Store(id="screen-width-store"),
         dcc.Store(id="refresh-toggle-store", data={"refresh_enabled": False}),
         dcc.Store(id="seat-status-store", data=[0]),  # Store for seat status IDs
+        # Performance, seats fingerprint and trace names of the shown seats map
+        dcc.Store(id="seats-snapshot-store"),
         html.Div(id="dynamic-content"),
         dcc.Interval(
             id="interval-component-init", interval=100, n_intervals=0, max_intervals=1
@@ -353,7 +357,11 @@ def load_events_calendar(n_intervals, theme_data, screen_width):
 
     # 1. Prepare Payload and run the main entry (Synchronous)
     DASH_PAYLOAD_DEFAULTS["dark_mode"] = theme_data["dark_mode"]
-    payload = {"task_name": "events", **DASH_PAYLOAD_DEFAULTS}
+    payload = {
+        "task_name": "events",
+        "show_availability": True,
+        **DASH_PAYLOAD_DEFAULTS,
+    }
     events_df, _, _, fig = main_entry(payload, return_output=True)
     visible_style = {"visibility": "visible", "display": "block"}
 
@@ -468,7 +476,7 @@ def compute_seen_suffix(name, seen_casts_df):
         return g.loc[kept_rows]
 
     # Group by (title, role_seen) and apply the skipping logic
-    sc = sc.groupby(["title", "role_seen"], group_keys=False).apply(
+    sc = sc.groupby(["title", "role_seen"], group_keys=False, observed=True).apply(
         skip_consecutive_months
     )
 
@@ -514,6 +522,7 @@ def compute_seen_suffix(name, seen_casts_df):
         Output("event-info-container", "children"),
         Output("current-performance-id", "data"),
         Output("casts-container", "children"),
+        Output("seats-snapshot-store", "data"),
     ],
     [Input("events-graph", "clickData")],
     [State("theme-store", "data"), State("seat-status-store", "data")],
@@ -532,7 +541,8 @@ def display_seats_map(
     seats-graph.style,
     event-info-container.children,
     current-performance-id.data,
-    casts-container.children
+    casts-container.children,
+    seats-snapshot-store.data
     """
     if clickData is None and point is None and performance_id is None:
         raise PreventUpdate
@@ -659,7 +669,9 @@ def display_seats_map(
     )
 
     # Get seat map
-    fig = get_seats_map(performance_id, available_seat_status_ids=seat_status_ids)
+    fig, seats_snapshot = get_seats_map(
+        performance_id, available_seat_status_ids=seat_status_ids
+    )
 
     # Get the casts data
     try:
@@ -737,7 +749,14 @@ def display_seats_map(
 
     visible_style = {"visibility": "visible", "display": "block"}
 
-    return fig, visible_style, event_info_container, performance_id, casts_html
+    return (
+        fig,
+        visible_style,
+        event_info_container,
+        performance_id,
+        casts_html,
+        seats_snapshot,
+    )
 
 
 @app.callback(
@@ -769,6 +788,7 @@ def display_seat_view_image(clickData):
         Output("seats-graph", "style", allow_duplicate=True),
         Output("event-info-container", "children", allow_duplicate=True),
         Output("casts-container", "children", allow_duplicate=True),
+        Output("seats-snapshot-store", "data", allow_duplicate=True),
     ],
     [
         Input("next-performance-btn", "n_clicks"),
@@ -804,52 +824,91 @@ def update_performance_id(
     if updated_id is None:
         raise PreventUpdate
     print(f"Updated performance ID: {updated_id}")
-    fig, visible_style, event_info_container, _, casts = display_seats_map(
-        performance_id=updated_id,
-        theme_data=theme_data,
-        seat_status_ids=seat_status_ids,
+    fig, visible_style, event_info_container, _, casts, seats_snapshot = (
+        display_seats_map(
+            performance_id=updated_id,
+            theme_data=theme_data,
+            seat_status_ids=seat_status_ids,
+        )
     )
-    return updated_id, fig, visible_style, event_info_container, casts
+    return updated_id, fig, visible_style, event_info_container, casts, seats_snapshot
 
 
 @app.callback(
-    Output("seats-graph", "figure", allow_duplicate=True),
+    [
+        Output("seats-graph", "figure", allow_duplicate=True),
+        Output("seats-snapshot-store", "data", allow_duplicate=True),
+    ],
     [Input("interval-component-refresh", "n_intervals")],
     [
         State("refresh-toggle-store", "data"),
         State("current-performance-id", "data"),
         State("theme-store", "data"),
         State("seat-status-store", "data"),
+        State("seats-snapshot-store", "data"),
     ],
     prevent_initial_call=True,
 )
 def refresh_seats_map_auto(
-    refresh_intervals, refresh_toggle, performance_id, theme_data, seat_status_ids
+    refresh_intervals,
+    refresh_toggle,
+    performance_id,
+    theme_data,
+    seat_status_ids,
+    seats_snapshot,
 ):
     refresh_enabled = refresh_toggle["refresh_enabled"]
     if refresh_intervals == 0 or not refresh_enabled:
-        return dash.no_update
-    fig = get_seats_map(performance_id, available_seat_status_ids=seat_status_ids)
-    return fig
+        return dash.no_update, dash.no_update
+    return get_seats_map(
+        performance_id,
+        available_seat_status_ids=seat_status_ids,
+        seats_snapshot=seats_snapshot,
+    )
 
 
 @app.callback(
-    Output("seats-graph", "figure", allow_duplicate=True),
+    [
+        Output("seats-graph", "figure", allow_duplicate=True),
+        Output("seats-snapshot-store", "data", allow_duplicate=True),
+    ],
     [Input("refresh-performance-btn", "n_clicks")],
     [
         State("current-performance-id", "data"),
         State("theme-store", "data"),
         State("seat-status-store", "data"),
+        State("seats-snapshot-store", "data"),
     ],
     prevent_initial_call=True,
 )
 def refresh_seats_map_manual(
-    refresh_clicks, performance_id, theme_data, seat_status_ids
+    refresh_clicks, performance_id, theme_data, seat_status_ids, seats_snapshot
 ):
     if refresh_clicks == 0:
-        return dash.no_update
-    fig = get_seats_map(performance_id, available_seat_status_ids=seat_status_ids)
-    return fig
+        return dash.no_update, dash.no_update
+    return get_seats_map(
+        performance_id,
+        available_seat_status_ids=seat_status_ids,
+        seats_snapshot=seats_snapshot,
+    )
+
+
+@app.callback(
+    [
+        Output("seats-graph", "figure", allow_duplicate=True),
+        Output("seats-snapshot-store", "data", allow_duplicate=True),
+    ],
+    [Input("seat-status-store", "data")],
+    [
+        State("current-performance-id", "data"),
+        State("seats-snapshot-store", "data"),
+    ],
+    prevent_initial_call=True,
+)
+def update_seats_map_statuses(seat_status_ids, performance_id, seats_snapshot):
+    if performance_id is None:
+        raise PreventUpdate
+    return reclassify_seats_map(performance_id, seat_status_ids, seats_snapshot)
 
 
 def get_event_title(performance_id):
@@ -859,7 +918,12 @@ def get_event_title(performance_id):
 
 
 # Call to get the seats map
-def get_seats_map(performance_id, available_seat_status_ids=None):
+def get_seats_map(performance_id, available_seat_status_ids=None, seats_snapshot=None):
+    """
+    Returns the seats-graph figure and the seats-snapshot-store data.
+    Given the seats_snapshot of the shown map, nothing is updated if no seat changed,
+    and only the price bands of the changed seats are patched if some did.
+    """
     event_title = get_event_title(performance_id)
     mos_override = {}
     if event_title == "Friends Rehearsals":
@@ -867,13 +931,87 @@ def get_seats_map(performance_id, available_seat_status_ids=None):
     payload = {
         "task_name": "seats",
         "performance_id": performance_id,
+        "outputs": ["seats", "hall"],
         **DASH_PAYLOAD_DEFAULTS,
         **mos_override,
     }
     if available_seat_status_ids is not None:
         payload["available_seat_status_ids"] = available_seat_status_ids
-    _, _, _, _, fig = main_entry(payload, return_output=True)
-    return fig
+    if seats_snapshot and seats_snapshot.get("performance_id") == performance_id:
+        payload["changes_since"] = seats_snapshot["fingerprint"]
+    plot_kwargs = dict(payload)
+    output = main_entry(payload, return_output=True)
+    return seats_map_update(performance_id, output, seats_snapshot, plot_kwargs)
+
+
+def reclassify_seats_map(
+    performance_id, available_seat_status_ids, seats_snapshot=None
+):
+    """
+    Returns the seats-graph figure and the seats-snapshot-store data for other available
+    seat statuses. The seats of the last fetch of the performance are re-classified
+    without querying the API, and only the price bands of the seats whose availability
+    changed are patched; the seats are fetched if none are kept for the performance.
+    """
+    changes_since = None
+    if seats_snapshot and seats_snapshot.get("performance_id") == performance_id:
+        changes_since = seats_snapshot["fingerprint"]
+    plot_kwargs = {"outputs": ["seats", "hall"], **DASH_PAYLOAD_DEFAULTS}
+    output = reclassify_seats_entry(
+        performance_id,
+        available_seat_status_ids=available_seat_status_ids,
+        changes_since=changes_since,
+        **plot_kwargs,
+    )
+    if output is None:
+        return get_seats_map(performance_id, available_seat_status_ids, seats_snapshot)
+    return seats_map_update(performance_id, output, seats_snapshot, plot_kwargs)
+
+
+def seats_map_update(performance_id, output, seats_snapshot, plot_kwargs):
+    """
+    The seats-graph figure (or its patch) and the seats-snapshot-store data of the
+    outputs of a seats entry
+    """
+    seats_price_df, prices_df, _, _, fig = output
+    delta = seats_price_df.attrs["delta"]
+    if fig is None:
+        if delta.empty:
+            print(f"No seats changed for {performance_id}")
+            return dash.no_update, dash.no_update
+        patched_fig = patch_seats_map(
+            seats_price_df, prices_df, delta, seats_snapshot["traces"]
+        )
+        if patched_fig is not None:
+            print(f"Patched {len(delta.changes)} changed seats for {performance_id}")
+            return patched_fig, {**seats_snapshot, "fingerprint": delta.fingerprint}
+        fig = Graphics("hall").plot(seats_price_df, prices_df, **plot_kwargs)
+    seats_snapshot = {
+        "performance_id": performance_id,
+        "fingerprint": delta.fingerprint,
+        "traces": [trace.name for trace in fig.data],
+    }
+    return fig, seats_snapshot
+
+
+def patch_seats_map(seats_price_df, prices_df, delta, trace_names):
+    """
+    Patch of the seats-graph figure replacing only the points of the price bands that
+    the changed seats left or joined, or None if one of them has no trace in the figure
+    """
+    changes = delta.changes
+    bands = set(price_band_labels(changes.Price, changes.seat_available))
+    bands |= set(price_band_labels(changes.PreviousPrice, changes.was_available))
+    if not bands.issubset(trace_names):
+        return None
+    patched_fig = Patch()
+    band_points = hall_band_points(seats_price_df, prices_df, bands)
+    for band, points in band_points.items():
+        trace = patched_fig["data"][trace_names.index(band)]
+        trace["x"] = points["x"]
+        trace["y"] = points["y"]
+        trace["customdata"] = points["customdata"]
+    return patched_fig
 
 
 def get_all_title_events(performance_id, event_title=None):
@@ -3,12 +3,20 @@ import json
 
 from cloud.utils import log
 from python_roh.src.config import *
-from tools import Parquet, Firestore
+from tools import Parquet, Firestore, ASYNC_HTTP_CLIENT, HTTP_CACHE, METRICS
 from python_roh.src.graphics import Graphics
-from python_roh.src.src import API, print_performance_info
-from python_roh.upcoming_events import handle_upcoming_events
+from python_roh.src.src import API, print_performance_info, reclassify_seats
+from python_roh.src.fetch_plan import FetchPlan
+from python_roh.src.seat_snapshots import SEAT_SNAPSHOTS, SEAT_FRAMES
+from python_roh.src.event_availability import query_events_availability
+from python_roh.upcoming_events import (
+    handle_upcoming_events,
+    store_events_fingerprint,
+    refresh_events_fingerprint,
+)
 from python_roh.src.api import get_query_dict, configure_query_dict
 from python_roh.casts import handle_new_past_casts, handle_seen_performances
+from python_roh.seat_history import record_seat_changes
 
 try:
     from python_roh.src.src_secret import secret_function
@@ -52,16 +60,33 @@ def save_unseen_events(events_df, new_events_df, partition_cols):
         log("No unseen events to save")
 
 
-def upcoming_events_entry(dont_save=True, **kwargs):
+def upcoming_events_entry(
+    dont_save=True, skip_unchanged=None, show_availability=False, **kwargs
+):
     """
-    Entry point for the upcoming events task and the events timeline plot
+    Entry point for the upcoming events task and the events timeline plot.
+    By default the runs that save the data stop early if the events payload is unchanged.
+    With show_availability, the timeline shows the seats left and cheapest price of the
+    upcoming performances, from the batched ZoneAvailabilities and Prices.
     """
-    df_bundle = handle_upcoming_events(QUERY_DICT, **kwargs)
+    if skip_unchanged is None:
+        skip_unchanged = not dont_save
+    df_bundle = handle_upcoming_events(
+        QUERY_DICT, skip_unchanged=skip_unchanged, **kwargs
+    )
+    if df_bundle is None:
+        refresh_events_fingerprint()
+        return None, None, None, None
     events_df, today_tomorrow_events_df, next_week_events_df, new_events_df = df_bundle
-    fig = Graphics("events").plot(events_df, dont_save=dont_save, **kwargs)
+    availability_df = None
+    if show_availability:
+        availability_df = query_events_availability(QUERY_DICT, events_df)
+    fig = Graphics("events").plot(
+        events_df, availability_df=availability_df, dont_save=dont_save, **kwargs
+    )
     # fig = None
     if not dont_save:
-        partition_cols = ["location", "date", "time", "title"]
+        partition_cols = EVENTS_PARTITION_COLS
         save_new_events(new_events_df, partition_cols)
         save_unseen_events(events_df, new_events_df, partition_cols)
 
@@ -72,36 +97,169 @@ def upcoming_events_entry(dont_save=True, **kwargs):
         )
         handle_new_past_casts(events_df)
         handle_seen_performances()
+        store_events_fingerprint(events_df.attrs.get("fingerprint"))
     return events_df, today_tomorrow_events_df, next_week_events_df, fig
 
 
-def seats_availability_entry(**kwargs):
+def seats_fetch_plan(outputs=None, record_history=False):
+    """
+    The FetchPlan of the outputs asked for; recording the history needs the seats frame
     """
-    Entry point for the seats availability task and the hall seats plot
+    plan = FetchPlan(outputs)
+    if record_history and not plan.needs("seats"):
+        plan = FetchPlan(plan.outputs + ["seats"])
+    log(f"Fetching {plan}")
+    return plan
+
+
+def planned_frames(all_data, plan):
+    """
+    The seats, prices, zones and price types frames of all_data, None if not planned
+    """
+    data_types = ["seats", "prices", "zone_ids", "price_types"]
+    return [all_data.get(x) if x in plan.data_types else None for x in data_types]
+
+
+def seats_availability_entry(
+    changes_since=None, record_history=False, outputs=None, **kwargs
+):
+    """
+    Entry point for the seats availability task and the hall seats plot.
+    Only the outputs asked for (seats, hall, zones, prices, price_types, see FetchPlan)
+    are fetched and computed; the frames that were not fetched and the figure that
+    was not plotted are None.
+    The SeatDelta of the seats since the last fetch of the performance is attached
+    as seats_price_df.attrs["delta"]. If changes_since is the fingerprint of that last
+    fetch, the hall is not plotted (fig is None): the caller applies the delta instead.
+    With record_history, the seats whose status or price changed since the last record
+    of the performance are appended to the seat history.
     """
     print_performance_info(**kwargs)
-    if isinstance(json.loads(str(os.getenv("PERFORMANCE_ID"))), list):
-        raise ValueError("List performance IDs are not supported for `seats` task.")
-    all_data = API(QUERY_DICT).query_all_data(
-        data_types=["seats", "prices", "zone_ids", "price_types"],
-        post_process=True,
-        **kwargs,
-    )
-    seats_price_df, prices_df, zones_df, price_types_df = (
-        all_data["seats"],
-        all_data["prices"],
-        all_data["zone_ids"],
-        all_data["price_types"],
+    performance_id = json.loads(str(os.getenv("PERFORMANCE_ID")))
+    plan = seats_fetch_plan(outputs, record_history)
+    if isinstance(performance_id, list):
+        return seats_availability_batch_entry(
+            performance_id, record_history=record_history, plan=plan, **kwargs
+        )
+    api = API(QUERY_DICT)
+    all_data = ASYNC_HTTP_CLIENT.run(
+        api.aquery_all_data(
+            data_types=plan.data_types,
+            post_process=plan.post_process,
+            **kwargs,
+        )
     )
+    if api.stale_data_types:
+        log(f"Rendering with the last good {api.stale_data_types}")
+    seats_price_df, prices_df, zones_df, price_types_df = planned_frames(all_data, plan)
+    if not plan.needs("seats"):
+        return seats_price_df, prices_df, zones_df, price_types_df, None
     log(f"Seats available: {seats_price_df.seat_available.sum()}")
-    fig = Graphics("hall").plot(seats_price_df, prices_df, **kwargs)
+    delta = SEAT_SNAPSHOTS.update(performance_id, seats_price_df)
+    SEAT_FRAMES.put(performance_id, seats_price_df, prices_df)
+    log(f"Seats changed since the last fetch: {len(delta.changes)}")
+    if record_history:
+        record_seat_changes(seats_price_df, performance_id)
+    fig = plot_seats_delta(
+        seats_price_df, prices_df, delta, changes_since, plan, **kwargs
+    )
+    return seats_price_df, prices_df, zones_df, price_types_df, fig
+
+
+def plot_seats_delta(seats_price_df, prices_df, delta, changes_since, plan, **kwargs):
+    """
+    The hall figure of the seats, or None if the figure is not planned or if the
+    caller has the seats of changes_since and applies the delta instead
+    """
+    seats_price_df.attrs["delta"] = delta
+    if not plan.plot:
+        return None
+    if delta.is_since(changes_since):
+        log("Skipping the hall plot, the caller has the previous seats")
+        return None
+    return Graphics("hall").plot(seats_price_df, prices_df, **kwargs)
+
+
+def reclassify_seats_entry(
+    performance_id,
+    available_seat_status_ids=None,
+    changes_since=None,
+    outputs=None,
+    **kwargs,
+):
+    """
+    Entry point for a change of the available seat statuses of a performance:
+    the seats kept from its last fetch are re-classified, and the hall re-plotted,
+    without querying the API. Returns the same outputs as seats_availability_entry
+    (the zones and price types are None), or None if no seats of the performance are
+    kept, in which case the caller fetches them.
+    """
+    frames = SEAT_FRAMES.get(performance_id)
+    if frames is None:
+        log(f"No seats kept for {performance_id}, they need to be fetched")
+        return None
+    seats_price_df, prices_df = frames
+    seats_price_df = reclassify_seats(seats_price_df, available_seat_status_ids)
+    delta = SEAT_SNAPSHOTS.update(performance_id, seats_price_df)
+    SEAT_FRAMES.put(performance_id, seats_price_df, prices_df)
+    log(f"Seats re-classified for {available_seat_status_ids}: {len(delta.changes)}")
+    plan = FetchPlan(outputs)
+    fig = plot_seats_delta(
+        seats_price_df, prices_df, delta, changes_since, plan, **kwargs
+    )
+    return seats_price_df, prices_df, None, None, fig
+
+
+def seats_availability_batch_entry(
+    performance_ids, record_history=False, plan=None, **kwargs
+):
+    """
+    Entry point for the seats availability of several performances at once
+    """
+    plan = plan or seats_fetch_plan(record_history=record_history)
+    all_data = ASYNC_HTTP_CLIENT.run(
+        API(QUERY_DICT).aquery_seats_batch(
+            performance_ids,
+            data_types=plan.data_types,
+            post_process=plan.post_process,
+            **kwargs,
+        )
+    )
+    seats_price_df, prices_df, zones_df, price_types_df = planned_frames(all_data, plan)
+    if not plan.needs("seats"):
+        return seats_price_df, prices_df, zones_df, price_types_df, None
+    seats_available = seats_price_df.groupby("PerformanceId").seat_available.sum()
+    log(f"Seats available: {seats_available.to_dict()}")
+    deltas = SEAT_SNAPSHOTS.update_many(seats_price_df)
+    SEAT_FRAMES.put_many(seats_price_df, prices_df)
+    log(f"Seats changed: { {k: len(v.changes) for k, v in deltas.items()} }")
+    if record_history:
+        record_seat_changes(seats_price_df)
+    log("Skipping the hall plot for multiple performances")
+    fig = None
+    seats_price_df.attrs["delta"] = deltas
     return seats_price_df, prices_df, zones_df, price_types_df, fig
 
 
+def compaction_entry(locations=None, min_files=None, **kwargs):
+    """
+    Entry point for the compaction task: coalesces the small files of the partitions
+    of the Parquet datasets, PARQUET_COMPACTION_LOCATIONS by default
+    """
+    locations = locations or PARQUET_COMPACTION_LOCATIONS
+    files_removed = {
+        location: Parquet(location).compact(min_files=min_files)
+        for location in locations
+    }
+    log(f"Files removed by the compaction: {files_removed}")
+    return files_removed
+
+
 def task_scheduler(task_name, **kwargs):
     task_fun = {
         "events": upcoming_events_entry,
         "seats": seats_availability_entry,
+        "compact": compaction_entry,
     }.get(task_name, None)
     if task_fun is None:
         raise ValueError(f"Task {task_name} not found")
@@ -123,11 +281,15 @@ def main(task_name, **kwargs):
 
 def main_entry(payload, return_output=False):
     task_name = payload.pop("task_name", None)
+    # The metrics and cache counts are process-wide
+    metrics_snapshot, cache_stats = METRICS.snapshot(), HTTP_CACHE.stats()
     if HAS_SECRET and payload.get("secret_function", False):
         task_scheduler(task_name, **payload)  # Sets the QUERY_DICT only
         secret_function(QUERY_DICT)
     else:
         output = main(task_name, **payload)
+        log(f"HTTP cache: {HTTP_CACHE.stats(since=cache_stats)}")
+        METRICS.log_summary(since=metrics_snapshot)
         if return_output:
             return output
     log("Execution finished")
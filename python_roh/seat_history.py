@@ -0,0 +1,246 @@
+"""
+Append-only history of the seat availability of each performance.
+Every recorded seats fetch appends only the seats whose status or price changed since
+the last recorded state of the performance to SEAT_HISTORY_PARQUET_LOCATION,
+partitioned by performanceId and day (Europe/London). The first record of a performance
+holds all of its seats. The last recorded state of each performance is kept in one
+small file under SEAT_HISTORY_STATE_LOCATION, so the history does not depend on the
+snapshots of the process, which the interactive fetches also update.
+"""
+
+import numpy as np
+import pandas as pd
+
+from cloud.utils import log
+from python_roh.src.config import *
+from tools import Parquet
+from tools.parquet import PARQUET_WRITE_POOL
+from python_roh.src.utils import force_list
+from python_roh.src.seat_snapshots import SeatSnapshot, SeatDelta
+
+
+def _state_path(performance_id):
+    return f"{SEAT_HISTORY_STATE_LOCATION}/{performance_id}.parquet"
+
+
+def last_recorded_snapshot(performance_id):
+    """
+    The SeatSnapshot of the last recorded state of a performance, or None
+    """
+    state_df = Parquet(_state_path(performance_id)).read(allow_empty=True)
+    if state_df.empty:
+        return None
+    return SeatSnapshot.from_frame(state_df)
+
+
+def recorded_changes(delta):
+    """
+    The changes of a SeatDelta to record: the seats with a new status or price, added or
+    removed. A change of seat_available alone follows from the seat statuses asked for,
+    not from a sale, and is not recorded.
+    """
+    changes = delta.changes
+    # The status is NaN on the side where the seat is missing, so never equal then
+    status_changed = (
+        changes.SeatStatusId.to_numpy() != changes.PreviousSeatStatusId.to_numpy()
+    )
+    price, previous_price = changes.Price.to_numpy(), changes.PreviousPrice.to_numpy()
+    price_changed = ~(
+        (price == previous_price) | (np.isnan(price) & np.isnan(previous_price))
+    )
+    return changes[status_changed | price_changed]
+
+
+def history_records(performance_id, changes, recorded_at):
+    """
+    Compact records of the changed seats of a performance, with dictionary-encoded
+    statuses and zones
+    """
+    return pd.DataFrame(
+        {
+            "recorded_at": recorded_at,
+            "SeatId": changes.SeatId.astype("int32"),
+            "SeatStatusId": changes.SeatStatusId.astype("Int16").astype("category"),
+            "ZoneNameGeneral": changes.ZoneNameGeneral.astype("category"),
+            "Price": changes.Price.astype("float32"),
+            "seat_available": changes.seat_available.astype(bool),
+            "performanceId": str(performance_id),
+            "day": recorded_at.tz_convert("Europe/London").strftime("%Y-%m-%d"),
+        }
+    )
+
+
+def _write_state(performance_id, state):
+    Parquet(_state_path(performance_id)).write(state.to_frame())
+
+
+def record_seat_changes(seats_price_df, performance_id=None, recorded_at=None):
+    """
+    Append the seats whose status or price changed since the last recorded state of
+    their performance to the seat history, and store the new state of the performances
+    with changes. Nothing is written if no seat changed. The states of the performances
+    are read, and written, in parallel on PARQUET_WRITE_POOL.
+    Args:
+    - seats_price_df (pd.DataFrame): The post-processed seats of one performance,
+        or of several keyed by PerformanceId
+    - performance_id: The performance of the seats, None for a batched frame
+    """
+    if performance_id is None:
+        seats_dfs = dict(list(seats_price_df.groupby("PerformanceId")))
+    else:
+        seats_dfs = {performance_id: seats_price_df}
+    recorded_at = recorded_at or pd.Timestamp.now(tz="UTC")
+    previous_states = PARQUET_WRITE_POOL.map(last_recorded_snapshot, seats_dfs)
+    records, states = [], {}
+    for (performance_id, seats_df), previous in zip(seats_dfs.items(), previous_states):
+        current = SeatSnapshot.from_frame(seats_df)
+        delta = SeatDelta.between(performance_id, previous, current)
+        changes = recorded_changes(delta)
+        if changes.empty:
+            continue
+        records.append(history_records(performance_id, changes, recorded_at))
+        states[performance_id] = current
+    if not records:
+        log("No seat changes to record")
+        return False
+    records_df = pd.concat(records, ignore_index=True)
+    log(f"Recording {len(records_df)} seat changes of {list(states)}")
+    Parquet(SEAT_HISTORY_PARQUET_LOCATION).write(
+        records_df,
+        partition_cols=SEAT_HISTORY_PARTITION_COLS,
+        add_uuid=True,
+    )
+    PLATFORM.makedirs(SEAT_HISTORY_STATE_LOCATION, exist_ok=True)
+    list(PARQUET_WRITE_POOL.map(_write_state, states, states.values()))
+    return True
+
+
+def load_seat_history(performance_ids=None):
+    """
+    Read the seat history, of all performances or of the given ones
+    """
+    filters = None
+    if performance_ids is not None:
+        filters = {"performanceId": [str(x) for x in force_list(performance_ids)]}
+    history_df = Parquet(SEAT_HISTORY_PARQUET_LOCATION).read(filters=filters)
+    if history_df.empty:
+        return history_df
+    history_df = history_df.assign(
+        performanceId=history_df.performanceId.astype(str),
+        SeatStatusId=history_df.SeatStatusId.astype("float64").astype("Int16"),
+    )
+    return history_df.sort_values(["performanceId", "recorded_at"], kind="stable")
+
+
+def _availability_changes(history_df):
+    """
+    +1 / -1 / 0 change of the number of available seats of each record
+    """
+    available = history_df.seat_available.astype("int8")
+    previous = available.groupby(
+        [history_df.performanceId, history_df.SeatId], observed=True
+    ).shift(fill_value=0)
+    return available - previous
+
+
+def sell_through_curves(history_df):
+    """
+    Number and fraction of sold (not available) seats of each performance at each record.
+    Returns:
+    - pd.DataFrame: performanceId, recorded_at, seats_total, seats_available, sold_fraction
+    """
+    if history_df.empty:
+        return pd.DataFrame()
+    history_df = history_df.assign(
+        availability_change=_availability_changes(history_df)
+    )
+    curves_df = (
+        history_df.groupby(["performanceId", "recorded_at"], observed=True)
+        .availability_change.sum()
+        .groupby(level="performanceId")
+        .cumsum()
+        .rename("seats_available")
+        .reset_index()
+    )
+    seats_total = history_df.groupby("performanceId").SeatId.nunique()
+    curves_df = curves_df.assign(
+        seats_total=curves_df.performanceId.map(seats_total).astype(int)
+    )
+    sold = curves_df.seats_total - curves_df.seats_available
+    return curves_df.assign(sold_fraction=sold / curves_df.seats_total)
+
+
+def zone_price_changes(history_df):
+    """
+    Price changes of the seats of each zone, i.e. the records of a seat whose price
+    differs from its previously recorded one.
+    Returns:
+    - pd.DataFrame: performanceId, ZoneNameGeneral, recorded_at, seats, previous price range
+        (previous_min_price, previous_max_price) and new price range (min_price, max_price)
+    """
+    if history_df.empty:
+        return pd.DataFrame()
+    previous_price = history_df.groupby(
+        [history_df.performanceId, history_df.SeatId], observed=True
+    ).Price.shift()
+    changed = previous_price.notnull() & (previous_price != history_df.Price)
+    changed &= history_df.Price.notnull()
+    price_changes_df = history_df[changed].assign(
+        previous_price=previous_price[changed]
+    )
+    return (
+        price_changes_df.groupby(
+            ["performanceId", "ZoneNameGeneral", "recorded_at"], observed=True
+        )
+        .agg(
+            seats=("SeatId", "size"),
+            previous_min_price=("previous_price", "min"),
+            previous_max_price=("previous_price", "max"),
+            min_price=("Price", "min"),
+            max_price=("Price", "max"),
+        )
+        .reset_index()
+    )
+
+
+def time_to_sell_out(history_df, productions_df=None):
+    """
+    Time from the first record of each performance until no seat was available,
+    summarised per production.
+    Returns:
+    - pd.DataFrame: productionId, title, performances, sold_out, median and max time_to_sell_out
+    """
+    curves_df = sell_through_curves(history_df)
+    if curves_df.empty:
+        return pd.DataFrame()
+    first_recorded = curves_df.groupby("performanceId").recorded_at.min()
+    sold_out_at = (
+        curves_df[curves_df.seats_available <= 0]
+        .groupby("performanceId")
+        .recorded_at.min()
+    )
+    performances_df = pd.DataFrame({"first_recorded_at": first_recorded})
+    performances_df = performances_df.assign(
+        time_to_sell_out=sold_out_at - first_recorded
+    ).reset_index()
+    if productions_df is None:
+        productions_df = Parquet(PRODUCTIONS_PARQUET_LOCATION).read(
+            read_partitions_only=True
+        )
+    productions_df = productions_df.loc[:, ["performanceId", "productionId", "title"]]
+    productions_df = productions_df.drop_duplicates("performanceId").astype(
+        {"performanceId": str}
+    )
+    performances_df = performances_df.merge(
+        productions_df, on="performanceId", how="left"
+    )
+    return (
+        performances_df.groupby(["productionId", "title"], dropna=False)
+        .agg(
+            performances=("performanceId", "size"),
+            sold_out=("time_to_sell_out", "count"),
+            median_time_to_sell_out=("time_to_sell_out", "median"),
+            max_time_to_sell_out=("time_to_sell_out", "max"),
+        )
+        .reset_index()
+    )
@@ -47,6 +47,92 @@ VIEW_FROM_SEAT_URL = "https://static.roh.org.uk/view-from-seat/910"
 INTERSTITIAL_URL = "https://www.rbo.org.uk/checkout/interstitial"
 SEATMAP_URL = "https://www.rbo.org.uk/seatmap"
 PYTHON_ROH_REPO_URL = "https://github.com/VitaminB16/roh_tickets"
+ROH_BASE_URL = "https://www.rbo.org.uk"
+
+# Shared HTTP session: per-host keep-alive pools and (connect, read) timeouts in seconds
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 4))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 16))
+HTTP_TIMEOUT = (
+    float(os.getenv("HTTP_CONNECT_TIMEOUT", 5)),
+    float(os.getenv("HTTP_READ_TIMEOUT", 30)),
+)
+HTTP_WARM_UP_URLS = [ROH_BASE_URL]
+HTTP_ASYNC_MAX_CONNECTIONS = int(os.getenv("HTTP_ASYNC_MAX_CONNECTIONS", 20))
+HTTP_ASYNC_HTTP2 = os.getenv("HTTP_ASYNC_HTTP2", "true").lower() == "true"
+# Disk-backed response cache: seconds each endpoint is served without revalidation
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE_ENABLED", "true").lower() == "true"
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", "/tmp/roh_http_cache")
+HTTP_CACHE_TTLS = {
+    ALL_EVENTS_URL: 0,  # Always revalidated
+    SEAT_STATUSES_URL: 24 * 60 * 60,
+    PRICE_TYPES_BASE_URL: 6 * 60 * 60,
+}
+# Per-host token bucket (requests per second, burst) and retry policy of every HTTP call
+HTTP_RATE_LIMIT = float(os.getenv("HTTP_RATE_LIMIT", 10))
+HTTP_RATE_BURST = int(os.getenv("HTTP_RATE_BURST", 20))
+HTTP_MIN_RATE_LIMIT = float(os.getenv("HTTP_MIN_RATE_LIMIT", 0.5))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 4))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", 0.5))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", 30))
+HTTP_RETRY_STATUSES = [429, 500, 502, 503, 504]
+# Record/replay of the HTTP traffic: "record" saves every response into HTTP_FIXTURES_DIR
+# (bypassing the HTTP cache, so that every request reaches the server and is saved),
+# "replay" serves them from it with HTTP_REPLAY_LATENCY seconds of delay, offline
+HTTP_REPLAY_MODE = os.getenv("HTTP_REPLAY_MODE", "off").lower()
+HTTP_FIXTURES_DIR = os.getenv("HTTP_FIXTURES_DIR", "fixtures/http")
+HTTP_REPLAY_LATENCY = float(os.getenv("HTTP_REPLAY_LATENCY", 0))
+# Hedged requests: a duplicate is sent once the first one is slower than the p95 latency
+# of its endpoint (or HTTP_HEDGE_DEFAULT_DELAY seconds until there are enough samples)
+HTTP_HEDGE_ENABLED = os.getenv("HTTP_HEDGE_ENABLED", "true").lower() == "true"
+HTTP_HEDGE_QUANTILE = float(os.getenv("HTTP_HEDGE_QUANTILE", 0.95))
+HTTP_HEDGE_MIN_SAMPLES = int(os.getenv("HTTP_HEDGE_MIN_SAMPLES", 20))
+HTTP_HEDGE_DEFAULT_DELAY = float(os.getenv("HTTP_HEDGE_DEFAULT_DELAY", 2))
+# Seconds a synchronous caller waits on a coroutine of the shared event loop
+HTTP_ASYNC_RUN_TIMEOUT = float(os.getenv("HTTP_ASYNC_RUN_TIMEOUT", 600))
+# Seconds each API data type may take before it is given up on
+API_DEFAULT_DEADLINE = float(os.getenv("API_DEFAULT_DEADLINE", 30))
+API_DEADLINES = {
+    "seats": float(os.getenv("API_SEATS_DEADLINE", 15)),
+    "prices": float(os.getenv("API_PRICES_DEADLINE", 8)),
+    "zone_ids": float(os.getenv("API_ZONE_IDS_DEADLINE", 8)),
+    "price_types": float(os.getenv("API_PRICE_TYPES_DEADLINE", 8)),
+}
+# Data types that fall back to their last good frame when a query fails or times out
+API_FALLBACK_DATA_TYPES = ["prices", "zone_ids", "price_types"]
+API_FALLBACK_MAX_ENTRIES = 64
+# Outputs of the seats task: the API data types each one is built from, and the other
+# outputs it needs. A caller asks for some of them and only those are fetched and computed
+SEATS_OUTPUTS = {
+    "seats": {"data_types": ["seats", "prices", "zone_ids"], "needs": []},
+    "hall": {"data_types": [], "needs": ["seats"]},
+    "zones": {"data_types": ["zone_ids"], "needs": []},
+    "prices": {"data_types": ["prices"], "needs": []},
+    "price_types": {"data_types": ["price_types"], "needs": []},
+}
+SEATS_DEFAULT_OUTPUTS = ["seats", "hall", "zones", "prices"]
+# Compiled seat map positions: bump the version when the layout of the file changes.
+# On GCP the file is downloaded once per container into SEAT_GEOMETRY_CACHE_DIR
+SEAT_GEOMETRY_VERSION = 1
+SEAT_GEOMETRY_CACHE_DIR = os.getenv("SEAT_GEOMETRY_CACHE_DIR", "/tmp/roh_seat_geometry")
+# Performances whose last seats snapshot is kept in memory to give the changed seats
+SEAT_SNAPSHOTS_MAX_ENTRIES = int(os.getenv("SEAT_SNAPSHOTS_MAX_ENTRIES", 64))
+# Availability overlay of the events timeline: seconds the summary of a performance is
+# kept, performances per batched query, and seats left from which a bar is fully shaded
+EVENT_AVAILABILITY_TTL = float(os.getenv("EVENT_AVAILABILITY_TTL", 5 * 60))
+EVENT_AVAILABILITY_BATCH_SIZE = int(os.getenv("EVENT_AVAILABILITY_BATCH_SIZE", 40))
+EVENT_AVAILABILITY_SHADE_SEATS = int(os.getenv("EVENT_AVAILABILITY_SHADE_SEATS", 200))
+# Parquet writes: codec of the files (zstd, snappy or gzip), rows per row group (None for
+# the pyarrow default) and threads of the process-wide pool writing the partitions,
+# mostly waiting on the uploads on GCP
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "snappy")
+PARQUET_ROW_GROUP_SIZE = int(os.getenv("PARQUET_ROW_GROUP_SIZE", 0)) or None
+PARQUET_WRITE_WORKERS = int(os.getenv("PARQUET_WRITE_WORKERS", 32))
+# Compaction of the Parquet datasets (the compact task): the leaf partitions holding at
+# least this many files are coalesced into one
+PARQUET_COMPACTION_MIN_FILES = int(os.getenv("PARQUET_COMPACTION_MIN_FILES", 2))
+# Attempts of the read-modify-write of a dataset manifest after a concurrent write of it,
+# by the tasks of other instances or the compact task
+PARQUET_MANIFEST_WRITE_RETRIES = int(os.getenv("PARQUET_MANIFEST_WRITE_RETRIES", 10))
 
 # TAKEN_SEAT_STATUS_IDS = [3, 4, 6, 7, 8, 13]
 # TAKEN_SEAT_STATUS_IDS = [4, 5, 6, 7, 8, 13, 592]  # 3,
@@ -80,17 +166,26 @@ def parse_args(args):
     Parse the command line arguments.
     Options:
     - events: query the upcoming events and plot the events timeline
+        options:
+        --show_availability: show the seats left and cheapest price of each performance
     - seats: query the seats availability and plot the hall seats
         options:
         --soonest: plot the hall seats for the soonest performance
         -pid: performance_id (int) or "soonest" (str)
         -mosid: mode_of_sale_id
         --secret_function: option to use the secret function
+        --record_history: record the seat changes in the seat history
+        --outputs: the outputs to fetch and compute (seats, hall, zones, prices, price_types)
+    - compact: compact the small files of the Parquet datasets
+        options:
+        --min_files: files from which a partition is compacted
     --no_plot: do not plot the results
     -platform: platform name (local, GCP)
     """
     parser = argparse.ArgumentParser()
-    parser.add_argument("task_name", help="Task name", choices=["events", "seats"])
+    parser.add_argument(
+        "task_name", help="Task name", choices=["events", "seats", "compact"]
+    )
     parser.add_argument(
         "--soonest",
         help="Plot the hall seats for the soonest performance",
@@ -112,6 +207,29 @@ def parse_args(args):
     parser.add_argument(
         "--no_plot", help="Do not plot the results", action="store_true", default=None
     )
+    parser.add_argument(
+        "--show_availability",
+        help="Show the availability of the performances on the events timeline",
+        action="store_true",
+        default=None,
+    )
+    parser.add_argument(
+        "--outputs",
+        help="Outputs of the seats task to fetch and compute",
+        nargs="+",
+        choices=list(SEATS_OUTPUTS),
+    )
+    parser.add_argument(
+        "--record_history",
+        help="Record the seat changes in the seat history",
+        action="store_true",
+        default=None,
+    )
+    parser.add_argument(
+        "--min_files",
+        help="Files from which a partition is compacted by the compact task",
+        type=int,
+    )
     args = parser.parse_args(args)
 
     output = vars(args)
@@ -134,7 +252,9 @@ TEXT_MAP_POSITIONS_CSV = PREFIX + "metadata/text_positions.csv"
 TITLE_COLOURS_LOCATION = PREFIX + "metadata/titles_colour.json"
 SEAT_STATUSES_PATH = PREFIX + "metadata/seat_statuses.json"
 SEAT_POSITIONS_JSON_LOCATION = PREFIX + "metadata/seat_positions.json"
+SEAT_GEOMETRY_LOCATION = PREFIX + f"metadata/seat_geometry_v{SEAT_GEOMETRY_VERSION}.npy"
 SOONEST_PERFORMANCES_LOCATION = PREFIX + "metadata/soonest_performances.json"
+EVENTS_FINGERPRINT_LOCATION = PREFIX + "metadata/events_fingerprint.json"
 MISSING_CASTS_LOCATION = PREFIX + "metadata/missing_casts.json"
 EVENTS_PARQUET_LOCATION = PREFIX + "output/roh_events.parquet"
 PRODUCTIONS_PARQUET_LOCATION = PREFIX + "output/roh_productions.parquet"
@@ -144,6 +264,8 @@ CASTS_PARQUET_LOCATION = PREFIX + "output/cast_performances.parquet"
 SEEN_CASTS_PARQUET_LOCATION = PREFIX + "output/seen_cast_performances.parquet"
 SEEN_PERFORMANCES_LOCATION = PREFIX + "metadata/seen_performances.json"
 SEEN_EVENTS_PARQUET_LOCATION = PREFIX + "metadata/seen_events.parquet"
+SEAT_HISTORY_PARQUET_LOCATION = PREFIX + "output/seat_history.parquet"
+SEAT_HISTORY_STATE_LOCATION = PREFIX + "metadata/seat_history_state"
 # Public  --------------------------------
 HALL_IMAGE_LOCATION = PREFIX_PUBLIC + "output/images/ROH_hall.png"
 EVENTS_IMAGE_LOCATION = PREFIX_PUBLIC + "output/images/ROH_events.png"
@@ -318,11 +440,86 @@ PARQUET_SCHEMAS = {
     CASTS_PARQUET_LOCATION: CASTS_PARQUET_SCHEMA,
     SEEN_CASTS_PARQUET_LOCATION: CASTS_PARQUET_SCHEMA,
 }
+# Compact dtypes of the frames (see python_roh.src.dtypes.compact_dtypes): the
+# low-cardinality string columns become categoricals, and the True/False/None ones
+# nullable booleans. Every frame of these also gets its numeric columns downcast
+SEATS_COMPACT_DTYPES = {
+    "category": [
+        "SeatRow",
+        "SeatNumber",
+        "ZoneName",
+        "ZoneNameGeneral",
+        "SeatStatusStr",
+    ],
+}
+EVENTS_COMPACT_DTYPES = {
+    "category": [
+        "type",
+        "sourceType",
+        "carouselDescription",
+        "slug",
+        "performanceType",
+        "day",
+        "url",
+        "location",
+        "title",
+    ],
+    "boolean": ["isHiddenFromTicketsAndEvents"],
+}
+CASTS_COMPACT_DTYPES = {
+    "category": [
+        "role",
+        "name",
+        "replaced_name",
+        "url",
+        "performance_id",
+        "slug",
+        "title",
+    ],
+    "boolean": ["is_replacing"],
+}
+API_COMPACT_DTYPES = {
+    "seats": SEATS_COMPACT_DTYPES,
+    "prices": {},
+    "zone_ids": {},
+    "price_types": {},
+}
+PARQUET_COMPACT_DTYPES = {
+    EVENTS_PARQUET_LOCATION: EVENTS_COMPACT_DTYPES,
+    SEEN_EVENTS_PARQUET_LOCATION: EVENTS_COMPACT_DTYPES,
+    CASTS_PARQUET_LOCATION: CASTS_COMPACT_DTYPES,
+    SEEN_CASTS_PARQUET_LOCATION: CASTS_COMPACT_DTYPES,
+}
+FIRESTORE_COMPACT_DTYPES = {
+    k.replace(PREFIX, ""): v for k, v in PARQUET_COMPACT_DTYPES.items()
+}
 PYARROW_SCHEMAS = {
     EVENTS_PARQUET_LOCATION: EVENTS_PYARROW_SCHEMA,
     SEEN_EVENTS_PARQUET_LOCATION: EVENTS_PYARROW_SCHEMA,
 }
 FIRESTORE_SCHEMAS = {k.replace(PREFIX, ""): v for k, v in PARQUET_SCHEMAS.items()}
+# Hive partition columns of the partitioned datasets, in the order of their directories
+EVENTS_PARTITION_COLS = ["location", "date", "time", "title"]
+PRODUCTIONS_PARTITION_COLS = ["title", "productionId", "date", "time", "performanceId"]
+SEAT_HISTORY_PARTITION_COLS = ["performanceId", "day"]
+PARQUET_PARTITION_COLS = {
+    EVENTS_PARQUET_LOCATION: EVENTS_PARTITION_COLS,
+    PRODUCTIONS_PARQUET_LOCATION: PRODUCTIONS_PARTITION_COLS,
+    SEAT_HISTORY_PARQUET_LOCATION: SEAT_HISTORY_PARTITION_COLS,
+}
+# Keys of the datasets written by Parquet.upsert: the rows of a key replace the ones
+# of the same key written before
+PARQUET_UPSERT_KEYS = {
+    CASTS_PARQUET_LOCATION: ["performance_id", "role", "name"],
+}
+# Datasets compacted by the compact task, in their hive layouts, and the keyed datasets
+# whose fragments it merges
+PARQUET_COMPACTION_LOCATIONS = [
+    EVENTS_PARQUET_LOCATION,
+    PRODUCTIONS_PARQUET_LOCATION,
+    SEAT_HISTORY_PARQUET_LOCATION,
+    CASTS_PARQUET_LOCATION,
+]
 
 PARQUET_TABLE_RELATIONS = {
     EVENTS_PARQUET_LOCATION: f"{PROJECT}.clean.v_roh_events",
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+
+def compact_dtypes(df, policy=None):
+    """
+    Apply a compact dtype policy to a frame:
+    - the policy "category" columns (low-cardinality strings) become categoricals
+    - the policy "boolean" columns holding True/False/None become nullable booleans
+    - the integer columns are downcast to the smallest type holding their values,
+        and the float columns to float32 where no value changes
+    The columns of the policy missing from the frame are ignored.
+    Args:
+    - df (pd.DataFrame): The frame to compact
+    - policy (dict): {"category": [columns], "boolean": [columns]}, e.g. from COMPACT_DTYPES
+    """
+    if policy is None or not isinstance(df, pd.DataFrame) or df.empty:
+        return df
+    compact = {}
+    for col in policy.get("category", []):
+        if col in df and df[col].dtype == object:
+            compact[col] = df[col].astype("category")
+    for col in policy.get("boolean", []):
+        if col in df and df[col].dtype == object:
+            compact[col] = df[col].astype("boolean")
+    for col in df.columns:
+        if col in compact:
+            continue
+        series = df[col]
+        if pd.api.types.is_bool_dtype(series) or not isinstance(series.dtype, np.dtype):
+            continue
+        if np.issubdtype(series.dtype, np.signedinteger):
+            int_dtype = _smallest_int_dtype(series.to_numpy())
+            if int_dtype != series.dtype:
+                compact[col] = series.astype(int_dtype)
+        elif series.dtype == np.float64 and _is_float32_exact(series):
+            compact[col] = series.astype("float32")
+    if not compact:
+        return df
+    return df.assign(**compact)
+
+
+def _smallest_int_dtype(values):
+    low, high = values.min(), values.max()
+    for int_dtype in [np.int8, np.int16, np.int32]:
+        info = np.iinfo(int_dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(int_dtype)
+    return values.dtype
+
+
+def _is_float32_exact(series):
+    values = series.to_numpy()
+    with np.errstate(over="ignore"):
+        same = values.astype("float32").astype("float64") == values
+    return bool((same | np.isnan(values)).all())
+
+
+def categories_as_objects(df):
+    """
+    The categorical columns of df back as plain objects, e.g. for plotly express, which
+    groups on its colour column with the pandas default of keeping the unused categories
+    """
+    categoricals = df.select_dtypes("category").columns
+    return df.astype({col: object for col in categoricals})
+
+
+def frame_memory(df):
+    """
+    Deep memory usage of a frame in MiB
+    """
+    return df.memory_usage(deep=True).sum() / 2**20
@@ -0,0 +1,191 @@
+import time
+import asyncio
+import threading
+import pandas as pd
+
+from cloud.utils import log
+from tools import ASYNC_HTTP_CLIENT, METRICS
+from python_roh.src.config import (
+    ZONE_MAPPING,
+    ZONE_HIERARCHY,
+    PRICE_BASE_URL,
+    ZONE_ID_BASE_URL,
+    EVENT_AVAILABILITY_TTL,
+    EVENT_AVAILABILITY_BATCH_SIZE,
+)
+from python_roh.src.src import expand_dict_column
+
+# Columns of the availability summary of each performance, indexed by performanceId
+EVENT_AVAILABILITY_COLUMNS = ["seats_left", "cheapest_price"]
+
+
+def zone_availability_df(input_json):
+    """
+    PerformanceId, ZoneNameGeneral and AvailableCount of each zone of a batched
+    ZoneAvailabilities payload, for the zones of the hall only
+    """
+    availabilities_df = pd.DataFrame(input_json)
+    if availabilities_df.empty:
+        columns = ["PerformanceId", "ZoneId", "ZoneNameGeneral", "AvailableCount"]
+        return pd.DataFrame(columns=columns)
+    zones_df = expand_dict_column(availabilities_df.Zone)
+    zone_names = zones_df.AliasDescription
+    zones_df = pd.DataFrame(
+        {
+            "PerformanceId": availabilities_df.PerformanceId.astype("int64"),
+            "ZoneId": zones_df.Id.astype("int64"),
+            "ZoneNameGeneral": zone_names.map(ZONE_MAPPING).fillna(zone_names),
+            "AvailableCount": availabilities_df.AvailableCount.fillna(0).astype(int),
+        }
+    )
+    return zones_df[zones_df.ZoneNameGeneral.isin(ZONE_HIERARCHY.keys())]
+
+
+def summarise_availability(zones_df, prices_json):
+    """
+    Seats left and cheapest price with seats left of each performance.
+    Args:
+    - zones_df (pd.DataFrame): The zone_availability_df of the performances
+    - prices_json (list): The batched Prices payload of the same performances
+    Returns:
+    - pd.DataFrame: seats_left and cheapest_price (NaN when sold out), by performanceId
+    """
+    prices_df = pd.DataFrame(prices_json)
+    if prices_df.empty:
+        prices_df = pd.DataFrame(columns=["PerformanceId", "ZoneId", "Price"])
+    else:
+        prices_df = prices_df.loc[
+            prices_df.Enabled, ["PerformanceId", "ZoneId", "Price"]
+        ]
+    zone_prices_df = zones_df[zones_df.AvailableCount > 0].merge(
+        prices_df.astype({"PerformanceId": "int64", "ZoneId": "int64"}),
+        on=["PerformanceId", "ZoneId"],
+    )
+    summary_df = pd.DataFrame(
+        {
+            "seats_left": zones_df.groupby("PerformanceId").AvailableCount.sum(),
+            "cheapest_price": zone_prices_df.groupby("PerformanceId").Price.min(),
+        }
+    )
+    summary_df.index = summary_df.index.astype(str).rename("performanceId")
+    return summary_df.assign(seats_left=summary_df.seats_left.fillna(0).astype(int))
+
+
+class EventAvailabilityCache:
+    """
+    Availability summary of each performance, kept for ttl seconds.
+    Only the performances missing from the cache, or expired, are queried:
+    the ZoneAvailabilities and the Prices of batch_size performances at a time.
+
+    Examples:
+    - EVENT_AVAILABILITY.get(query_dict, ["12345", "12346"]) -> seats_left, cheapest_price
+    """
+
+    def __init__(
+        self, ttl=EVENT_AVAILABILITY_TTL, batch_size=EVENT_AVAILABILITY_BATCH_SIZE
+    ):
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.entries = {}  # performanceId -> (fetched_at, summary row)
+        self._lock = threading.Lock()
+
+    def get(self, query_dict, performance_ids):
+        """
+        Args:
+        - query_dict (dict): The query dict of get_query_dict, for the constituent,
+            mode of sale and source of the queries
+        - performance_ids (list): The performances to summarise
+        """
+        performance_ids = list(dict.fromkeys(str(x) for x in performance_ids))
+        now = time.monotonic()
+        with self._lock:
+            stale_ids = [
+                x
+                for x in performance_ids
+                if x not in self.entries or now - self.entries[x][0] > self.ttl
+            ]
+        if stale_ids:
+            log(f"Querying the availability of {len(stale_ids)} performances")
+            summary_df, queried_ids = ASYNC_HTTP_CLIENT.run(
+                self.aquery(query_dict, stale_ids)
+            )
+            with self._lock:
+                for performance_id in queried_ids:
+                    row = None
+                    if performance_id in summary_df.index:
+                        row = tuple(summary_df.loc[performance_id])
+                    self.entries[performance_id] = (now, row)
+        with self._lock:
+            rows = {x: self.entries.get(x, (None, None))[1] for x in performance_ids}
+        rows = {k: v for k, v in rows.items() if v is not None}
+        output = pd.DataFrame.from_dict(
+            rows, orient="index", columns=EVENT_AVAILABILITY_COLUMNS
+        )
+        return output.astype({"seats_left": int}).rename_axis("performanceId")
+
+    async def aquery(self, query_dict, performance_ids):
+        """
+        Summary of the performances, and the performances whose batch was queried
+        (the ones of the failed batches are queried again on the next get)
+        """
+        batches = [
+            performance_ids[i : i + self.batch_size]
+            for i in range(0, len(performance_ids), self.batch_size)
+        ]
+        results = await asyncio.gather(
+            *[self._aquery_batch(query_dict, batch) for batch in batches],
+            return_exceptions=True,
+        )
+        summaries, queried_ids = [], []
+        for batch, result in zip(batches, results):
+            if isinstance(result, Exception):
+                log(f"An error occurred while querying the availability: {result!r}")
+                continue
+            summaries.append(result)
+            queried_ids.extend(batch)
+        if not summaries:
+            return pd.DataFrame(columns=EVENT_AVAILABILITY_COLUMNS), queried_ids
+        return pd.concat(summaries), queried_ids
+
+    async def _aquery_batch(self, query_dict, performance_ids):
+        performance_ids = ",".join(performance_ids)
+        zone_params = {
+            **query_dict["zone_ids"]["params"],
+            "performanceIds": performance_ids,
+        }
+        price_params = {
+            **query_dict["prices"]["params"],
+            "performanceIds": performance_ids,
+        }
+        with METRICS.label("event_availability"):
+            zones_json, prices_json = await asyncio.gather(
+                ASYNC_HTTP_CLIENT.get_json(ZONE_ID_BASE_URL, params=zone_params),
+                ASYNC_HTTP_CLIENT.get_json(PRICE_BASE_URL, params=price_params),
+            )
+        with METRICS.timer("pre_process", "event_availability"):
+            return summarise_availability(zone_availability_df(zones_json), prices_json)
+
+    def clear(self):
+        with self._lock:
+            self.entries = {}
+
+
+def upcoming_performance_ids(events_df):
+    """
+    The performances of the Main Stage that are not over yet
+    """
+    now = pd.Timestamp.now(tz="Europe/London")
+    events_df = events_df.query("location == 'Main Stage' & timestamp >= @now")
+    performance_ids = pd.to_numeric(events_df.performanceId, errors="coerce")
+    return performance_ids.dropna().astype("int64").astype(str).unique().tolist()
+
+
+def query_events_availability(query_dict, events_df):
+    """
+    Availability summary of the upcoming Main Stage performances of events_df
+    """
+    return EVENT_AVAILABILITY.get(query_dict, upcoming_performance_ids(events_df))
+
+
+# Initialised process-wide availability cache
+EVENT_AVAILABILITY = EventAvailabilityCache()
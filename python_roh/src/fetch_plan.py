@@ -0,0 +1,63 @@
+from python_roh.src.config import SEATS_OUTPUTS, SEATS_DEFAULT_OUTPUTS
+from python_roh.src.utils import force_list
+
+
+class FetchPlan:
+    """
+    The API data types and the stages of the seats task that some outputs need:
+    - seats: the post-processed seats frame (Seats, Prices and ZoneAvailabilities)
+    - hall: the hall figure, plotted from the seats frame
+    - zones: the ZoneAvailabilities frame
+    - prices: the Prices frame
+    - price_types: the PriceTypes frame
+    Only the data types of the plan are queried, the seats are only post-processed
+    if the seats frame is needed, and the hall only plotted if the figure is.
+
+    Examples:
+    - FetchPlan(["zones"]).data_types -> ["zone_ids"]
+    - FetchPlan(["hall"]).data_types -> ["seats", "prices", "zone_ids"]
+    - FetchPlan().outputs -> ["seats", "hall", "zones", "prices"]
+    """
+
+    def __init__(self, outputs=None):
+        if outputs is None:
+            outputs = SEATS_DEFAULT_OUTPUTS
+        if isinstance(outputs, str):
+            outputs = outputs.split(",")  # e.g. from the query string of a request
+        outputs = list(force_list(outputs))
+        unknown = [x for x in outputs if x not in SEATS_OUTPUTS]
+        if unknown:
+            raise ValueError(
+                f"Unknown outputs {unknown}, expected some of {list(SEATS_OUTPUTS)}"
+            )
+        self.outputs = []
+        for output in outputs:
+            self._add_output(output)
+        self.data_types = list(
+            dict.fromkeys(
+                data_type
+                for output in self.outputs
+                for data_type in SEATS_OUTPUTS[output]["data_types"]
+            )
+        )
+
+    def _add_output(self, output):
+        if output in self.outputs:
+            return
+        for needed in SEATS_OUTPUTS[output]["needs"]:
+            self._add_output(needed)
+        self.outputs.append(output)
+
+    @property
+    def post_process(self):
+        return "seats" in self.outputs
+
+    @property
+    def plot(self):
+        return "hall" in self.outputs
+
+    def needs(self, output):
+        return output in self.outputs
+
+    def __repr__(self):
+        return f"FetchPlan(outputs={self.outputs}, data_types={self.data_types})"
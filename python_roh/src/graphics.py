@@ -6,10 +6,21 @@ from tools import Firestore
 from cloud.utils import log
 from python_roh.src.config import *
 from python_roh.src.utils import JSON, purge_image_cache
+from python_roh.src.dtypes import categories_as_objects
 
 if "TEXT_DF" not in globals():
     TEXT_DF = pd.DataFrame()
 
+# Hover data of each seat of the hall plot
+HALL_CUSTOM_DATA = [
+    "Price_print",
+    "ZoneName",
+    "SeatRow",
+    "SeatNumber",
+    "SeatStatusStr",
+    "SeatsViewUrl",
+]
+
 
 class Graphics:
     def __init__(self, plot_type, **kwargs):
@@ -43,11 +54,7 @@ def process_hall_plot_df(seats_price_df, prices_df):
     plot_df = seats_price_df.copy()
     plot_df.Price = plot_df.Price.where(plot_df.seat_available, None)
     plot_df["Size"] = 1  # Dummy constant size for scatter plot
-    plot_df["Price_print"] = plot_df["Price"]
-    plot_df["Price_print"] = plot_df["Price_print"].apply(
-        lambda x: f"£{x}".split(".")[0]
-    )
-    plot_df.loc[plot_df["Price"].isnull(), "Price_print"] = "Not available"
+    plot_df["Price_print"] = price_band_labels(plot_df.Price, plot_df.seat_available)
     plot_df = plot_df.assign(symbol="circle-open")
     plot_df.loc[plot_df["Price"].isnull(), "symbol"] = "circle"
     plot_df.Price = plot_df.Price.fillna("Not available").astype(str)
@@ -56,6 +63,31 @@ def process_hall_plot_df(seats_price_df, prices_df):
     return plot_df, price_color_dict
 
 
+def price_band_labels(prices, available):
+    """
+    Price band of each seat in the hall plot, e.g. "£95" or "Not available"
+    """
+    labels = ("£" + prices.astype(str)).str.split(".").str[0]
+    return labels.where(available & prices.notnull(), "Not available")
+
+
+def hall_band_points(seats_price_df, prices_df, bands):
+    """
+    x, y and customdata of the points of the given price bands of the hall plot,
+    in the order of the points of their traces
+    """
+    plot_df, _ = process_hall_plot_df(seats_price_df, prices_df)
+    output = {}
+    for band in bands:
+        band_df = plot_df[plot_df.Price_print == band]
+        output[band] = {
+            "x": band_df.x.tolist(),
+            "y": band_df.y.tolist(),
+            "customdata": band_df[HALL_CUSTOM_DATA].values.tolist(),
+        }
+    return output
+
+
 def process_text_df():
     global TEXT_DF
     if TEXT_DF.empty:
@@ -100,14 +132,7 @@ def plot_hall(
         plot_df,
         x="x",
         y="y",
-        custom_data=[
-            "Price_print",
-            "ZoneName",
-            "SeatRow",
-            "SeatNumber",
-            "SeatStatusStr",
-            "SeatsViewUrl",
-        ],
+        custom_data=HALL_CUSTOM_DATA,
         template="simple_white",
         color="Price_print",
         color_discrete_map=price_color_dict,
@@ -270,8 +295,47 @@ def persist_colours(plot_df, all_colours):
     return upcoming_titles_colour
 
 
+def availability_labels(availability_df):
+    """
+    Availability of each performance in the events timeline hover,
+    e.g. "123 seats left from £15" or "Sold out"
+    """
+    seats_left, cheapest = availability_df.seats_left, availability_df.cheapest_price
+    labels = seats_left.astype(str) + " seats left"
+    labels = labels.mask(seats_left == 1, "1 seat left")
+    prices = ("£" + cheapest.astype(str)).str.split(".").str[0]
+    labels = labels + (" from " + prices).where(cheapest.notnull(), "")
+    return labels.where(seats_left > 0, "Sold out")
+
+
+def availability_opacity(availability_df):
+    """
+    Opacity of the bar of each performance: faded when sold out,
+    fully shaded from EVENT_AVAILABILITY_SHADE_SEATS seats left
+    """
+    seats_left = availability_df.seats_left.clip(upper=EVENT_AVAILABILITY_SHADE_SEATS)
+    return 0.3 + 0.7 * seats_left / EVENT_AVAILABILITY_SHADE_SEATS
+
+
+def add_events_availability(plot_df, availability_df):
+    """
+    Add the availability hover line and the bar opacity of each performance to plot_df.
+    The performances without a summary (e.g. past ones) get no line and a full bar.
+    """
+    performance_ids = pd.to_numeric(plot_df.performanceId, errors="coerce")
+    performance_ids = performance_ids.astype("Int64").astype(str)
+    labels = "<br>" + availability_labels(availability_df)
+    return plot_df.assign(
+        availability=performance_ids.map(labels).fillna(""),
+        bar_opacity=performance_ids.map(availability_opacity(availability_df)).fillna(
+            1
+        ),
+    )
+
+
 def plot_events(
     events_df,
+    availability_df=None,
     colours=["Plotly", "Dark2", "G10"],
     filter_recent=True,
     no_plot=False,
@@ -284,7 +348,9 @@ def plot_events(
     **kwargs,
 ):
     """
-    Plot the timeline of the upcoming events on the Main Stage
+    Plot the timeline of the upcoming events on the Main Stage.
+    With availability_df (seats_left and cheapest_price by performanceId), the hover shows
+    the availability of each performance and the bars are shaded by their seats left.
     """
     # All used columns: title, timestamp, location, url, performanceId, time
     plot_width, plot_height = (1200, 650) if not autosize else (None, None)
@@ -299,11 +365,16 @@ def plot_events(
     else:
         sub_query = "location == 'Main Stage'"
     plot_df = events_df.query(sub_query).reset_index(drop=True)
+    plot_df = categories_as_objects(plot_df)
     # Start time: 1:00, End time: 23:00 of the event date
     plot_df["timestamp_start"] = plot_df.timestamp.dt.floor("D") + pd.Timedelta(hours=1)
     plot_df["timestamp_end"] = plot_df.timestamp.dt.ceil("D") - pd.Timedelta(hours=1)
 
     plot_df["date_str"] = plot_df.timestamp.dt.strftime("%A, %b %-d, %Y")
+    custom_data = ["title", "url", "date_str", "performanceId"]
+    if availability_df is not None:
+        plot_df = add_events_availability(plot_df, availability_df)
+        custom_data += ["availability", "bar_opacity"]
 
     colour_list = []
     for colour in colours:
@@ -318,7 +389,7 @@ def plot_events(
         x_start="timestamp_start",
         x_end="timestamp_end",
         y="time",
-        custom_data=["title", "url", "date_str", "performanceId"],
+        custom_data=custom_data,
         color="title",
         title="Royal Opera House Events",
         template="simple_white",
@@ -381,13 +452,15 @@ def plot_events(
     )
     fig.layout.font.family = font_family
     fig.layout.font.size = 15
+    # The availability line starts with its own <br>, and is empty when unknown
+    availability_line = "%{customdata[4]}" if availability_df is not None else ""
     fig.update_traces(
         hovertemplate="<br>".join(
             [
                 "%{customdata[0]}",
                 "%{customdata[2]}",
                 "%{y}",
-                "ID: %{customdata[3]}",
+                "ID: %{customdata[3]}" + availability_line,
             ],
         )
         + "<extra></extra>",
@@ -395,12 +468,15 @@ def plot_events(
     for trace in fig.data:
         trace.marker.line.color = trace.marker.color
         trace.marker.line.width = 0.2
+        if availability_df is not None:
+            trace.marker.opacity = [x[5] for x in trace.customdata]
 
     image_location = EVENTS_IMAGE_LOCATION
 
     if save_both:
         plot_events(
             events_df,
+            availability_df=availability_df,
             colours=colours,
             filter_recent=filter_recent,
             no_plot=no_plot,
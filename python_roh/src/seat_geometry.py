@@ -0,0 +1,188 @@
+import os
+import io
+import numpy as np
+
+from cloud.utils import log
+from cloud.platform import PLATFORM
+from python_roh.src.config import (
+    PREFIX,
+    ZONE_HIERARCHY,
+    VIEW_FROM_SEAT_URL,
+    SEAT_GEOMETRY_LOCATION,
+    SEAT_GEOMETRY_CACHE_DIR,
+)
+
+# Zone code of each row of the geometry: the index of its ZoneNameGeneral in this list
+SEAT_GEOMETRY_ZONES = list(ZONE_HIERARCHY.keys())
+SEAT_GEOMETRY_FIELDS = ("seat_id", "x", "y", "zone", "seat_name", "view_url")
+
+
+def seat_view_urls(seats_df):
+    """
+    View-from-seat url of each seat, e.g. ".../seat-12-A-3.jpg"
+    """
+    seat_slug = (
+        seats_df.SeatNumber.astype(str)
+        + "-"
+        + seats_df.SeatRow.astype(str)
+        + "-"
+        + seats_df.ScreenId.astype(str)
+    )
+    return f"{VIEW_FROM_SEAT_URL}/seat-" + seat_slug.str.replace(" ", "_") + ".jpg"
+
+
+class SeatGeometry:
+    """
+    Array-backed index of the seat map positions, compiled once by load_positions.py.
+    One row per seat of the hall, sorted by SeatId (-1 when the seat has no SeatId),
+    holding the float32 x/y, the zone code, the seat name and the view-from-seat url.
+    It is stored as a versioned .npy file, which is memory-mapped when loaded.
+
+    Examples:
+    - SeatGeometry.compile(seat_map).write() -> Write the geometry to SEAT_GEOMETRY_LOCATION
+    - SeatGeometry.load().gather(seats_price_df) -> Add x, y and SeatsViewUrl to the seats
+    """
+
+    def __init__(self, array):
+        self.array = array
+        self.seat_ids = array["seat_id"]
+        self._name_index = None
+
+    def __len__(self):
+        return len(self.array)
+
+    @classmethod
+    def compile(cls, seat_map):
+        """
+        Compile the geometry from a seat map frame.
+        Args:
+        - seat_map (pd.DataFrame): SeatId (nullable), SeatName, ZoneName, x, y
+            and SeatsViewUrl (nullable) of every seat of the seat map
+        """
+        zone_codes = seat_map.ZoneName.map(
+            {zone: i for i, zone in enumerate(SEAT_GEOMETRY_ZONES)}
+        )
+        seat_map = seat_map.assign(
+            SeatId=seat_map.SeatId.fillna(-1).astype("int64"),
+            zone=zone_codes.fillna(-1).astype("int8"),
+            SeatsViewUrl=seat_map.SeatsViewUrl.fillna("").astype(str),
+            SeatName=seat_map.SeatName.astype(str),
+        )
+        seat_map = seat_map.sort_values(by="SeatId", kind="stable")
+        name_width = max(1, seat_map.SeatName.str.len().max())
+        url_width = max(1, seat_map.SeatsViewUrl.str.len().max())
+        dtype = np.dtype(
+            [
+                ("seat_id", "<i8"),
+                ("x", "<f4"),
+                ("y", "<f4"),
+                ("zone", "i1"),
+                ("seat_name", f"<U{name_width}"),
+                ("view_url", f"<U{url_width}"),
+            ]
+        )
+        array = np.empty(len(seat_map), dtype=dtype)
+        array["seat_id"] = seat_map.SeatId.to_numpy()
+        array["x"] = seat_map.x.to_numpy(dtype="float32")
+        array["y"] = seat_map.y.to_numpy(dtype="float32")
+        array["zone"] = seat_map.zone.to_numpy()
+        array["seat_name"] = seat_map.SeatName.to_numpy()
+        array["view_url"] = seat_map.SeatsViewUrl.to_numpy()
+        return cls(array)
+
+    def write(self, path=SEAT_GEOMETRY_LOCATION):
+        """
+        Write the geometry as a .npy file to the platform
+        """
+        log(f"Writing the seat geometry to {path}")
+        buffer = io.BytesIO()
+        np.save(buffer, self.array, allow_pickle=False)
+        PLATFORM.makedirs(os.path.dirname(path), exist_ok=True)
+        with PLATFORM.open(path, "wb") as f:
+            f.write(buffer.getvalue())
+        return path
+
+    @classmethod
+    def load(cls, path=SEAT_GEOMETRY_LOCATION):
+        """
+        Memory-map the geometry. The copy of the file baked into the image is used first,
+        then a local copy of the one on the platform, downloaded once per container.
+        Raises FileNotFoundError if there is none, and ValueError if it is of another version.
+        """
+        local_path = cls._local_path(path)
+        log(f"Loading the seat geometry from {local_path}")
+        array = np.load(local_path, mmap_mode="r", allow_pickle=False)
+        if array.dtype.names != SEAT_GEOMETRY_FIELDS:
+            raise ValueError(f"{local_path} has fields {array.dtype.names}")
+        return cls(array)
+
+    @staticmethod
+    def _local_path(path):
+        local_path = path.replace(PREFIX, "") if PREFIX else path
+        if os.path.exists(local_path) or PLATFORM.name == "Local":
+            return local_path
+        cache_path = os.path.join(SEAT_GEOMETRY_CACHE_DIR, os.path.basename(path))
+        if not os.path.exists(cache_path):
+            os.makedirs(SEAT_GEOMETRY_CACHE_DIR, exist_ok=True)
+            PLATFORM.download(path, cache_path)
+        return cache_path
+
+    def rows(self, seat_ids, seat_names=None, zone_names=None):
+        """
+        Row of the geometry of each seat, or -1 if the seat has no position.
+        Seats looked up by SeatId; the ones missing from the index (e.g. added after the
+        geometry was compiled) fall back to their (SeatName, ZoneNameGeneral).
+        """
+        seat_ids = np.asarray(seat_ids, dtype="int64")
+        if len(self) == 0:
+            return np.full(len(seat_ids), -1)
+        rows = np.searchsorted(self.seat_ids, seat_ids)
+        rows = np.minimum(rows, len(self) - 1)
+        rows = np.where(self.seat_ids[rows] == seat_ids, rows, -1)
+        missing = np.flatnonzero(rows < 0)
+        if missing.size and seat_names is not None and zone_names is not None:
+            name_index = self._get_name_index()
+            seat_names = np.asarray(seat_names, dtype=object)[missing]
+            zone_names = np.asarray(zone_names, dtype=object)[missing]
+            rows[missing] = [
+                name_index.get((str(name), zone), -1)
+                for name, zone in zip(seat_names, zone_names)
+            ]
+        return rows
+
+    def _get_name_index(self):
+        """
+        (SeatName, ZoneNameGeneral) -> row, built on the first seat missing from the index
+        """
+        if self._name_index is None:
+            zones = [
+                SEAT_GEOMETRY_ZONES[x] if x >= 0 else None for x in self.array["zone"]
+            ]
+            self._name_index = {
+                (str(name), zone): i
+                for i, (name, zone) in enumerate(zip(self.array["seat_name"], zones))
+            }
+        return self._name_index
+
+    def gather(self, df):
+        """
+        Add the x, y and SeatsViewUrl of the seats of df, dropping the seats with no
+        position (e.g. aisles). df needs SeatId, SeatName and ZoneNameGeneral.
+        """
+        rows = self.rows(df.SeatId, df.SeatName, df.ZoneNameGeneral)
+        has_position = rows >= 0
+        rows = rows[has_position]
+        df = df.loc[has_position].drop(
+            columns=["x", "y", "SeatsViewUrl"], errors="ignore"
+        )
+        view_urls = self.array["view_url"][rows].astype(object)
+        df = df.assign(
+            x=self.array["x"][rows],
+            y=self.array["y"][rows],
+            SeatsViewUrl=view_urls,
+        )
+        no_url = view_urls == ""
+        if no_url.any():
+            df.loc[no_url, "SeatsViewUrl"] = seat_view_urls(df.loc[no_url])
+        df.reset_index(drop=True, inplace=True)
+        return df
@@ -0,0 +1,310 @@
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+
+from python_roh.src.config import SEAT_SNAPSHOTS_MAX_ENTRIES
+from python_roh.src.seat_geometry import SEAT_GEOMETRY_ZONES
+
+_ZONE_CODES = {zone: i for i, zone in enumerate(SEAT_GEOMETRY_ZONES)}
+
+
+class SeatSnapshot:
+    """
+    Compact state of the seats of one performance, sorted by SeatId:
+    the status id, the index of the price in prices (-1 for no price),
+    the availability flag and the zone code of each seat
+    """
+
+    def __init__(self, seat_ids, status_ids, price_index, prices, available, zones):
+        self.seat_ids = seat_ids
+        self.status_ids = status_ids
+        self.price_index = price_index
+        self.prices = prices
+        self.available = available
+        self.zones = zones
+        self.fingerprint = self.get_fingerprint()
+
+    @classmethod
+    def from_frame(cls, seats_price_df):
+        """
+        Args:
+        - seats_price_df (pd.DataFrame): The post-processed seats of one performance
+        """
+        seats_df = seats_price_df.drop_duplicates(subset="SeatId")
+        order = np.argsort(seats_df.SeatId.to_numpy(dtype="int64"), kind="stable")
+        seats_df = seats_df.iloc[order]
+        seat_prices = seats_df.Price.to_numpy(dtype="float64")
+        prices = np.unique(seat_prices[~np.isnan(seat_prices)])
+        price_index = np.searchsorted(prices, seat_prices).astype("int16")
+        price_index[np.isnan(seat_prices)] = -1
+        zones = seats_df.ZoneNameGeneral.astype(object).map(_ZONE_CODES).fillna(-1)
+        return cls(
+            seat_ids=seats_df.SeatId.to_numpy(dtype="int64"),
+            status_ids=seats_df.SeatStatusId.to_numpy(dtype="int32"),
+            price_index=price_index,
+            prices=prices,
+            available=seats_df.seat_available.to_numpy(dtype=bool),
+            zones=zones.to_numpy(dtype="int8"),
+        )
+
+    def to_frame(self):
+        """
+        The snapshot as a frame of the columns it is built from
+        """
+        return pd.DataFrame(
+            {
+                "SeatId": self.seat_ids,
+                "ZoneNameGeneral": _zone_names(self.zones),
+                "SeatStatusId": self.status_ids,
+                "Price": self.seat_prices,
+                "seat_available": self.available,
+            }
+        )
+
+    def get_fingerprint(self):
+        hasher = hashlib.sha1()
+        for array in [self.seat_ids, self.status_ids, self.seat_prices, self.available]:
+            hasher.update(np.ascontiguousarray(array).tobytes())
+        return hasher.hexdigest()
+
+    @property
+    def seat_prices(self):
+        prices = np.append(self.prices, np.nan)  # price_index -1 -> NaN
+        return prices[self.price_index]
+
+
+class SeatDelta:
+    """
+    The seats of a performance that changed between two snapshots.
+
+    Attributes:
+    - changes (pd.DataFrame): SeatId, ZoneNameGeneral, SeatStatusId, Price, seat_available
+        and their Previous* / was_available values, one row per changed, added or removed seat
+    - zone_counts (pd.DataFrame): changed, became_available and became_unavailable per zone
+    - price_counts (pd.DataFrame): The same per price band, by the current price of the seat
+        (its previous price if it was removed)
+    - fingerprint / previous_fingerprint: Of the current and of the previous snapshot,
+        previous_fingerprint is None on the first snapshot of the performance
+    """
+
+    def __init__(self, performance_id, changes, fingerprint, previous_fingerprint):
+        self.performance_id = performance_id
+        self.changes = changes
+        self.fingerprint = fingerprint
+        self.previous_fingerprint = previous_fingerprint
+        self.zone_counts = _change_counts(changes, "ZoneNameGeneral")
+        self.price_counts = _change_counts(
+            changes.assign(Price=changes.Price.fillna(changes.PreviousPrice)), "Price"
+        )
+
+    @property
+    def empty(self):
+        return self.changes.empty
+
+    def is_since(self, fingerprint):
+        """
+        Whether this delta is relative to the snapshot with the given fingerprint
+        """
+        return fingerprint is not None and self.previous_fingerprint == fingerprint
+
+    @classmethod
+    def between(cls, performance_id, previous, current):
+        """
+        Delta of the current snapshot against the previous one (None on the first fetch)
+        """
+        if previous is None:
+            changes = _snapshot_rows(current, None, np.arange(len(current.seat_ids)))
+            return cls(performance_id, changes, current.fingerprint, None)
+        if previous.fingerprint == current.fingerprint:
+            changes = _snapshot_rows(current, None, np.array([], dtype="int64"))
+            return cls(
+                performance_id, changes, current.fingerprint, previous.fingerprint
+            )
+        # Position of each current seat in the previous snapshot
+        n_previous = len(previous.seat_ids)
+        positions = np.searchsorted(previous.seat_ids, current.seat_ids)
+        positions = np.minimum(positions, max(n_previous - 1, 0))
+        found = np.zeros(len(current.seat_ids), dtype=bool)
+        if n_previous:
+            found = previous.seat_ids[positions] == current.seat_ids
+        current_prices, previous_prices = current.seat_prices, previous.seat_prices
+        changed = ~found
+        if n_previous:
+            changed |= previous.status_ids[positions] != current.status_ids
+            changed |= previous.available[positions] != current.available
+            changed |= ~_equal_or_both_nan(previous_prices[positions], current_prices)
+        changed_rows = np.flatnonzero(changed)
+        changes = _snapshot_rows(
+            current, previous, changed_rows, np.where(found, positions, -1)
+        )
+        removed = ~np.isin(previous.seat_ids, current.seat_ids)
+        if removed.any():
+            changes = pd.concat(
+                [changes, _removed_rows(previous, np.flatnonzero(removed))],
+                ignore_index=True,
+            )
+        return cls(performance_id, changes, current.fingerprint, previous.fingerprint)
+
+
+class SeatSnapshotStore:
+    """
+    Last SeatSnapshot of each performance, to give the SeatDelta of each new fetch.
+    The least recently updated performances are evicted past max_entries.
+
+    Examples:
+    - SEAT_SNAPSHOTS.update(performance_id, seats_price_df) -> SeatDelta since the last fetch
+    - SEAT_SNAPSHOTS.get(performance_id) -> Last SeatSnapshot, or None
+    """
+
+    def __init__(self, max_entries=SEAT_SNAPSHOTS_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.snapshots = {}
+        self._lock = threading.Lock()
+
+    def get(self, performance_id):
+        with self._lock:
+            return self.snapshots.get(str(performance_id))
+
+    def update(self, performance_id, seats_price_df):
+        current = SeatSnapshot.from_frame(seats_price_df)
+        key = str(performance_id)
+        with self._lock:
+            previous = self.snapshots.pop(key, None)
+            self.snapshots[key] = current
+            while len(self.snapshots) > self.max_entries:
+                self.snapshots.pop(next(iter(self.snapshots)))
+        return SeatDelta.between(performance_id, previous, current)
+
+    def update_many(self, seats_price_df):
+        """
+        Update the snapshots of the performances of a batched frame, keyed by PerformanceId
+        """
+        return {
+            performance_id: self.update(performance_id, seats_df)
+            for performance_id, seats_df in seats_price_df.groupby("PerformanceId")
+        }
+
+    def clear(self):
+        with self._lock:
+            self.snapshots = {}
+
+
+class SeatFrameStore:
+    """
+    Last processed seats and prices frames of each performance, so that the seats can
+    be re-classified for other seat statuses without querying them again.
+    The least recently stored performances are evicted past max_entries.
+
+    Examples:
+    - SEAT_FRAMES.put(performance_id, seats_price_df, prices_df)
+    - SEAT_FRAMES.get(performance_id) -> (seats_price_df, prices_df), or None
+    """
+
+    def __init__(self, max_entries=SEAT_SNAPSHOTS_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.frames = {}
+        self._lock = threading.Lock()
+
+    def get(self, performance_id):
+        with self._lock:
+            return self.frames.get(str(performance_id))
+
+    def put(self, performance_id, seats_price_df, prices_df):
+        key = str(performance_id)
+        with self._lock:
+            self.frames.pop(key, None)
+            self.frames[key] = (seats_price_df, prices_df)
+            while len(self.frames) > self.max_entries:
+                self.frames.pop(next(iter(self.frames)))
+
+    def put_many(self, seats_price_df, prices_df):
+        """
+        Store the frames of each performance of batched frames, keyed by PerformanceId
+        """
+        for performance_id, seats_df in seats_price_df.groupby("PerformanceId"):
+            performance_prices_df = prices_df
+            if "PerformanceId" in prices_df.columns:
+                performance_prices_df = prices_df[
+                    prices_df.PerformanceId == performance_id
+                ]
+            self.put(performance_id, seats_df, performance_prices_df)
+
+    def clear(self):
+        with self._lock:
+            self.frames = {}
+
+
+def _equal_or_both_nan(a, b):
+    return (a == b) | (np.isnan(a) & np.isnan(b))
+
+
+def _zone_names(zone_codes):
+    zone_names = np.array(SEAT_GEOMETRY_ZONES + [None], dtype=object)
+    return zone_names[zone_codes]  # zone code -1 -> None
+
+
+def _snapshot_rows(current, previous, rows, previous_positions=None):
+    """
+    Changes frame of the given rows of the current snapshot
+    """
+    output = pd.DataFrame(
+        {
+            "SeatId": current.seat_ids[rows],
+            "ZoneNameGeneral": _zone_names(current.zones[rows]),
+            "SeatStatusId": current.status_ids[rows].astype("float64"),
+            "Price": current.seat_prices[rows],
+            "seat_available": current.available[rows],
+        }
+    )
+    previous_status = np.full(len(rows), np.nan)
+    previous_price = np.full(len(rows), np.nan)
+    was_available = np.zeros(len(rows), dtype=bool)
+    if previous is not None and len(rows):
+        positions = previous_positions[rows]
+        found = positions >= 0
+        previous_status[found] = previous.status_ids[positions[found]]
+        previous_price[found] = previous.seat_prices[positions[found]]
+        was_available[found] = previous.available[positions[found]]
+    return output.assign(
+        PreviousSeatStatusId=previous_status,
+        PreviousPrice=previous_price,
+        was_available=was_available,
+    )
+
+
+def _removed_rows(previous, rows):
+    """
+    Changes frame of the seats of the previous snapshot missing from the current one
+    """
+    return pd.DataFrame(
+        {
+            "SeatId": previous.seat_ids[rows],
+            "ZoneNameGeneral": _zone_names(previous.zones[rows]),
+            "SeatStatusId": np.nan,
+            "Price": np.nan,
+            "seat_available": False,
+            "PreviousSeatStatusId": previous.status_ids[rows].astype("float64"),
+            "PreviousPrice": previous.seat_prices[rows],
+            "was_available": previous.available[rows],
+        }
+    )
+
+
+def _change_counts(changes, by):
+    """
+    Number of changed seats, and of seats that became (un)available, per value of by
+    """
+    counts = changes.assign(
+        changed=1,
+        became_available=changes.seat_available & ~changes.was_available,
+        became_unavailable=~changes.seat_available & changes.was_available,
+    )
+    columns = ["changed", "became_available", "became_unavailable"]
+    return counts.groupby(by, dropna=False)[columns].sum()
+
+
+# Initialised process-wide snapshot store
+SEAT_SNAPSHOTS = SeatSnapshotStore()
+# Initialised process-wide store of the last processed seats frames
+SEAT_FRAMES = SeatFrameStore()
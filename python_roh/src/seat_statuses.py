@@ -0,0 +1,80 @@
+import json
+import hashlib
+import numpy as np
+
+from python_roh.src.config import AVAILABLE_SEAT_STATUS_IDS
+
+
+class SeatStatusTable:
+    """
+    The seat statuses compiled into arrays indexed by SeatStatusId: the "Id (StatusCode)"
+    label, the StatusCode and the availability flag of each status.
+    SeatStatusIds that are not in the statuses document get a NaN label and code.
+
+    Examples:
+    - SeatStatusTable(seat_statuses).labels_of(seats_df.SeatStatusId) -> ["0 (A)", ...]
+    - SeatStatusTable(seat_statuses).is_available(seats_df.SeatStatusId, [0, 3]) -> [True, ...]
+    """
+
+    def __init__(self, seat_statuses, available_seat_status_ids=None):
+        """
+        Args:
+        - seat_statuses (list): The "seat_statuses" of the statuses document
+        - available_seat_status_ids (list): The statuses flagged as available by default
+        """
+        self.fingerprint = self.get_fingerprint(seat_statuses)
+        ids = np.array([int(x["Id"]) for x in seat_statuses], dtype="int64")
+        size = int(ids.max()) + 1 if ids.size else 0
+        self.codes = np.full(size, np.nan, dtype=object)
+        self.codes[ids] = [x["StatusCode"] for x in seat_statuses]
+        self.labels = np.full(size, np.nan, dtype=object)
+        self.labels[ids] = [f"{x['Id']} ({x['StatusCode']})" for x in seat_statuses]
+        self.available = self.availability_flags(
+            available_seat_status_ids or AVAILABLE_SEAT_STATUS_IDS
+        )
+
+    @staticmethod
+    def get_fingerprint(seat_statuses):
+        """
+        Fingerprint of the statuses document, to know when the table is stale
+        """
+        payload = json.dumps(seat_statuses, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def availability_flags(self, available_seat_status_ids):
+        """
+        Boolean array indexed by SeatStatusId, True for the available statuses
+        """
+        available_ids = np.array(available_seat_status_ids, dtype="int64")
+        available_ids = available_ids[available_ids >= 0]
+        size = max(len(self.labels), int(available_ids.max(initial=-1)) + 1)
+        flags = np.zeros(size, dtype=bool)
+        flags[available_ids] = True
+        return flags
+
+    def labels_of(self, status_ids):
+        return _take(self.labels, status_ids, np.nan)
+
+    def codes_of(self, status_ids):
+        return _take(self.codes, status_ids, np.nan)
+
+    def is_available(self, status_ids, available_seat_status_ids=None):
+        """
+        Availability of each SeatStatusId, by the default statuses of the table
+        or by the given available_seat_status_ids
+        """
+        flags = self.available
+        if available_seat_status_ids is not None:
+            flags = self.availability_flags(available_seat_status_ids)
+        return _take(flags, status_ids, False)
+
+
+def _take(array, status_ids, fill_value):
+    """
+    array[status_ids], with fill_value for the ids outside of the array
+    """
+    status_ids = np.asarray(status_ids, dtype="int64")
+    in_table = (status_ids >= 0) & (status_ids < len(array))
+    output = np.full(len(status_ids), fill_value, dtype=array.dtype)
+    output[in_table] = array[status_ids[in_table]]
+    return output
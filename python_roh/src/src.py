@@ -1,39 +1,60 @@
 import os
 import json
 import time
-import requests
+import asyncio
 import pandas as pd
 import concurrent.futures
 from bs4 import BeautifulSoup
 from urllib.parse import unquote
 
 from python_roh.src.config import (
-    SEAT_MAP_POSITIONS_CSV,
+    SEATS_BASE_URL,
+    SEAT_GEOMETRY_LOCATION,
     AVAILABLE_SEAT_STATUS_IDS,
     PRODUCTIONS_PARQUET_LOCATION,
     ZONE_HIERARCHY,
     ZONE_MAPPING,
     SEAT_STATUSES_PATH,
-    VIEW_FROM_SEAT_URL,
+    HTTP_HEDGE_ENABLED,
+    API_DEADLINES,
+    API_DEFAULT_DEADLINE,
+    API_FALLBACK_DATA_TYPES,
+    API_FALLBACK_MAX_ENTRIES,
+    API_COMPACT_DTYPES,
+    SEATS_COMPACT_DTYPES,
 )
 from cloud.utils import log
-from cloud.platform import PLATFORM
-from tools import Parquet, Firestore
+from tools import Parquet, Firestore, HTTP_CLIENT, ASYNC_HTTP_CLIENT, METRICS
 from python_roh.src.utils import force_list
+from python_roh.src.dtypes import compact_dtypes
+from python_roh.src.seat_geometry import SeatGeometry
+from python_roh.src.seat_statuses import SeatStatusTable
 
+try:
+    import ijson
 
-if "SEAT_MAP_POSITIONS" not in globals():
-    SEAT_MAP_POSITIONS = pd.DataFrame()
+    HAS_IJSON = True
+except ImportError:
+    HAS_IJSON = False
+
+if "SEAT_GEOMETRY" not in globals():
+    SEAT_GEOMETRY = None
 if "SEAT_STATUSES" not in globals():
     SEAT_STATUSES = {}
+if "SEAT_STATUS_TABLE" not in globals():
+    SEAT_STATUS_TABLE = None
+if "LAST_GOOD_DATA" not in globals():
+    LAST_GOOD_DATA = {}
 
 
 def _pre_process_zone_df(input_json):
-    zones_df = pd.DataFrame(input_json)
-    zones_df = zones_df["Zone"]
-    zones_df = zones_df.apply(pd.Series)
+    zone_availabilities_df = pd.DataFrame(input_json)
+    zones_df = expand_dict_column(zone_availabilities_df["Zone"])
+    if "PerformanceId" in zone_availabilities_df:
+        # Keeps the zones of several performances apart in the batched mode
+        zones_df = zones_df.assign(PerformanceId=zone_availabilities_df.PerformanceId)
     zones_df = zones_df.rename(columns={"Id": "ZoneId"})
-    _zone_groups = zones_df.ZoneGroup.apply(pd.Series)
+    _zone_groups = expand_dict_column(zones_df.ZoneGroup)
     zones_df = pd.concat([zones_df, _zone_groups], axis=1)
     zones_df.drop(columns=["ZoneGroup", "Description"], inplace=True)
     zones_df.rename(
@@ -46,13 +67,7 @@ def _pre_process_seats_df(input_json):
     seats_df = pd.DataFrame(input_json)
     seats_df.rename(columns={"Id": "SeatId"}, inplace=True)
     seats_df = seats_df.assign(SeatName=seats_df.SeatRow + seats_df.SeatNumber)
-    seat_slug = seats_df.apply(
-        lambda x: f"{x.SeatNumber}-{x.SeatRow}-{x.ScreenId}", axis=1
-    )
-    seats_view_url = seat_slug.apply(
-        lambda x: f"{VIEW_FROM_SEAT_URL}/seat-{x.replace(' ', '_')}.jpg"
-    )
-    seats_df = seats_df.assign(SeatsViewUrl=seats_view_url)
+    # The SeatsViewUrl is gathered from the SeatGeometry with the positions
     return seats_df
 
 
@@ -69,55 +84,147 @@ def _pre_process_price_types_df(input_json):
     return price_types_df
 
 
-def _pre_process_events_df(input_json):
-    data = input_json
-    events_df = pd.DataFrame(data["data"])
-    included_df = pd.DataFrame(data["included"])
-    events_attrs = events_df.attributes.apply(pd.Series)
-    events_attrs.drop(
-        columns=[
-            "description",
-            "dateFieldOverride",
-            "imageResult",
-            "imageTray",
-            "productionPageUrl",
-            "helpInformation",
-        ],
-        inplace=True,
+def expand_dict_column(series):
+    """
+    Columnar equivalent of series.apply(pd.Series) for a column of dicts:
+    one column per key, in the order the keys are first seen
+    """
+    records = [x if isinstance(x, dict) else {} for x in series.tolist()]
+    return pd.DataFrame.from_records(records, index=series.index)
+
+
+def adhoc_performance_id(df):
+    """
+    "{productionId}-{date}-{time}" of each performance, e.g. "1234-2024-05-01-19:30:00"
+    """
+    return (
+        df.productionId.astype(str)
+        + "-"
+        + df.date.astype(str)
+        + "-"
+        + df.time.astype(str)
     )
-    events_rels = events_df.relationships.apply(pd.Series)
-    events_df = pd.concat([events_df, events_attrs, events_rels], axis=1)
-    events_df.query("isCancelled != True", inplace=True)
-    events_df.drop(
-        columns=[
-            "attributes",
-            "relationships",
-            "isCancelled",
-            "ctaBehaviour",
-            "cinemaBroadcastLink",
-        ],
-        inplace=True,
+
+
+# Large attributes of the events that are never used downstream
+_EVENTS_DROPPED_ATTRIBUTES = {
+    "description",
+    "dateFieldOverride",
+    "imageResult",
+    "imageTray",
+    "productionPageUrl",
+    "helpInformation",
+}
+_EVENTS_DROPPED_COLUMNS = ["isCancelled", "ctaBehaviour", "cinemaBroadcastLink"]
+
+
+def _split_event(event):
+    """
+    Split an event into its (top-level, attributes, relationships) dicts,
+    or return None if it is cancelled or has no listed performances
+    """
+    attrs = event.get("attributes", {})
+    attrs = {k: v for k, v in attrs.items() if k not in _EVENTS_DROPPED_ATTRIBUTES}
+    if attrs.get("isCancelled") is True or attrs.get("performances") == []:
+        return None
+    top = {k: v for k, v in event.items() if k not in ["attributes", "relationships"]}
+    return top, attrs, event.get("relationships", {})
+
+
+def _build_events_df(split_events):
+    """
+    Build the events_df column-wise from the split events
+    """
+    tops, attrs, rels = zip(*split_events) if split_events else ([], [], [])
+    events_df = pd.concat(
+        [pd.DataFrame(list(tops)), pd.DataFrame(list(attrs)), pd.DataFrame(list(rels))],
+        axis=1,
     )
-    # remove events with no listed performances
-    events_df.query("performances not in [[]]", inplace=True)
-    events_df.reset_index(drop=True, inplace=True)
+    events_df.drop(columns=_EVENTS_DROPPED_COLUMNS, errors="ignore", inplace=True)
     events_df = events_df.explode("performances", ignore_index=True)
-    events_df.locations = events_df.locations.apply(lambda x: x["data"])
+    events_df.locations = events_df.locations.str.get("data")
     events_df = events_df.explode("locations", ignore_index=True)
-    events_df.locations = events_df.locations.apply(lambda x: x["id"])
+    events_df.locations = events_df.locations.str.get("id")
     events_df.rename(
         columns={"locations": "locationId", "id": "productionId"}, inplace=True
     )
+    return events_df
+
+
+def _pre_process_events_df(input_json):
+    split_events = [_split_event(event) for event in input_json["data"]]
+    split_events = [x for x in split_events if x is not None]
+    events_df = _build_events_df(split_events)
+    included_df = pd.DataFrame(input_json["included"])
     return events_df, included_df
 
 
+def _iter_events_payload(fileobj):
+    """
+    Yield the ("data" | "included", item) pairs of the events payload one at a time,
+    skipping the dropped attributes of the events while parsing
+    """
+    section, builder, skipped = None, None, None
+    for prefix, event, value in ijson.parse(fileobj, use_float=True):
+        if builder is None:
+            if event == "start_map" and prefix in ["data.item", "included.item"]:
+                section = prefix.split(".")[0]
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            continue
+        if skipped is not None:
+            if prefix == skipped or prefix.startswith(skipped + "."):
+                continue
+            skipped = None
+        if (
+            event == "map_key"
+            and prefix == "data.item.attributes"
+            and value in _EVENTS_DROPPED_ATTRIBUTES
+        ):
+            skipped = f"{prefix}.{value}"
+            continue
+        builder.event(event, value)
+        if event == "end_map" and prefix == f"{section}.item":
+            yield section, builder.value
+            builder = None
+
+
+def _stream_pre_process_events_df(response):
+    """
+    Streaming counterpart of _pre_process_events_df: the payload is decoded
+    incrementally from the response, so that it is never held in memory at once
+    """
+    response.raw.decode_content = True
+    split_events, included = [], []
+    for section, item in _iter_events_payload(response.raw):
+        if section == "included":
+            included.append(item)
+            continue
+        split_event = _split_event(item)
+        if split_event is not None:
+            split_events.append(split_event)
+    return _build_events_df(split_events), pd.DataFrame(included)
+
+
+def _timed_pre_process_df(input_json, df_type):
+    with METRICS.timer("pre_process", df_type):
+        return pre_process_df(input_json, df_type)
+
+
+def _decode_pre_process_seats(response):
+    with METRICS.timer("decode", "seats"):
+        seats_json = response.json()
+    return _timed_pre_process_df(seats_json, "seats")
+
+
 def do_nothing(input_json):
     return input_json
 
 
 def pre_process_df(input_json, df_type):
     """
-    Function selector for pre-processing the different data types
+    Function selector for pre-processing the different data types,
+    with the compact dtypes of API_COMPACT_DTYPES
     """
     pre_process_fun = {
         "seats": _pre_process_seats_df,
@@ -126,50 +233,67 @@ def pre_process_df(input_json, df_type):
         "price_types": _pre_process_price_types_df,
         "events": _pre_process_events_df,
     }
-    return pre_process_fun.get(df_type, do_nothing)(input_json)
+    df = pre_process_fun.get(df_type, do_nothing)(input_json)
+    return compact_dtypes(df, API_COMPACT_DTYPES.get(df_type))
 
 
 def post_process_all_data(data, data_types=None, available_seat_status_ids=None):
     """
-    Merge the different dataframes together and do some post-processing
+    Merge the different dataframes together and do some post-processing.
+    The other data types of data (e.g. price_types) are passed through as they are.
     """
-    available_seat_status_ids = available_seat_status_ids or AVAILABLE_SEAT_STATUS_IDS
-    seats_df, prices_df, zones_df, price_types_df = (
-        data["seats"],
-        data["prices"],
-        data["zone_ids"],
-        data["price_types"],
-    )
-    seats_price_df = seats_df.merge(prices_df, on="ZoneId")
-    seats_price_df = seats_price_df.merge(zones_df, on="ZoneId")
-    seats_price_df = seats_price_df.assign(
-        ZoneNameGeneral=seats_price_df.ZoneName.apply(lambda x: ZONE_MAPPING.get(x, x))
-    )
-    seats_price_df.query("ZoneNameGeneral in @ZONE_HIERARCHY.keys()", inplace=True)
+    required = ["seats", "prices", "zone_ids"]
+    missing = [x for x in required if x not in data]
+    if missing:
+        raise ValueError(f"Cannot post-process the seats data without {missing}")
+    seats_df, prices_df, zones_df = data["seats"], data["prices"], data["zone_ids"]
+    seats_price_df = join_seats_prices_zones(seats_df, prices_df, zones_df)
 
     # Fix YPosition so that it follows the zone hierarchy
     seats_price_df = _fix_xy_positions(seats_price_df)
     seats_price_df = enrich_seats_price_df(seats_price_df)
-    # Keep only the lowest price for each (SeatId, SectionId, PerformanceId)
-    seats_price_df.sort_values(
-        by=["SeatId", "SectionId", "PerformanceId", "Price"],
-        inplace=True,
-        ascending=True,
-    )
-    seats_price_df.drop_duplicates(
-        subset=["SeatId", "SectionId", "PerformanceId"], inplace=True
+    seats_price_df = reclassify_seats(seats_price_df, available_seat_status_ids)
+    seats_price_df = compact_dtypes(seats_price_df, SEATS_COMPACT_DTYPES)
+    return {**data, "seats": seats_price_df}
+
+
+def join_seats_prices_zones(seats_df, prices_df, zones_df):
+    """
+    Join each seat to the cheapest price of its zone and to the zone details.
+    The prices and the zones are reduced to one row per zone (and performance) first,
+    so the seats are joined once on the integer zone keys, rather than to every price
+    of their zone and then sorted and deduplicated: there is one row per seat (and
+    performance), in the order of the Seats payload.
+    """
+    # Cheapest price per zone and performance; the stable sort keeps the order of the
+    # prices payload between equal prices, as the per-seat sort did
+    price_keys = [k for k in ["ZoneId", "PerformanceId"] if k in prices_df.columns]
+    cheapest_df = prices_df.sort_values(by="Price", kind="stable")
+    cheapest_df = cheapest_df.drop_duplicates(subset=price_keys)
+    zone_prices_df = cheapest_df.merge(zones_df, on=_merge_keys(prices_df, zones_df))
+    zone_names = zone_prices_df.ZoneName
+    zone_prices_df = zone_prices_df.assign(
+        ZoneNameGeneral=zone_names.map(ZONE_MAPPING).fillna(zone_names)
     )
-    seats_price_df = seats_price_df.assign(
-        seat_available=(seats_price_df.SeatStatusId.isin(available_seat_status_ids))
+    in_hierarchy = zone_prices_df.ZoneNameGeneral.isin(ZONE_HIERARCHY.keys())
+    zone_prices_df = zone_prices_df[in_hierarchy]
+    seats_price_df = seats_df.merge(
+        zone_prices_df, on=_merge_keys(seats_df, zone_prices_df)
     )
-    data = {
-        "seats": seats_price_df,
-        "prices": prices_df,
-        "zone_ids": zones_df,
-        "price_types": price_types_df,
-    }
+    seat_keys = [k for k in ["SeatId", "PerformanceId"] if k in seats_price_df]
+    duplicated = seats_price_df.duplicated(subset=seat_keys)
+    if duplicated.any():
+        # Only from repeated seats or zones in the payloads, of the same price
+        log(f"Dropping {duplicated.sum()} repeated seats")
+        seats_price_df = seats_price_df[~duplicated]
+    return seats_price_df
+
 
-    return data
+def _merge_keys(left_df, right_df, keys=("ZoneId", "PerformanceId")):
+    """
+    Join on ZoneId, and also on PerformanceId when both sides have it (batched mode)
+    """
+    return [k for k in keys if k in left_df.columns and k in right_df.columns]
 
 
 def enrich_seats_price_df(seats_price_df):
@@ -184,25 +308,42 @@ def enrich_seats_price_statuses(seats_price_df):
     """
     Enrich the seats_price_df with the seat statuses
     """
-    seat_statuses = load_statuses_df()["seat_statuses"]
-    seats_statuses_df = pd.DataFrame(seat_statuses)
-    seats_statuses_df = seats_statuses_df.assign(
-        SeatStatusStr=seats_statuses_df.apply(
-            lambda x: f"{x.Id} ({x.StatusCode})", axis=1
-        )
-    )
-
-    seats_statuses_df.rename(columns={"Id": "SeatStatusId"}, inplace=True)
-    cols_to_drop = set(seats_statuses_df.columns) - {"SeatStatusId", "SeatStatusStr"}
-    seats_statuses_df.drop(columns=cols_to_drop, inplace=True, errors="raise")
-    seats_price_df = seats_price_df.merge(
-        seats_statuses_df, on="SeatStatusId", how="left"
+    seat_status_table = load_seat_status_table()
+    seats_price_df = seats_price_df.assign(
+        SeatStatusStr=seat_status_table.labels_of(seats_price_df.SeatStatusId)
     )
     not_enabled = (seats_price_df.SeatStatusId == 0) & (seats_price_df.Price.isnull())
     seats_price_df.loc[not_enabled, "SeatStatusStr"] = "Not enabled"
     return seats_price_df
 
 
+def reclassify_seats(seats_price_df, available_seat_status_ids=None):
+    """
+    The seats with seat_available set from their SeatStatusId and the available statuses.
+    Nothing else of the seats depends on the statuses, so the seats of a previous fetch
+    can be re-classified for other statuses without querying them again.
+    """
+    available_seat_status_ids = available_seat_status_ids or AVAILABLE_SEAT_STATUS_IDS
+    return seats_price_df.assign(
+        seat_available=load_seat_status_table().is_available(
+            seats_price_df.SeatStatusId, available_seat_status_ids
+        )
+    )
+
+
+def load_seat_status_table():
+    """
+    Load the SeatStatusTable, compiled once per process and again only when the
+    seat statuses document changes
+    """
+    global SEAT_STATUS_TABLE
+    seat_statuses = load_statuses_df()["seat_statuses"]
+    fingerprint = SeatStatusTable.get_fingerprint(seat_statuses)
+    if SEAT_STATUS_TABLE is None or SEAT_STATUS_TABLE.fingerprint != fingerprint:
+        SEAT_STATUS_TABLE = SeatStatusTable(seat_statuses)
+    return SEAT_STATUS_TABLE
+
+
 def load_statuses_df(errors="ignore"):
     """
     Load the seat statuses from Firestore
@@ -220,16 +361,24 @@ def load_statuses_df(errors="ignore"):
 
         success = load_seat_statuses()
         if success:
-            load_statuses_df(errors="raise")
+            seat_statuses_df = load_statuses_df(errors="raise")
         else:
             raise ValueError("Failed to load seat statuses to Firestore")
     return seat_statuses_df
 
 
 class API:
+    """
+    Partial results: a data type that fails or misses its deadline (API_DEADLINES) is
+    left out of all_data, unless it is in API_FALLBACK_DATA_TYPES and a previous query
+    of the same url and params succeeded in this process, in which case that frame is
+    used instead and the data type is listed in stale_data_types.
+    """
+
     def __init__(self, query_dict, all_data={}):
         self.query_dict = query_dict
         self.all_data = all_data
+        self.stale_data_types = []
 
     def query_all_data(
         self,
@@ -253,22 +402,27 @@ class API:
 
         # We use a ThreadPoolExecutor to run query_one_data in parallel
         # Adjust max_workers based on your API limits or CPU core count
-        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-            # Submit all tasks to the pool
-            # We map the future object back to the data_type so we know which one finished
-            future_to_dtype = {
-                executor.submit(self.query_one_data, dtype): dtype
-                for dtype in target_data_types
-            }
-
-            # Process results as they complete
-            for future in concurrent.futures.as_completed(future_to_dtype):
-                dtype = future_to_dtype[future]
-                try:
-                    result = future.result()
-                    self.all_data[dtype] = result
-                except Exception as e:
-                    log(f"An error occurred while querying {dtype}: {e}")
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+        # Submit all tasks to the pool
+        # We map the future object back to the data_type so we know which one finished
+        future_to_dtype = {
+            executor.submit(self.query_one_data, dtype): dtype
+            for dtype in target_data_types
+        }
+
+        # Wait for each result until the deadline of its data type
+        start = time.monotonic()
+        for future, dtype in future_to_dtype.items():
+            timeout = max(0, start + self._deadline(dtype) - time.monotonic())
+            try:
+                result = future.result(timeout=timeout)
+            except concurrent.futures.TimeoutError:
+                result = TimeoutError(f"Deadline of {self._deadline(dtype)}s exceeded")
+            except Exception as e:
+                result = e
+            self._store_result(dtype, result)
+        # Don't wait for the stragglers that missed their deadline
+        executor.shutdown(wait=False, cancel_futures=True)
 
         log(f"Queried the following from the API: {target_data_types}")
 
@@ -283,6 +437,184 @@ class API:
         """
         Query one type of data from the query_dict
         """
+        url, params = self._get_url_params(data_type)
+        with METRICS.label(data_type):
+            if data_type == "events" and HAS_IJSON:
+                return HTTP_CLIENT.get_decoded(
+                    url, _stream_pre_process_events_df, params=params, variant="stream"
+                )
+            json_response = HTTP_CLIENT.get_json(url, params=params)
+        print(url, params)
+        with METRICS.timer("pre_process", data_type):
+            return pre_process_df(json_response, data_type)
+
+    async def aquery_all_data(
+        self,
+        data_types=None,
+        post_process=False,
+        available_seat_status_ids=None,
+        **kwargs,
+    ):
+        """
+        Asyncio counterpart of query_all_data: all the data types are awaited at once
+        over the shared HTTP/2 client instead of a per-call thread pool.
+        Args:
+        data_types: list, data types to query
+        post_process: bool, whether to post-process the data
+        """
+        if data_types is None:
+            data_types = self.query_dict.keys()
+
+        target_data_types = list(force_list(data_types))
+        results = await asyncio.gather(
+            *[self._aquery_one_data_by_deadline(dtype) for dtype in target_data_types],
+            return_exceptions=True,
+        )
+        for dtype, result in zip(target_data_types, results):
+            self._store_result(dtype, result)
+
+        log(f"Queried the following from the API: {target_data_types}")
+
+        if post_process:
+            self.all_data = await asyncio.to_thread(
+                post_process_all_data,
+                self.all_data,
+                available_seat_status_ids=available_seat_status_ids,
+            )
+
+        return self.all_data
+
+    async def _aquery_one_data_by_deadline(self, data_type):
+        try:
+            return await asyncio.wait_for(
+                self.aquery_one_data(data_type), self._deadline(data_type)
+            )
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Deadline of {self._deadline(data_type)}s exceeded")
+
+    def _deadline(self, data_type):
+        return API_DEADLINES.get(data_type, API_DEFAULT_DEADLINE)
+
+    def _store_result(self, data_type, result):
+        """
+        Store the result of a data type, or fall back to its last good frame if it failed
+        """
+        url, params = self._get_url_params(data_type)
+        key = (data_type, url, json.dumps(params, sort_keys=True, default=str))
+        if not isinstance(result, Exception):
+            self.all_data[data_type] = result
+            if data_type in API_FALLBACK_DATA_TYPES:
+                LAST_GOOD_DATA.pop(key, None)
+                LAST_GOOD_DATA[key] = result
+                while len(LAST_GOOD_DATA) > API_FALLBACK_MAX_ENTRIES:
+                    LAST_GOOD_DATA.pop(next(iter(LAST_GOOD_DATA)))
+            return
+        log(f"An error occurred while querying {data_type}: {result!r}")
+        self.all_data.pop(data_type, None)
+        if key in LAST_GOOD_DATA:
+            log(f"Falling back to the last good {data_type} data")
+            self.all_data[data_type] = LAST_GOOD_DATA[key].copy()
+            self.stale_data_types.append(data_type)
+
+    async def aquery_one_data(self, data_type=None):
+        """
+        Query one type of data from the query_dict: the request is awaited on the event
+        loop, and the payload pre-processed in a worker thread
+        """
+        url, params = self._get_url_params(data_type)
+        with METRICS.label(data_type):
+            json_response = await ASYNC_HTTP_CLIENT.get_json(
+                url, params=params, hedge=HTTP_HEDGE_ENABLED
+            )
+        log(f"Queried {data_type}: {url} {params}")
+        return await asyncio.to_thread(_timed_pre_process_df, json_response, data_type)
+
+    async def aquery_seats_batch(
+        self,
+        performance_ids,
+        data_types=None,
+        post_process=False,
+        available_seat_status_ids=None,
+        **kwargs,
+    ):
+        """
+        Query the seats data of several performances at once.
+        Prices, zones and price types are queried once for all the performances,
+        and the Seats of each performance are queried concurrently and stacked
+        into one frame keyed by PerformanceId.
+        Args:
+        performance_ids: list, performance ids to query
+        data_types: list, data types to query (all of them by default)
+        post_process: bool, whether to post-process the stacked data
+        """
+        performance_ids = [int(x) for x in performance_ids]
+        if data_types is None:
+            data_types = ["seats", "prices", "zone_ids", "price_types"]
+        data_types = force_list(data_types)
+        shared_data_types = [x for x in data_types if x != "seats"]
+        seats_performance_ids = performance_ids if "seats" in data_types else []
+        batch_query_dict = {}
+        for dtype in shared_data_types:
+            params = dict(self.query_dict[dtype]["params"])
+            params["performanceIds"] = ",".join(map(str, performance_ids))
+            batch_query_dict[dtype] = {**self.query_dict[dtype], "params": params}
+        batch_api = API(batch_query_dict, all_data={})
+
+        results = await asyncio.gather(
+            *[batch_api.aquery_one_data(dtype) for dtype in shared_data_types],
+            *[self.aquery_performance_seats(x) for x in seats_performance_ids],
+            return_exceptions=True,
+        )
+        shared_results = results[: len(shared_data_types)]
+        seats_results = results[len(shared_data_types) :]
+        for dtype, result in zip(shared_data_types, shared_results):
+            if isinstance(result, Exception):
+                raise result
+            self.all_data[dtype] = result
+
+        if not seats_performance_ids:
+            log(f"Queried the following from the API: {shared_data_types}")
+            return self.all_data
+
+        seats_dfs = []
+        for performance_id, result in zip(seats_performance_ids, seats_results):
+            if isinstance(result, Exception):
+                log(
+                    f"An error occurred while querying seats of {performance_id}: {result}"
+                )
+                continue
+            seats_dfs.append(result)
+        if not seats_dfs:
+            raise ValueError(f"No seats could be queried for {performance_ids}")
+        self.all_data["seats"] = pd.concat(seats_dfs, ignore_index=True)
+
+        log(f"Queried the seats of {len(seats_dfs)} performances from the API")
+
+        if post_process:
+            self.all_data = await asyncio.to_thread(
+                post_process_all_data,
+                self.all_data,
+                available_seat_status_ids=available_seat_status_ids,
+            )
+
+        return self.all_data
+
+    async def aquery_performance_seats(self, performance_id):
+        """
+        Query the Seats of one performance, keyed by its PerformanceId
+        """
+        params = dict(self.query_dict["seats"]["params"])
+        params["performanceId"] = performance_id
+        url = SEATS_BASE_URL.replace("/0/", f"/{performance_id}/")
+        with METRICS.label("seats"):
+            response = await ASYNC_HTTP_CLIENT.get(url, params=params)
+        seats_df = await asyncio.to_thread(_decode_pre_process_seats, response)
+        return seats_df.assign(PerformanceId=performance_id)
+
+    def _get_url_params(self, data_type):
+        """
+        Get the url and the params of a data type, filling in the performance of the Seats url
+        """
         url = self.query_dict[data_type]["url"]
 
         params = self.query_dict[data_type]["params"]
@@ -291,9 +623,7 @@ class API:
             if performance_id is None:
                 raise ValueError("performanceId is required for Seats")
             url = url.replace("/0/Seats", f"/{performance_id}/Seats")
-        json_response = requests.get(url, params=params).json()
-        print(url, params)
-        return pre_process_df(json_response, data_type)
+        return url, params
 
 
 def _fix_xy_positions(df):
@@ -301,36 +631,58 @@ def _fix_xy_positions(df):
     Map the seats to their positions according to the web layout
     """
     log("Fixing the seat positions")
-    log(SEAT_MAP_POSITIONS_CSV)
+    seat_geometry = load_seat_geometry()
+    df = seat_geometry.gather(df)  # Removes seats with no position, e.g. aisles
+    log(f"Seat positions: {df.shape}")
+    return df
 
-    # Check if SEAT_MAP_POSITIONS_CSV exists
-    if not PLATFORM.exists(SEAT_MAP_POSITIONS_CSV):
-        log(
-            f"File {SEAT_MAP_POSITIONS_CSV} does not exist! Running load_positions.py..."
-        )
+
+def load_seat_geometry():
+    """
+    Load the SeatGeometry once per process, compiling it if it does not exist yet
+    """
+    global SEAT_GEOMETRY
+    if SEAT_GEOMETRY is not None:
+        return SEAT_GEOMETRY
+    try:
+        SEAT_GEOMETRY = SeatGeometry.load()
+    except (FileNotFoundError, ValueError) as e:
+        log(f"{SEAT_GEOMETRY_LOCATION} not loaded ({e})! Running load_positions.py...")
         from various.seat_map_positions.load_positions import load_positions
 
         load_positions()
-
-    global SEAT_MAP_POSITIONS
-    if SEAT_MAP_POSITIONS.empty:
-        SEAT_MAP_POSITIONS = Firestore(SEAT_MAP_POSITIONS_CSV).read(apply_schema=True)
-    seat_positions = SEAT_MAP_POSITIONS.copy()
-    seat_positions.rename(columns={"ZoneName": "ZoneNameGeneral"}, inplace=True)
-    log(f"Seat positions: {seat_positions.shape}")
-    df_zones = df.ZoneNameGeneral.unique()
-    seat_positions.query("ZoneNameGeneral in @df_zones", inplace=True)
-    df.drop(columns=["x", "y"], inplace=True, errors="ignore")
-    df = df.merge(seat_positions, on=["SeatName", "ZoneNameGeneral"], how="left")
-    df.query("x.notnull()", inplace=True)  # Remove seats with no position, e.g. aisles
-    return df
+        SEAT_GEOMETRY = SeatGeometry.load()
+    return SEAT_GEOMETRY
 
 
 def _query_production_activities(production_url):
     """
     production_url: str, e.g. "https://www.rbo.org.uk/tickets-and-events/tosca-by-jonathan-kent-dates"
     """
-    production_data = requests.get(production_url).text
+    with METRICS.label("production_page"):
+        production_data = HTTP_CLIENT.get(production_url).text
+    with METRICS.timer("pre_process", "production_page"):
+        return _parse_production_activities(production_data)
+
+
+async def _aquery_production_activities(production_url):
+    """
+    production_url: str, e.g. "https://www.rbo.org.uk/tickets-and-events/tosca-by-jonathan-kent-dates"
+    """
+    with METRICS.label("production_page"):
+        response = await ASYNC_HTTP_CLIENT.get(production_url)
+    return await asyncio.to_thread(_timed_parse_production_activities, response.text)
+
+
+def _timed_parse_production_activities(production_data):
+    with METRICS.timer("pre_process", "production_page"):
+        return _parse_production_activities(production_data)
+
+
+def _parse_production_activities(production_data):
+    """
+    Extract the activities from the __INITIAL_STATE__ of a production page
+    """
     soup = BeautifulSoup(production_data, "html.parser")
 
     # __INTIIAL_STATE__ is a JSON object containing all the data we need
@@ -358,6 +710,18 @@ def query_production_activities(production_url):
     production_url: str, e.g. "https://www.rbo.org.uk/tickets-and-events/tosca-by-jonathan-kent-dates"
     """
     activities_df = _query_production_activities(production_url)
+    return _process_production_activities(activities_df)
+
+
+async def aquery_production_activities(production_url):
+    """
+    production_url: str, e.g. "https://www.rbo.org.uk/tickets-and-events/tosca-by-jonathan-kent-dates"
+    """
+    activities_df = await _aquery_production_activities(production_url)
+    return _process_production_activities(activities_df)
+
+
+def _process_production_activities(activities_df):
     activities_df.date = pd.to_datetime(activities_df.date, utc=True)
     activities_df.date = activities_df.date.dt.tz_convert("Europe/London")
     activities_df.sort_values(by=["date"], inplace=True, ignore_index=True)
@@ -391,7 +755,12 @@ def print_performance_info(
     performance_id = [int(x) for x in force_list(performance_id)]
     performance_df = (
         Parquet(PRODUCTIONS_PARQUET_LOCATION)
-        .read(filters={"performanceId": performance_id}, use_bigquery=True)
+        .read(
+            filters={"performanceId": performance_id},
+            columns=["title", "date", "time", "performanceId"],
+            use_manifest=True,  # performanceId is the last partition column
+            use_bigquery=True,
+        )
         .sort_values(by=["date", "time"], ascending=True)
     )
     if not print_info:
@@ -203,11 +203,11 @@ def purge_image_cache(repo_url=PYTHON_ROH_REPO_URL):
     """
     Purge the image cache of a github repository. This is useful when the image is updated and the old one is still cached.
     """
-    import requests
     from bs4 import BeautifulSoup
+    from tools.http_client import HTTP_CLIENT
 
     # Get all images from the repository
-    repo_html = requests.get(repo_url, headers={"User-Agent": "Mozilla/5.0"}).text
+    repo_html = HTTP_CLIENT.get(repo_url, headers={"User-Agent": "Mozilla/5.0"}).text
     soup = BeautifulSoup(repo_html, "html.parser")
     image_elements = soup.find_all("img")
     # Extract all urls
@@ -217,7 +217,7 @@ def purge_image_cache(repo_url=PYTHON_ROH_REPO_URL):
     image_urls = [url for url in image_urls if "http" in url]
     for image_url in image_urls:
         try:
-            response = requests.request("PURGE", image_url)
+            response = HTTP_CLIENT.request("PURGE", image_url)
             log(f"Purged {image_url} - {response.status_code}")
         except Exception as e:
             log(f"Failed to purge {image_url} - {e}")
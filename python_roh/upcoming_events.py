@@ -1,14 +1,19 @@
 import os
+import asyncio
+import hashlib
 import pandas as pd
 
 from cloud.utils import log
 from python_roh.src.config import *
-from tools import Parquet, Firestore
+from tools import Parquet, Firestore, ASYNC_HTTP_CLIENT
 from python_roh.src.utils import force_list
+from python_roh.src.dtypes import compact_dtypes
 from python_roh.src.src import (
     API,
     _query_soonest_performance_id,
-    query_production_activities,
+    aquery_production_activities,
+    expand_dict_column,
+    adhoc_performance_id,
 )
 
 if "src_secret.py" in os.listdir("python_roh/src"):
@@ -24,14 +29,25 @@ def handle_upcoming_events(
     query_events_api=True,
     store_soonest=False,
     use_firestore_events=True,
+    skip_unchanged=False,
     **kwargs,
 ):
     """
-    Entry point for the upcoming events
+    Entry point for the upcoming events.
+    If skip_unchanged, returns None when the events payload has the same fingerprint
+    as the last successful run.
     """
     if query_events_api:
         data = API(query_dict).query_all_data("events")
         events_df, included_df = data["events"]
+        fingerprint = get_events_fingerprint(events_df, included_df)
+        if skip_unchanged:
+            last_fingerprint = load_events_fingerprint().get("fingerprint")
+            if fingerprint == last_fingerprint:
+                log("The events payload is unchanged since the last run.")
+                if store_soonest:
+                    store_soonest_from_firestore()
+                return None
 
         locations_df = get_locations_df(included_df)
         events_df = events_df.merge(locations_df, on="locationId", how="left")
@@ -41,6 +57,7 @@ def handle_upcoming_events(
         events_df.drop(columns=["performances", "date"], inplace=True)
 
         events_df, new_events_df = enrich_events_df(events_df)
+        events_df = compact_dtypes(events_df, EVENTS_COMPACT_DTYPES)
 
         today = pd.Timestamp.today(tz="Europe/London") - pd.Timedelta(hours=1)
         today_tomorrow_events_df, next_week_events_df = get_next_weeks_events(
@@ -49,6 +66,7 @@ def handle_upcoming_events(
         if store_soonest:
             store_soonest_performances(events_df, today, n_events=10)
 
+        events_df.attrs["fingerprint"] = fingerprint
         return events_df, today_tomorrow_events_df, next_week_events_df, new_events_df
 
     log("Not querying the API for events. Using stored data.")
@@ -110,6 +128,65 @@ def store_soonest_performances(events_df, today, n_events=10):
     return None
 
 
+def store_soonest_from_firestore():
+    """
+    Refresh the soonest performances from the events stored in Firestore (cheap)
+    """
+    events_df = Firestore(EVENTS_PARQUET_LOCATION).read(
+        allow_empty=True, apply_schema=True
+    )
+    if isinstance(events_df, dict) or events_df.empty:
+        return None
+    today = pd.Timestamp.today(tz="Europe/London") - pd.Timedelta(hours=1)
+    store_soonest_performances(events_df, today, n_events=10)
+    return None
+
+
+def get_events_fingerprint(events_df, included_df):
+    """
+    Fingerprint of the normalised events payload, independent of the row and column order.
+    The date is part of it, so that the time-dependent stages (e.g. new past casts) still
+    run at least once a day.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(str(pd.Timestamp.today(tz="Europe/London").date()).encode())
+    for df in [events_df, included_df]:
+        df = df.reindex(columns=sorted(df.columns))
+        rows = df.to_json(orient="records", lines=True).splitlines()
+        hasher.update("\n".join(sorted(rows)).encode())
+    return hasher.hexdigest()
+
+
+def load_events_fingerprint():
+    """
+    Load the fingerprint of the last successful events run
+    """
+    return Firestore(EVENTS_FINGERPRINT_LOCATION).read(allow_empty=True) or {}
+
+
+def store_events_fingerprint(fingerprint):
+    """
+    Store the fingerprint of a successful events run
+    """
+    if fingerprint is None:
+        return None
+    now = pd.Timestamp.now(tz="Europe/London").isoformat()
+    Firestore(EVENTS_FINGERPRINT_LOCATION).write(
+        {"fingerprint": fingerprint, "updated_at": now, "checked_at": now}
+    )
+    return None
+
+
+def refresh_events_fingerprint():
+    """
+    Only refresh the time of the last check when the events payload is unchanged
+    """
+    fingerprint_dict = load_events_fingerprint()
+    fingerprint_dict["checked_at"] = pd.Timestamp.now(tz="Europe/London").isoformat()
+    Firestore(EVENTS_FINGERPRINT_LOCATION).write(fingerprint_dict)
+    return None
+
+
 def get_locations_df(included_df):
     """
     Extract the locations data from the included_df
@@ -117,7 +194,7 @@ def get_locations_df(included_df):
     locations_df = included_df.query("type == 'locations'").drop(
         columns=["type", "relationships"]
     )
-    locations_attrs = locations_df.attributes.apply(pd.Series)
+    locations_attrs = expand_dict_column(locations_df.attributes)
     locations_df = pd.concat([locations_df, locations_attrs], axis=1)
     locations_df.drop(columns=["attributes"], inplace=True)
     locations_df.reset_index(drop=True, inplace=True)
@@ -129,7 +206,7 @@ def get_performances_df(events_df):
     """
     Extract the performances data from the events_df
     """
-    performances_df = events_df.performances.apply(pd.Series)
+    performances_df = expand_dict_column(events_df.performances)
     performances_df = performances_df.assign(
         timestamp=pd.to_datetime(performances_df.date, utc=True)
     )
@@ -167,36 +244,27 @@ def enrich_events_with_productions(events_df, dont_read_from_storage=True):
     Enriches the events_df with the production_id
     """
     unique_productions = events_df.drop_duplicates(subset=["productionId"])
-    adhoc_performance_id = events_df.apply(
-        lambda x: f"{x.productionId}-{x.date}-{x.time}", axis=1
+    unique_performances = events_df.assign(
+        adhoc_performance_id=adhoc_performance_id(events_df)
     )
-    unique_performances = events_df.assign(adhoc_performance_id=adhoc_performance_id)
     unique_performances = unique_performances.drop_duplicates(
         subset=["adhoc_performance_id"]
     )
 
     if dont_read_from_storage:
-        # Get the existing partitions without reading the parquet
-        existing_performances = PLATFORM.glob(f"{PRODUCTIONS_PARQUET_LOCATION}/*/*/*/*")
-        existing_performances = [x.split("/")[-3:] for x in existing_performances]
-        existing_performances = [
-            [x[0], x[1], x[2].replace("%3A", ":").replace(".000000", "")]
-            for x in existing_performances
-        ]
-        existing_performances = [
-            "-".join([x[0].split("=")[1], x[1].split("=")[1], x[2].split("=")[1]])
-            for x in existing_performances
-        ]
-        existing_prod_ids = set([int(x.split("-")[0]) for x in existing_performances])
+        # Get the existing partitions without reading the parquet, from its manifest
+        existing_prods = Parquet(PRODUCTIONS_PARQUET_LOCATION).read(
+            allow_empty=True, read_partitions_only=True
+        )
+        existing_prod_ids = set(existing_prods.productionId)
+        existing_performances = set(adhoc_performance_id(existing_prods))
     else:
         # Get the existing productions from the Parquet
         existing_prods = Parquet(PRODUCTIONS_PARQUET_LOCATION).read(
             allow_empty=True, use_bigquery=True
         )
         existing_prod_ids = existing_prods.productionId.unique()
-        existing_performances = existing_prods.apply(
-            lambda x: f"{x.productionId}-{x.date}-{x.time}", axis=1
-        )
+        existing_performances = adhoc_performance_id(existing_prods)
 
     added_productions = unique_productions.query(
         "productionId not in @existing_prod_ids"
@@ -237,10 +305,14 @@ def handle_added_performances_productions(added_performances, added_productions)
     # The URL from performance will query all activities in the production
     # So we only need to query the activities once per production
     added_performances = added_performances.drop_duplicates(subset=["url"])
+    production_urls = added_performances.url.tolist()
+    all_activities = ASYNC_HTTP_CLIENT.run(
+        aquery_all_production_activities(production_urls)
+    )
 
-    for production_i in added_performances.itertuples():
-        production_url = production_i.url
-        activities_df = query_production_activities(production_url)
+    for production_i, activities_df in zip(
+        added_performances.itertuples(), all_activities
+    ):
         activities_df.rename(
             columns={"id": "performanceId", "date": "timestamp"}, inplace=True
         )
@@ -256,12 +328,21 @@ def handle_added_performances_productions(added_performances, added_productions)
         # Store the productions Parquet
         Parquet(PRODUCTIONS_PARQUET_LOCATION).write(
             performances_df,
-            partition_cols=["title", "productionId", "date", "time", "performanceId"],
+            partition_cols=PRODUCTIONS_PARTITION_COLS,
         )
         log(f"Stored performances for {production_i.title} in Productions Parquet.")
     return None
 
 
+async def aquery_all_production_activities(production_urls):
+    """
+    Query the activities of several productions at once
+    """
+    return await asyncio.gather(
+        *[aquery_production_activities(url) for url in production_urls]
+    )
+
+
 def merge_prouctions_into_events(events_df, dont_read_from_storage=True):
     """
     Enrich the events_df with the production information
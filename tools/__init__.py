@@ -1,2 +1,7 @@
 from tools.parquet import Parquet
-from tools.firestore import Firestore
\ No newline at end of file
+from tools.firestore import Firestore
+from tools.http_client import HTTPClient, HTTP_CLIENT, ASYNC_HTTP_CLIENT
+from tools.http_cache import HTTPCache, HTTP_CACHE
+from tools.rate_limiter import RateLimiter, RATE_LIMITER
+from tools.http_replay import FixtureStore, RecordReplayAdapter
+from tools.metrics import Metrics, METRICS
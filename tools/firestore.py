@@ -123,8 +123,11 @@ class Firestore:
                 output = DataFrame(output)
                 output = output.reset_index(drop=True)
             from python_roh.src.utils import enforce_schema
+            from python_roh.src.dtypes import compact_dtypes
+            from python_roh.src.config import FIRESTORE_COMPACT_DTYPES
 
             output = enforce_schema(output, schema=schema, dtypes=dtypes)
+            output = compact_dtypes(output, FIRESTORE_COMPACT_DTYPES.get(self.path))
         return output
 
     def write(self, data, columns=None):
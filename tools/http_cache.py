@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import threading
+
+from cloud.utils import log
+from tools.metrics import METRICS
+from python_roh.src.config import (
+    HTTP_CACHE_DIR,
+    HTTP_CACHE_TTLS,
+    HTTP_CACHE_ENABLED,
+    HTTP_REPLAY_MODE,
+)
+
+
+class HTTPCache:
+    """
+    Disk-backed cache of decoded HTTP responses for the endpoints listed in HTTP_CACHE_TTLS.
+    The decoded payload is pickled, so a hit skips both the download and the JSON decode.
+    Within the TTL of an endpoint the cached payload is served without any request;
+    after it, the entry is revalidated with If-None-Match / If-Modified-Since when the
+    server sent an ETag / Last-Modified, and downloaded again otherwise.
+
+    Examples:
+    - payload, headers = HTTP_CACHE.lookup(url, params) -> payload is None unless fresh
+    - HTTP_CACHE.resolve(url, params, response) -> Payload from a 304 or a new download
+    - HTTP_CACHE.stats() -> {"hits": 3, "revalidated": 2, "misses": 1}
+    - HTTP_CACHE.stats(since=earlier_stats) -> The counts since earlier_stats, e.g. of one run
+    - HTTP_CACHE.resolve(url, params, response, decode=fun, variant="stream") -> Payload
+      decoded by fun(response), kept apart from the JSON payload of the same url
+    """
+
+    def __init__(self, cache_dir=HTTP_CACHE_DIR, ttls=HTTP_CACHE_TTLS, enabled=True):
+        """
+        Args:
+        - cache_dir (str): Local directory of the cache entries
+        - ttls (dict): Seconds each endpoint url is served without revalidation
+        - enabled (bool): If False, nothing is cached
+        """
+        self.cache_dir = cache_dir
+        self.ttls = ttls
+        self.enabled = enabled
+        self.counts = {"hits": 0, "revalidated": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def ttl(self, url):
+        """Return the TTL of the endpoint, or None if it is not cached"""
+        if not self.enabled:
+            return None
+        return self.ttls.get(url, None)
+
+    def _key(self, url, params, variant=None):
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        key = [url, params] if variant is None else [url, params, variant]
+        key = json.dumps(key, sort_keys=True, default=str)
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _paths(self, url, params, variant=None):
+        key = self._key(url, params, variant)
+        path = os.path.join(self.cache_dir, key)
+        return path + ".json", path + ".pkl"
+
+    def _count(self, outcome, url):
+        with self._lock:
+            self.counts[outcome] += 1
+        label = {"hits": "hit", "revalidated": "revalidated", "misses": "miss"}[outcome]
+        log(f"HTTP cache {label}: {url}")
+
+    def _read_meta(self, meta_path):
+        try:
+            with open(meta_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _read_payload(self, payload_path):
+        try:
+            with open(payload_path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def _write_atomic(self, path, data, mode):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, mode) as f:
+            if "b" in mode:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            else:
+                json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def lookup(self, url, params=None, variant=None):
+        """
+        Return (payload, headers): the payload if the entry is within its TTL, else None,
+        and the conditional request headers to revalidate the entry with.
+        """
+        ttl = self.ttl(url)
+        if ttl is None:
+            return None, {}
+        meta_path, payload_path = self._paths(url, params, variant)
+        meta = self._read_meta(meta_path)
+        if meta is None or not os.path.exists(payload_path):
+            return None, {}
+        if time.time() - meta["stored_at"] < ttl:
+            payload = self._read_payload(payload_path)
+            if payload is not None:
+                self._count("hits", url)
+                return payload, {}
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return None, headers
+
+    def resolve(self, url, params, response, decode=None, variant=None):
+        """
+        Return the payload of a response to a (conditional) request, storing it if cacheable.
+        The payload is decode(response) if given, else the JSON of the response.
+        """
+        if decode is None:
+            decode = lambda response: response.json()
+        timer = METRICS.timer("decode", METRICS.current_label(url))
+        if self.ttl(url) is None:
+            with timer:
+                return decode(response)
+        meta_path, payload_path = self._paths(url, params, variant)
+        if response.status_code == 304:
+            meta = self._read_meta(meta_path)
+            payload = self._read_payload(payload_path)
+            if meta is not None and payload is not None:
+                meta["stored_at"] = time.time()
+                self._write_atomic(meta_path, meta, "w")
+                self._count("revalidated", url)
+                return payload
+        with timer:
+            payload = decode(response)
+        self._count("misses", url)
+        if 200 <= response.status_code < 300:
+            self.store(url, params, payload, response.headers, variant)
+        return payload
+
+    def store(self, url, params, payload, headers, variant=None):
+        meta_path, payload_path = self._paths(url, params, variant)
+        meta = {
+            "url": url,
+            "stored_at": time.time(),
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+        }
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Payload first, so that a meta file always points at a complete payload
+            self._write_atomic(payload_path, payload, "wb")
+            self._write_atomic(meta_path, meta, "w")
+        except OSError as e:
+            log(f"Failed to write the HTTP cache entry of {url}: {e}")
+
+    def stats(self, since=None):
+        """
+        The counts of the process, or only those since the earlier stats() of since
+        """
+        with self._lock:
+            counts = dict(self.counts)
+        if since is not None:
+            counts = {k: v - since.get(k, 0) for k, v in counts.items()}
+        return counts
+
+
+# Initialised process-wide cache, off while recording: a cache hit (or a 304 to its
+# conditional request) would leave no fixture of the payload to replay
+HTTP_CACHE = HTTPCache(enabled=HTTP_CACHE_ENABLED and HTTP_REPLAY_MODE != "record")
@@ -0,0 +1,327 @@
+import os
+import asyncio
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+from cloud.utils import log
+from tools.http_cache import HTTP_CACHE
+from tools.metrics import METRICS
+from tools.rate_limiter import RATE_LIMITER
+from tools.http_replay import RecordReplayAdapter, replay_transport, replay_enabled
+from python_roh.src.config import (
+    HTTP_POOL_CONNECTIONS,
+    HTTP_POOL_MAXSIZE,
+    HTTP_TIMEOUT,
+    HTTP_WARM_UP_URLS,
+    HTTP_ASYNC_MAX_CONNECTIONS,
+    HTTP_ASYNC_HTTP2,
+    HTTP_REPLAY_MODE,
+    HTTP_HEDGE_QUANTILE,
+    HTTP_HEDGE_MIN_SAMPLES,
+    HTTP_HEDGE_DEFAULT_DELAY,
+    HTTP_ASYNC_RUN_TIMEOUT,
+)
+
+
+def clean_params(params):
+    """
+    Drop the None-valued query parameters, as requests does, so that both clients send the same query
+    """
+    if not params:
+        return params
+    return {k: v for k, v in params.items() if v is not None}
+
+
+class HTTPClient:
+    """
+    Process-wide HTTP client with per-host keep-alive connection pools.
+    All the calls to rbo.org.uk share one session so that the TCP+TLS handshake
+    is only paid once per connection rather than once per request.
+    Every request goes through RATE_LIMITER, which paces and retries it.
+
+    Examples:
+    - HTTP_CLIENT.get(url, params=params).json()
+    - HTTP_CLIENT.request("PURGE", url)
+    - HTTP_CLIENT.warm_up() -> Open the connections in the background
+    """
+
+    def __init__(
+        self,
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        timeout=HTTP_TIMEOUT,
+    ):
+        """
+        Args:
+        - pool_connections (int): Number of per-host connection pools to keep
+        - pool_maxsize (int): Maximum number of connections kept alive per host
+        - timeout (tuple): (connect, read) timeout in seconds used by default
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """Return the shared session, recreating it after a fork (e.g. gunicorn workers)."""
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._session = self._new_session()
+                    self._pid = os.getpid()
+        return self._session
+
+    def _new_session(self):
+        session = requests.Session()
+        pool_kwargs = dict(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+        )
+        if replay_enabled():
+            adapter = RecordReplayAdapter(HTTP_REPLAY_MODE, **pool_kwargs)
+        else:
+            adapter = HTTPAdapter(**pool_kwargs)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        label = METRICS.current_label(url)
+        with METRICS.timer("latency", label):
+            response = RATE_LIMITER.call(
+                lambda: self.session.request(method, url, **kwargs),
+                url,
+                retry_exceptions=(requests.ConnectionError, requests.Timeout),
+            )
+        if not kwargs.get("stream", False):
+            METRICS.observe("bytes", label, len(response.content))
+        return response
+
+    def get(self, url, params=None, **kwargs):
+        return self.request("GET", url, params=params, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def get_json(self, url, params=None, **kwargs):
+        """
+        GET a JSON payload through the HTTP cache
+        """
+        payload, headers = HTTP_CACHE.lookup(url, params)
+        if payload is not None:
+            return payload
+        headers = {**kwargs.pop("headers", {}), **headers}
+        response = self.get(url, params=params, headers=headers, **kwargs)
+        return HTTP_CACHE.resolve(url, params, response)
+
+    def get_decoded(self, url, decode, params=None, variant=None, **kwargs):
+        """
+        GET a payload through the HTTP cache, decoding it with decode(response) from the
+        streamed response body, e.g. to parse a large JSON incrementally
+        """
+        payload, headers = HTTP_CACHE.lookup(url, params, variant)
+        if payload is not None:
+            return payload
+        headers = {**kwargs.pop("headers", {}), **headers}
+        kwargs.setdefault("stream", True)
+        with self.get(url, params=params, headers=headers, **kwargs) as response:
+            payload = HTTP_CACHE.resolve(url, params, response, decode, variant)
+            METRICS.observe("bytes", METRICS.current_label(url), response.raw.tell())
+            return payload
+
+    def warm_up(self, urls=HTTP_WARM_UP_URLS, background=True):
+        """
+        Open the keep-alive connections to the given hosts ahead of the first real request
+        """
+
+        def _warm_up():
+            for url in urls:
+                try:
+                    self.head(url, allow_redirects=False)
+                    log(f"Warmed up connection to {url}")
+                except requests.RequestException as e:
+                    log(f"Failed to warm up connection to {url}: {e}")
+
+        if not background:
+            return _warm_up()
+        thread = threading.Thread(target=_warm_up, daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+        self._session = None
+
+
+class AsyncHTTPClient:
+    """
+    Process-wide asyncio HTTP client with HTTP/2 multiplexing.
+    A single event loop runs in a background thread and owns the httpx client, so that
+    coroutines from any thread (e.g. the Dash workers) share the same few connections
+    instead of each fetch holding a thread of its own. Only the requests are awaited on
+    the loop: the cache files, the decoding and the processing of the payloads run in
+    the worker threads of asyncio.to_thread, not to hold up the other fetches.
+
+    Examples:
+    - await ASYNC_HTTP_CLIENT.get(url, params=params) -> httpx.Response
+    - ASYNC_HTTP_CLIENT.run(API(query_dict).aquery_all_data()) -> Run from synchronous code
+    """
+
+    def __init__(
+        self,
+        max_connections=HTTP_ASYNC_MAX_CONNECTIONS,
+        timeout=HTTP_TIMEOUT,
+        http2=HTTP_ASYNC_HTTP2,
+    ):
+        """
+        Args:
+        - max_connections (int): Maximum number of open connections across all hosts
+        - timeout (tuple): (connect, read) timeout in seconds
+        - http2 (bool): Whether to negotiate HTTP/2 with the servers that support it
+        """
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.http2 = http2
+        self._loop = None
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        """Return the background event loop, starting it (again after a fork) if needed."""
+        if self._loop is None or self._pid != os.getpid():
+            with self._lock:
+                if self._loop is None or self._pid != os.getpid():
+                    self._loop = asyncio.new_event_loop()
+                    self._client = None
+                    self._pid = os.getpid()
+                    thread = threading.Thread(
+                        target=self._loop.run_forever,
+                        name="async-http-client",
+                        daemon=True,
+                    )
+                    thread.start()
+        return self._loop
+
+    def _get_client(self):
+        """Create the httpx client lazily, on the background loop it is bound to."""
+        if self._client is None:
+            import httpx
+
+            connect_timeout, read_timeout = self.timeout
+            limits = httpx.Limits(max_connections=self.max_connections)
+            transport = None
+            if replay_enabled():
+                transport = httpx.AsyncHTTPTransport(http2=self.http2, limits=limits)
+                transport = replay_transport(HTTP_REPLAY_MODE, transport)
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=limits,
+                transport=transport,
+                follow_redirects=True,
+            )
+        return self._client
+
+    async def _request(self, method, url, params=None, **kwargs):
+        import httpx
+
+        client = self._get_client()
+        params = clean_params(params)
+        label = METRICS.current_label(url)
+        with METRICS.timer("latency", label):
+            response = await RATE_LIMITER.acall(
+                lambda: client.request(method, url, params=params, **kwargs),
+                url,
+                retry_exceptions=(httpx.TransportError,),
+            )
+        METRICS.observe("bytes", label, len(response.content))
+        return response
+
+    async def request(self, method, url, params=None, **kwargs):
+        """
+        Send a request on the background loop, whichever loop the caller is awaiting from
+        """
+        coro = self._request(method, url, params=params, **kwargs)
+        if _running_loop() is self.loop:
+            return await coro
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return await asyncio.wrap_future(future)
+
+    async def get(self, url, params=None, **kwargs):
+        return await self.request("GET", url, params=params, **kwargs)
+
+    async def get_json(self, url, params=None, hedge=False, **kwargs):
+        """
+        GET a JSON payload through the HTTP cache, optionally hedged (see get_hedged)
+        """
+        payload, headers = await asyncio.to_thread(HTTP_CACHE.lookup, url, params)
+        if payload is not None:
+            return payload
+        headers = {**kwargs.pop("headers", {}), **headers}
+        get = self.get_hedged if hedge else self.get
+        response = await get(url, params=params, headers=headers, **kwargs)
+        return await asyncio.to_thread(HTTP_CACHE.resolve, url, params, response)
+
+    async def get_hedged(self, url, params=None, **kwargs):
+        """
+        GET, sending a duplicate request if the first one is slower than the usual p95
+        latency of the endpoint, and returning whichever succeeds first
+        """
+        first = asyncio.ensure_future(self.get(url, params=params, **kwargs))
+        done, _ = await asyncio.wait([first], timeout=self.hedge_delay(url))
+        if done:
+            return first.result()
+        log(f"Hedging the request to {url}")
+        second = asyncio.ensure_future(self.get(url, params=params, **kwargs))
+        pending = {first, second}
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return task.result()
+        return task.result()
+
+    def hedge_delay(self, url):
+        label = METRICS.current_label(url)
+        delay = METRICS.quantile(
+            "latency", label, HTTP_HEDGE_QUANTILE, min_count=HTTP_HEDGE_MIN_SAMPLES
+        )
+        return HTTP_HEDGE_DEFAULT_DELAY if delay is None else delay
+
+    def run(self, coro, timeout=HTTP_ASYNC_RUN_TIMEOUT):
+        """
+        Run a coroutine on the background loop and block until it returns, or cancel it
+        and raise TimeoutError after timeout seconds
+        """
+        if _running_loop() is self.loop:
+            raise RuntimeError("Cannot block on the HTTP event loop from within itself")
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"The HTTP event loop did not return within {timeout}s")
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+# Initialised process-wide clients
+HTTP_CLIENT = HTTPClient()
+ASYNC_HTTP_CLIENT = AsyncHTTPClient()
@@ -0,0 +1,168 @@
+import io
+import os
+import json
+import time
+import asyncio
+import hashlib
+from urllib3 import HTTPResponse
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from cloud.utils import log
+from python_roh.src.config import (
+    HTTP_REPLAY_MODE,
+    HTTP_FIXTURES_DIR,
+    HTTP_REPLAY_LATENCY,
+)
+
+# Stripped when recording, so that the fixtures hold full responses rather than 304s
+CONDITIONAL_HEADERS = ["If-None-Match", "If-Modified-Since"]
+# Not replayed, as the fixtures hold the decoded body
+DROPPED_HEADERS = [
+    "content-encoding",
+    "content-length",
+    "transfer-encoding",
+    "connection",
+]
+
+
+def replayable_headers(headers):
+    return {k: v for k, v in headers.items() if k.lower() not in DROPPED_HEADERS}
+
+
+class FixtureStore:
+    """
+    Directory of recorded HTTP responses, keyed by the method and the normalised url,
+    so that the requests and the httpx clients record and replay the same fixtures.
+
+    Examples:
+    - FixtureStore().save("GET", url, 200, headers, content)
+    - FixtureStore().load("GET", url) -> (200, headers, content) or None
+    """
+
+    def __init__(self, fixtures_dir=HTTP_FIXTURES_DIR):
+        self.fixtures_dir = fixtures_dir
+
+    @staticmethod
+    def normalise_url(url):
+        """Sort and unquote the query, as the clients encode it differently"""
+        parts = urlsplit(url)
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+        return f"{parts.scheme}://{parts.netloc}{parts.path}?{query}"
+
+    def _path(self, method, url):
+        key = f"{method.upper()} {self.normalise_url(url)}"
+        key = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.fixtures_dir, key)
+
+    def load(self, method, url):
+        path = self._path(method, url)
+        try:
+            with open(path + ".json", "r") as f:
+                meta = json.load(f)
+            with open(path + ".body", "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        return meta["status"], meta["headers"], content
+
+    def save(self, method, url, status, headers, content):
+        path = self._path(method, url)
+        meta = {
+            "method": method.upper(),
+            "url": self.normalise_url(url),
+            "status": status,
+            "headers": replayable_headers(headers),
+        }
+        os.makedirs(self.fixtures_dir, exist_ok=True)
+        with open(path + ".body", "wb") as f:
+            f.write(content)
+        with open(path + ".json", "w") as f:
+            json.dump(meta, f, indent=2)
+        log(f"Recorded fixture: {method.upper()} {url}")
+
+    def missing(self, method, url):
+        return FileNotFoundError(
+            f"No fixture recorded for {method.upper()} {url} in {self.fixtures_dir}"
+        )
+
+
+class RecordReplayAdapter(HTTPAdapter):
+    """
+    requests transport adapter that records every response into the fixture directory,
+    or replays them from it with a fixed latency instead of reaching the network.
+    """
+
+    def __init__(self, mode, store=None, latency=HTTP_REPLAY_LATENCY, **kwargs):
+        """
+        Args:
+        - mode (str): "record" or "replay"
+        - store (FixtureStore): Fixture directory to record into or replay from
+        - latency (float): Seconds each replayed response is delayed by
+        """
+        self.mode = mode
+        self.store = store or FixtureStore()
+        self.latency = latency
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if self.mode == "replay":
+            fixture = self.store.load(request.method, request.url)
+            if fixture is None:
+                raise self.store.missing(request.method, request.url)
+            time.sleep(self.latency)
+        else:
+            for header in CONDITIONAL_HEADERS:
+                request.headers.pop(header, None)
+            response = super().send(request, **kwargs)
+            fixture = (response.status_code, dict(response.headers), response.content)
+            self.store.save(request.method, request.url, *fixture)
+        status, headers, content = fixture
+        raw = HTTPResponse(
+            body=io.BytesIO(content),
+            headers=replayable_headers(headers),
+            status=status,
+            preload_content=False,
+            decode_content=False,
+        )
+        return self.build_response(request, raw)
+
+
+def replay_transport(mode, transport, store=None, latency=HTTP_REPLAY_LATENCY):
+    """
+    Return the httpx counterpart of RecordReplayAdapter, wrapping the given transport
+    """
+    import httpx
+
+    store = store or FixtureStore()
+
+    class RecordReplayTransport(httpx.AsyncBaseTransport):
+        async def handle_async_request(self, request):
+            method, url = request.method, str(request.url)
+            if mode == "replay":
+                fixture = store.load(method, url)
+                if fixture is None:
+                    raise store.missing(method, url)
+                await asyncio.sleep(latency)
+            else:
+                for header in CONDITIONAL_HEADERS:
+                    request.headers.pop(header, None)
+                response = await transport.handle_async_request(request)
+                content = await response.aread()
+                await response.aclose()
+                fixture = (response.status_code, dict(response.headers), content)
+                store.save(method, url, *fixture)
+            status, headers, content = fixture
+            headers = replayable_headers(headers)
+            return httpx.Response(status, headers=headers, content=content)
+
+        async def aclose(self):
+            await transport.aclose()
+
+    return RecordReplayTransport()
+
+
+def replay_enabled(mode=HTTP_REPLAY_MODE):
+    if mode not in ["off", "record", "replay"]:
+        raise ValueError(f"Unknown HTTP_REPLAY_MODE: {mode}")
+    return mode != "off"
@@ -0,0 +1,204 @@
+import math
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from cloud.utils import log
+
+# Label of the HTTP calls made within METRICS.label(...), e.g. the API data type
+_LABEL = contextvars.ContextVar("metrics_label", default=None)
+
+
+class Histogram:
+    """
+    Log-bucketed histogram: constant memory, quantiles within the bucket growth factor
+    """
+
+    def __init__(self, growth=1.1):
+        self.growth = growth
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _bucket(self, value):
+        if value <= 0:
+            return None
+        return math.floor(math.log(value, self.growth))
+
+    def observe(self, value):
+        bucket = self._bucket(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bucket in sorted(self.buckets, key=lambda x: -math.inf if x is None else x):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                upper = 0.0 if bucket is None else self.growth ** (bucket + 1)
+                return min(max(upper, self.min), self.max)
+        return self.max
+
+    def copy(self):
+        other = Histogram(self.growth)
+        other.buckets = dict(self.buckets)
+        other.count, other.total = self.count, self.total
+        other.min, other.max = self.min, self.max
+        return other
+
+    def since(self, earlier):
+        """
+        Histogram of the values observed after the earlier copy of this one, its min and
+        max within the bucket growth factor
+        """
+        other = Histogram(self.growth)
+        if earlier is None:
+            earlier = Histogram(self.growth)
+        other.buckets = {
+            k: v - earlier.buckets.get(k, 0)
+            for k, v in self.buckets.items()
+            if v > earlier.buckets.get(k, 0)
+        }
+        other.count = self.count - earlier.count
+        other.total = self.total - earlier.total
+        if other.count:
+            buckets = [x for x in other.buckets if x is not None]
+            lowest = 0.0 if None in other.buckets else self.growth ** min(buckets)
+            highest = self.growth ** (max(buckets) + 1) if buckets else 0.0
+            other.min, other.max = max(lowest, self.min), min(highest, self.max)
+        return other
+
+    def summary(self):
+        return {
+            "n": self.count,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": self.max if self.count else None,
+            "total": self.total,
+        }
+
+
+class Metrics:
+    """
+    Process-wide histograms of the HTTP calls and the API processing, per metric and label.
+    The label is the API data type (or another name given with METRICS.label),
+    else the endpoint path of the url.
+
+    Metrics:
+    - latency (s): Wall time of the request, including the rate limiting and the retries
+    - bytes: Size of the response body
+    - decode (s): Time to decode the response body (JSON or streamed)
+    - pre_process (s): Time spent in pre_process_df
+
+    Examples:
+    - with METRICS.label("seats"): HTTP_CLIENT.get_json(url)
+    - with METRICS.timer("pre_process", "seats"): pre_process_df(...)
+    - METRICS.log_summary() -> Log one line per metric and label
+    - METRICS.log_summary(since=METRICS.snapshot()) -> Only what was observed since the
+      snapshot, e.g. in one run of a long-running process; the process-wide histograms
+      are kept for the hedge delays
+    """
+
+    UNITS = {"latency": "s", "bytes": "B", "decode": "s", "pre_process": "s"}
+
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def label(self, name):
+        token = _LABEL.set(name)
+        try:
+            yield
+        finally:
+            _LABEL.reset(token)
+
+    def current_label(self, url=None):
+        label = _LABEL.get()
+        if label is None and url is not None:
+            label = endpoint_label(url)
+        return label
+
+    def observe(self, metric, label, value):
+        with self._lock:
+            key = (metric, label)
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, metric, label):
+        """Time the block; failed or cancelled ones are not recorded"""
+        start = time.perf_counter()
+        yield
+        self.observe(metric, label, time.perf_counter() - start)
+
+    def quantile(self, metric, label, q, min_count=1):
+        """Return the q-quantile of a histogram, or None if it has fewer than min_count values"""
+        with self._lock:
+            hist = self.histograms.get((metric, label))
+            if hist is None or hist.count < min_count:
+                return None
+            return hist.quantile(q)
+
+    def snapshot(self):
+        """Copy of the histograms, to summarise what is observed after it"""
+        with self._lock:
+            return {key: hist.copy() for key, hist in self.histograms.items()}
+
+    def summary(self, since=None):
+        with self._lock:
+            if since is None:
+                histograms = self.histograms
+            else:
+                histograms = {
+                    key: hist.since(since.get(key))
+                    for key, hist in self.histograms.items()
+                }
+            return {
+                key: hist.summary() for key, hist in histograms.items() if hist.count
+            }
+
+    def log_summary(self, since=None):
+        summary = self.summary(since)
+        if not summary:
+            return
+        lines = []
+        for (metric, label), stats in sorted(summary.items(), key=str):
+            unit = self.UNITS.get(metric, "")
+            values = [f"{k}={_format(stats[k], unit)}" for k in ["p50", "p95", "max"]]
+            lines.append(f"{metric}[{label}]: n={stats['n']} " + " ".join(values))
+        log("HTTP metrics:\n" + "\n".join(lines))
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+
+
+def endpoint_label(url):
+    """Path of the url with the numeric segments collapsed, e.g. /api/Performances/{id}"""
+    segments = urlsplit(url).path.split("/")
+    segments = ["{id}" if x.isdigit() else x for x in segments]
+    return "/".join(segments) or "/"
+
+
+def _format(value, unit):
+    if value is None:
+        return "-"
+    if unit == "B":
+        return f"{value / 1024:.1f}KiB"
+    return f"{value:.3f}{unit}"
+
+
+# Initialised process-wide metrics
+METRICS = Metrics()
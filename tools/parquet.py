@@ -1,34 +1,60 @@
 import os
 import uuid
-import glob
-import asyncio
+import threading
 import pandas as pd
 import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.dataset as ds
 import pyarrow.parquet as pq
-from urllib.parse import unquote
-from typing import Any, List, Tuple, Dict
+from urllib.parse import quote, unquote
+from typing import Any, List
 from concurrent.futures import ThreadPoolExecutor
 
 from cloud.utils import log
-from python_roh.src.utils import force_list, async_retry, enforce_schema
+from python_roh.src.utils import force_list, enforce_schema
+from python_roh.src.dtypes import compact_dtypes
 from python_roh.src.config import (
     PARQUET_SCHEMAS,
     PYARROW_SCHEMAS,
     PLATFORM,
     PARQUET_TABLE_RELATIONS,
     PRODUCTIONS_PARQUET_LOCATION,
+    PARQUET_COMPACT_DTYPES,
+    PARQUET_COMPRESSION,
+    PARQUET_ROW_GROUP_SIZE,
+    PARQUET_WRITE_WORKERS,
+    PARQUET_PARTITION_COLS,
+    PARQUET_COMPACTION_MIN_FILES,
+    PARQUET_UPSERT_KEYS,
+    PARQUET_MANIFEST_WRITE_RETRIES,
 )
 
+# File of a partition replaced by each write, named as by pyarrow's write_to_dataset
+PARTITION_FILE_NAME = "0.parquet"
+# Partition value of the nulls in the hive layout of pyarrow
+HIVE_NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+# Manifest of the files of a partitioned dataset, at its root. Hidden from the dataset
+# reads, as pyarrow skips the files starting with "_"
+MANIFEST_FILE_NAME = "_manifest.parquet"
+MANIFEST_COLUMNS = ["path", "rows", "written_at"]
+
 
 class Parquet:
     """
-    Writes a DataFrame to a parquet file using pyarrow and asyncio.
+    Writes a DataFrame to a parquet file using pyarrow.
+    The partitions of a partitioned write are written in parallel on a process-wide pool,
+    in the hive layout of pyarrow's write_to_dataset, so both can share a dataset.
     It allows for a better naming schema of the parquet partitions, handling special characters.
+    Each partitioned write updates the manifest of the dataset (MANIFEST_FILE_NAME): its
+    files, with their partition values, row counts and write times. The partitions are
+    then known from one small read instead of globbing the dataset.
+    The datasets of PARQUET_UPSERT_KEYS are written by upsert, as fragments next to the
+    file at the path, and read with the rows of each key from the last write of it.
+    Writing their whole file removes the fragments upserted before.
     """
 
     def __init__(self, path: str, **kwargs):
         self.path = path
-        self.executor = ThreadPoolExecutor(max_workers=os.cpu_count())
 
     def write(
         self,
@@ -36,90 +62,191 @@ class Parquet:
         partition_cols: List[str] = None,
         add_uuid: bool = False,
         schema: pa.Schema = None,
-        use_threading: bool = False,
+        compression: str = None,
+        row_group_size: int = None,
         **kwargs: Any,
-    ) -> Tuple[Dict[str, str], Dict[str, bool]]:
+    ) -> bool:
+        """
+        Args:
+        - df (pd.DataFrame): The frame to write
+        - partition_cols (list): The hive partition columns, None for a single file
+        - add_uuid (bool): Add a new file to each partition, instead of replacing its file
+        - schema (pa.Schema): The schema of the files (without the partition columns)
+        - compression (str): zstd, snappy or gzip, PARQUET_COMPRESSION by default
+        - row_group_size (int): Rows per row group, PARQUET_ROW_GROUP_SIZE by default
+        """
         log(f"Writing to {self.path}")
-        if partition_cols and use_threading:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-
-            tasks = []
-            with self.executor as executor:
-                for grp, _df in df.groupby(partition_cols, sort=False):
-                    task = loop.create_task(
-                        self._write_partition(
-                            grp,
-                            _df,
-                            partition_cols,
-                            add_uuid,
-                            schema,
-                            **kwargs,
-                        )
-                    )
-                    tasks.append(task)
-                loop.run_until_complete(asyncio.gather(*tasks))
-            loop.close()
-
-        elif partition_cols:
-            pq.write_to_dataset(
-                table=pa.Table.from_pandas(df),
-                root_path=self.path,
-                partition_cols=partition_cols,
-                schema=schema,
-                basename_template="{i}.parquet",
-                **kwargs,
-            )
-        else:
-            df.to_parquet(
-                self.path,
-                index=False,
-                engine="pyarrow",
-                **kwargs,
-            )
+        compression = compression or PARQUET_COMPRESSION
+        row_group_size = row_group_size or PARQUET_ROW_GROUP_SIZE
+        if not partition_cols:
+            # A keyed dataset rewritten whole replaces the fragments upserted before
+            fragments = []
+            if self.path in PARQUET_UPSERT_KEYS:
+                fragments = self.fragment_paths()
+            table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+            write_table(table, self.path, compression, row_group_size)
+            self.remove_fragments(fragments)
+            return True
 
+        partition_cols = force_list(partition_cols)
+        if schema is not None:
+            schema = pa.schema([x for x in schema if x.name not in partition_cols])
+        table = pa.Table.from_pandas(
+            df.drop(columns=partition_cols), schema=schema, preserve_index=False
+        )
+        futures, entries = [], []
+        for keys, indices in self.partition_indices(df, partition_cols).items():
+            path_parts = [self.path]
+            for col, val in zip(partition_cols, keys):
+                path_parts.append(f"{col}={val}")
+            if add_uuid:
+                path_parts.append(self.partition_name_func(keys, add_uuid=True))
+            else:
+                path_parts.append(PARTITION_FILE_NAME)
+            entries.append(("/".join(path_parts[1:]), len(indices)))
+            futures.append(
+                PARQUET_WRITE_POOL.submit(
+                    write_table,
+                    table.take(indices),
+                    "/".join(path_parts),
+                    compression,
+                    row_group_size,
+                )
+            )
+        for future in futures:
+            future.result()
+        self.update_manifest(entries)
+        log(f"Wrote {len(futures)} partitions to {self.path}")
         return True
 
-    @async_retry(wait_fixed=0.1, stop_max_attempt_number=1000)
-    async def _write_partition(
-        self, grp, _df, partition_cols, add_uuid, schema, **kwargs
-    ):
-        loop = asyncio.get_running_loop()
-        if not isinstance(grp, tuple):
-            grp = (grp,)
-        path_parts = [self.path]
-        for col, val in zip(partition_cols, grp):
-            sanitized_val = self.sanitise_name(val)
-            path_parts.append(f"{col}={sanitized_val}")
-        path = "/".join(path_parts)
-        os.makedirs(path, exist_ok=True)
-        path = path + "/" + self.partition_name_func(grp, add_uuid=add_uuid)
-        _df.drop(columns=partition_cols, errors="ignore", inplace=True)
-        import time
-
-        await loop.run_in_executor(
-            self.executor,
-            to_parquet,
-            _df,
-            path,
-            "pyarrow",
-            "gzip",
-            False,
-            schema,
-            **kwargs,
+    @property
+    def manifest_path(self):
+        return f"{self.path}/{MANIFEST_FILE_NAME}"
+
+    def read_manifest(self):
+        """
+        The manifest of the dataset, None if it has none
+        Returns:
+        - pd.DataFrame: path (relative to the dataset), rows, written_at and the
+            decoded values of the partition columns of each file
+        """
+        try:
+            table = pq.read_table(self.manifest_path, filesystem=PLATFORM.fs)
+        except FileNotFoundError:
+            return None
+        return table.to_pandas()
+
+    def update_manifest(self, entries, removed=()):
+        """
+        Add the written files to the manifest, replacing the entries of their paths.
+        The manifest is first made from a listing of the dataset if it has none.
+        Args:
+        - entries (list): [(path relative to the dataset, rows)] of the written files
+        - removed (list): Paths relative to the dataset of the removed files
+        """
+        entries_df = manifest_entries(
+            [x[0] for x in entries],
+            rows=[x[1] for x in entries],
+            written_at=pd.Timestamp.now(tz="UTC"),
         )
 
+        def update(manifest_df):
+            if manifest_df is None:
+                manifest_df = self.list_manifest()
+            manifest_df = manifest_df[~manifest_df.path.isin(removed)]
+            manifest_df = pd.concat([manifest_df, entries_df], ignore_index=True)
+            return manifest_df.drop_duplicates("path", keep="last")
+
+        self.modify_manifest(update)
+
+    def modify_manifest(self, update):
+        """
+        Replace the manifest with update(manifest_df), manifest_df None if it has none.
+        The tasks of other instances write the same manifests (e.g. the seat history
+        and the compact task): on GCP the manifest is only written if unchanged since
+        it was read, by its generation, and is otherwise read and updated again.
+        Local writes are serialised within the process.
+        """
+        if PLATFORM.name == "Local":
+            with MANIFEST_LOCK:
+                self.write_manifest(update(self.read_manifest()))
+            return
+        for _ in range(PARQUET_MANIFEST_WRITE_RETRIES + 1):
+            data, generation = PLATFORM.read_generation(self.manifest_path)
+            manifest_df = None
+            if data is not None:
+                manifest_df = pq.read_table(pa.BufferReader(data)).to_pandas()
+            table = pa.Table.from_pandas(update(manifest_df), preserve_index=False)
+            sink = pa.BufferOutputStream()
+            pq.write_table(table, sink)
+            if PLATFORM.write_if_generation(
+                self.manifest_path, sink.getvalue().to_pybytes(), generation
+            ):
+                return
+            log(f"The manifest of {self.path} was written meanwhile, updating it again")
+        raise RuntimeError(f"Failed to update the manifest of {self.path}")
+
+    def list_manifest(self):
+        """
+        A manifest of the files found by listing the dataset, of unknown row counts
+        """
+        filesystem, path = self.dataset_filesystem()
+        files = list_data_files(filesystem, path, path)
+        return manifest_entries(
+            [x.path[len(path) :].strip("/") for x in files],
+            rows=None,
+            written_at=pd.to_datetime([x.mtime for x in files], utc=True),
+        )
+
+    def write_manifest(self, manifest_df):
+        """
+        Replace the manifest at once: an object is replaced atomically by an upload,
+        and a local file by renaming a complete one over it. Unconditional, see
+        modify_manifest for the writes concurrent with other tasks
+        """
+        table = pa.Table.from_pandas(manifest_df, preserve_index=False)
+        replace_file(table, self.manifest_path, PLATFORM.fs)
+
+    def rebuild_manifest(self):
+        """
+        Replace the manifest with one made from a listing of the dataset, e.g. after
+        files were written or removed other than by Parquet.write
+        """
+        self.modify_manifest(lambda _: self.list_manifest())
+
+    def partition_indices(self, df, partition_cols):
+        """
+        Row positions of each partition of df, by its encoded partition values:
+        formatted by pyarrow and URI-encoded as by write_to_dataset, nulls as
+        its default partition
+        """
+        keys = {col: self.encode_partition_values(df[col]) for col in partition_cols}
+        groups = pd.DataFrame(keys).groupby(partition_cols, sort=False, dropna=False)
+        return {
+            (keys if isinstance(keys, tuple) else (keys,)): indices
+            for keys, indices in groups.indices.items()
+        }
+
+    def encode_partition_values(self, values):
+        """
+        The values as in the hive directory names: formatted by pyarrow and URI-encoded
+        as by write_to_dataset, nulls as its default partition
+        """
+        values = pa.array(values, from_pandas=True).cast(pa.string())
+        values = values.to_pandas().fillna(HIVE_NULL_PARTITION)
+        return values.map(self.sanitise_name)
+
     def sanitise_name(self, name):
-        # More selective sanitization to only target problematic characters
-        return name.replace("/", "%2F")
+        # Percent-encode everything but the unreserved characters, as pyarrow does
+        return quote(name, safe="")
 
     def partition_name_func(self, keys, add_uuid: bool = False) -> str:
+        # The keys are the encoded partition values, safe in a file name
         filename = (
             "_".join(map(str, keys))
             + (f"_{uuid.uuid4()}" if add_uuid else "")
             + ".parquet"
         )
-        filename = self.sanitise_name(filename)
         return filename
 
     def read(
@@ -130,14 +257,26 @@ class Parquet:
         use_bigquery=False,
         columns=None,
         read_partitions_only=False,
+        use_manifest=False,
         **kwargs,
     ):
+        """
+        With use_manifest, the files are picked from the manifest of the dataset if it
+        has one, without listing it nor querying BigQuery
+        """
         print_str = f"Reading from {self.path}; filters: {filters}; use_bigquery: {use_bigquery}"
         if read_partitions_only:
             print_str += "; read_partitions_only: True"
+        if use_manifest:
+            print_str += "; use_manifest: True"
         log(print_str)
         filters = self.generate_filters(filters)
-        if use_bigquery and PLATFORM.name != "Local":
+        manifest_df = self.read_manifest() if use_manifest else None
+        if manifest_df is not None:
+            # Reads the files of the manifest whose partitions match the filters
+            schema = PYARROW_SCHEMAS.get(self.path, schema)
+            df = self.read_dataset(filters, columns, schema, manifest_df).to_pandas()
+        elif use_bigquery and PLATFORM.name != "Local":
             # Obtains the data from BigQuery using external table on the Parquet
             table = PARQUET_TABLE_RELATIONS.get(self.path, None)
             df = PLATFORM.read_table(
@@ -149,16 +288,15 @@ class Parquet:
         elif read_partitions_only:
             # Only reads the partitions of the Parquet file using the filenames
             df = self.get_partitions_df()
+        elif self.path in PARQUET_UPSERT_KEYS:
+            # Reads the file and its upserted fragments
+            schema = PYARROW_SCHEMAS.get(self.path, schema)
+            df = self.read_upserted(filters, columns, schema)
         else:
             # Actually reads the Parquet file from storage
             schema = PYARROW_SCHEMAS.get(self.path, schema)
             try:
-                df = pq.read_table(
-                    self.path,
-                    filters=filters,
-                    schema=schema,
-                    **kwargs,
-                ).to_pandas()
+                df = self.read_dataset(filters, columns, schema).to_pandas()
             except FileNotFoundError:
                 df = pd.DataFrame()
         if df.empty and not allow_empty:
@@ -169,9 +307,243 @@ class Parquet:
         df = self.fix_column_types(df, filters)
 
         enforced_schema = PARQUET_SCHEMAS.get(self.path, None)
+        if enforced_schema and columns is not None:
+            enforced_schema = {k: v for k, v in enforced_schema.items() if k in columns}
         df = enforce_schema(df, enforced_schema)
+        df = compact_dtypes(df, PARQUET_COMPACT_DTYPES.get(self.path))
         return df
 
+    def read_dataset(self, filters=None, columns=None, schema=None, manifest_df=None):
+        """
+        Read the rows matching the filters, and only the columns, from the platform
+        file system:
+        - the files are picked from the manifest_df if given, from the = and in
+            filters on any partition columns, without listing the dataset
+        - else the partitions are pruned before listing the files from the = and in
+            filters on the leading partition columns
+        - the partitions are pruned before opening the files from the other filters
+            on the partition columns
+        - the other filters are pushed down to the row groups, by their statistics
+        Args:
+        - filters (list): [(column, op, value)] of generate_filters
+        - columns (list): The columns to read, all of them by default
+        - schema (pa.Schema): The schema of the dataset, inferred by default
+        - manifest_df (pd.DataFrame): The manifest of the dataset, see read_manifest
+        """
+        filesystem, path = self.dataset_filesystem()
+        if manifest_df is not None:
+            paths = self.manifest_paths(manifest_df, filters)
+            files = [f"{path}/{x}" for x in paths]
+            try:
+                return self.read_files(
+                    filesystem, path, files, filters, columns, schema
+                )
+            except FileNotFoundError:
+                # Removed by a compaction since the manifest was read
+                log(f"Listing {self.path}, files of its manifest were removed")
+        info = filesystem.get_file_info(path)
+        if info.type == pafs.FileType.NotFound:
+            raise FileNotFoundError(self.path)
+        if info.type == pafs.FileType.File:
+            files = [path]
+        else:
+            files = [
+                x.path
+                for prefix in self.partition_prefixes(path, filters)
+                for x in list_data_files(filesystem, prefix, path)
+            ]
+        return self.read_files(filesystem, path, files, filters, columns, schema)
+
+    def read_files(self, filesystem, path, files, filters, columns, schema):
+        """
+        Read the rows matching the filters of the files of the dataset at path
+        """
+        if not files:
+            return pa.table({})
+        dataset = ds.dataset(
+            files,
+            schema=schema,
+            format="parquet",
+            filesystem=filesystem,
+            partitioning="hive",
+            partition_base_dir=path,
+        )
+        expression = pq.filters_to_expression(filters) if filters else None
+        return dataset.to_table(columns=columns, filter=expression)
+
+    @property
+    def fragments_path(self):
+        return f"{os.path.splitext(self.path)[0]}_fragments"
+
+    def upsert(self, df):
+        """
+        Write the rows as a new fragment of the keyed dataset (PARQUET_UPSERT_KEYS):
+        on read, they are added if their keys are new, and replace the rows of their
+        keys otherwise. The file at the path is only rewritten by merge_fragments.
+        """
+        name = f"{pd.Timestamp.now(tz='UTC'):%Y%m%dT%H%M%S%f}_{uuid.uuid4()}.parquet"
+        log(f"Upserting {len(df)} rows to {self.path}: {name}")
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        write_table(table, f"{self.fragments_path}/{name}")
+        return True
+
+    def fragment_paths(self):
+        """
+        The paths of the upserted fragments on the platform file system, oldest first
+        """
+        filesystem, path = Parquet(self.fragments_path).dataset_filesystem()
+        return sorted(x.path for x in list_data_files(filesystem, path, path))
+
+    def read_upserted(self, filters=None, columns=None, schema=None, fragments=None):
+        """
+        Read the keyed dataset: the file at the path, then its fragments in the order
+        they were upserted, the rows of a key replacing those of the same key before.
+        The filters can only be on the keys, not to bring back replaced rows.
+        Args:
+        - fragments (list): The fragment paths to read, all of them by default
+        """
+        keys = PARQUET_UPSERT_KEYS[self.path]
+        if filters and not all(x[0] in keys for x in filters):
+            raise ValueError(f"Filters of {self.path} must be on its keys {keys}")
+        read_columns = None
+        if columns is not None:
+            read_columns = list(dict.fromkeys([*keys, *columns]))
+        if fragments is None:
+            fragments = self.fragment_paths()
+
+        def read_source(path):
+            try:
+                return Parquet(path).read_dataset(filters, read_columns, schema)
+            except FileNotFoundError:
+                return pa.table({})
+
+        tables = PARQUET_WRITE_POOL.map(read_source, [self.path, *fragments])
+        dfs = [x.to_pandas().assign(_source=i) for i, x in enumerate(tables)]
+        dfs = [x for x in dfs if not x.empty]
+        if not dfs:
+            return pd.DataFrame()
+        df = pd.concat(dfs, ignore_index=True)
+        last_source = df.groupby(keys, dropna=False, sort=False)._source.transform(
+            "max"
+        )
+        df = df[df._source == last_source].drop(columns="_source")
+        df = df.reset_index(drop=True)
+        return df if columns is None else df.loc[:, columns]
+
+    def merge_fragments(self, min_files=None):
+        """
+        Rewrite the file of the keyed dataset with its fragments, then remove them.
+        The file is replaced at once, and until the fragments are removed a reader
+        gets the same rows from them. The fragments upserted meanwhile are kept.
+        Returns:
+        - int: The number of fragments merged
+        """
+        fragments = self.fragment_paths()
+        if len(fragments) < (min_files or PARQUET_COMPACTION_MIN_FILES):
+            return 0
+        log(f"Merging {len(fragments)} fragments into {self.path}")
+        df = self.read_upserted(fragments=fragments)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        replace_file(table, self.path, PLATFORM.fs, compression=PARQUET_COMPRESSION)
+        self.remove_fragments(fragments)
+        return len(fragments)
+
+    def remove_fragments(self, fragments):
+        """
+        Remove the given upserted fragments, once the file at the path holds their rows
+        """
+        if not fragments:
+            return
+        filesystem, _ = Parquet(self.fragments_path).dataset_filesystem()
+        for fragment in fragments:
+            filesystem.delete_file(fragment)
+
+    def compact(self, min_files=None, compression=None, row_group_size=None):
+        """
+        Coalesce the files of each leaf partition holding at least min_files of them
+        into one PARTITION_FILE_NAME, of row groups of row_group_size rows, keeping the
+        hive layout. The compacted file replaces the one of that name at once, then the
+        other merged files are removed: a reader listing the leaf in between may see
+        their rows twice, but never misses any. The files written to the leaf after
+        it was listed are kept. A keyed dataset has its fragments merged instead.
+        Args:
+        - min_files (int): Files from which a leaf is compacted, PARQUET_COMPACTION_MIN_FILES by default
+        - compression (str): zstd, snappy or gzip, PARQUET_COMPRESSION by default
+        - row_group_size (int): Rows per row group, PARQUET_ROW_GROUP_SIZE by default
+        Returns:
+        - int: The number of files removed
+        """
+        if self.path in PARQUET_UPSERT_KEYS:
+            return self.merge_fragments(min_files=min_files)
+        min_files = min_files or PARQUET_COMPACTION_MIN_FILES
+        filesystem, path = self.dataset_filesystem()
+        leaves = {}
+        for file_info in list_data_files(filesystem, path, path):
+            leaves.setdefault(os.path.dirname(file_info.path), []).append(file_info)
+        leaves = {k: v for k, v in leaves.items() if len(v) >= min_files}
+        log(f"Compacting {len(leaves)} partitions of {self.path}")
+        futures = [
+            PARQUET_WRITE_POOL.submit(
+                compact_files,
+                filesystem,
+                files,
+                f"{leaf}/{PARTITION_FILE_NAME}",
+                compression or PARQUET_COMPRESSION,
+                row_group_size or PARQUET_ROW_GROUP_SIZE,
+            )
+            for leaf, files in leaves.items()
+        ]
+        entries, removed = [], []
+        for future in futures:
+            compacted_path, rows, merged_paths = future.result()
+            entries.append((compacted_path[len(path) :].strip("/"), rows))
+            removed += [x[len(path) :].strip("/") for x in merged_paths]
+        if entries:
+            self.update_manifest(entries, removed=removed)
+        n_removed = len(removed) - len(entries)
+        log(
+            f"Compacted {len(entries)} partitions of {self.path}: {n_removed} files less"
+        )
+        return n_removed
+
+    def dataset_filesystem(self):
+        """
+        The pyarrow file system of the platform and the path of the dataset on it
+        """
+        if PLATFORM.fs is None:
+            return pafs.LocalFileSystem(), os.path.abspath(self.path)
+        filesystem = pafs.PyFileSystem(pafs.FSSpecHandler(PLATFORM.fs))
+        return filesystem, self.path.split("://")[-1]
+
+    def manifest_paths(self, manifest_df, filters):
+        """
+        Paths of the files of the manifest whose partitions can match the = and in
+        filters on the partition columns
+        """
+        keep = pd.Series(True, index=manifest_df.index)
+        for col in PARQUET_PARTITION_COLS.get(self.path, []):
+            values = _equality_values(filters, col)
+            if values is None or col not in manifest_df:
+                continue
+            encoded = self.encode_partition_values(pd.Series(values, dtype=object))
+            decoded = manifest_df[col].fillna(HIVE_NULL_PARTITION)
+            keep &= decoded.map(self.sanitise_name).isin(encoded)
+        return manifest_df.path[keep].tolist()
+
+    def partition_prefixes(self, path, filters):
+        """
+        Directories of the partitions that can match the filters: one per combination
+        of the values of the leading partition columns with = or in filters
+        """
+        prefixes = [path]
+        for col in PARQUET_PARTITION_COLS.get(self.path, []):
+            values = _equality_values(filters, col)
+            if values is None:
+                break
+            encoded = self.encode_partition_values(pd.Series(values, dtype=object))
+            prefixes = [f"{x}/{col}={y}" for x in prefixes for y in encoded]
+        return prefixes
+
     def generate_filters(self, filters):
         """Generate the filters"""
         if filters is None:
@@ -192,6 +564,8 @@ class Parquet:
         if (not filters) or df.empty:
             return df
         for c, c_type in [(x[0], type(x[1])) for x in filters]:
+            if c not in df:
+                continue  # Not in the columns read
             df[c] = df[c].astype(c_type)
             if replace_underscore and (c_type == str):
                 df[c] = df[c].str.replace("_", " ")
@@ -199,8 +573,12 @@ class Parquet:
 
     def get_partitions_df(self):
         """
-        Get the partitions of the parquet file
+        Get the partitions of the parquet file, from its manifest if it has one
         """
+        manifest_df = self.read_manifest()
+        if manifest_df is not None:
+            df = manifest_df.drop(columns=MANIFEST_COLUMNS).drop_duplicates()
+            return df.reset_index(drop=True)
         all_partition_paths = self.get_all_partition_paths()
         all_partitions = [x.split("/") for x in all_partition_paths]
         all_partitions = [
@@ -224,32 +602,138 @@ class Parquet:
         Get the partitions of the parquet file without reading the files
         """
         glob_query = os.path.join(self.path, "*")
-        all_paths = PLATFORM.glob(glob_query)
+        all_paths = _data_paths(PLATFORM.glob(glob_query))
         while all_paths:
             glob_query = all_paths[0] + "/*"
-            all_paths = PLATFORM.glob(glob_query)
+            all_paths = _data_paths(PLATFORM.glob(glob_query))
         glob_query = glob_query.split("/")
         partition_path = [x.split("=")[0] for x in glob_query if "=" in x]
         return partition_path
 
 
-def to_parquet(
-    df,
-    path: str,
-    engine: str = "pyarrow",
-    compression: str = "gzip",
-    index: bool = False,
-    schema: pa.Schema = None,
-):
-    df.to_parquet(
+def _is_data_file(file_path, root):
+    # Skips the hidden and the metadata files and directories, as pyarrow does
+    parts = file_path[len(root) :].split("/")
+    return not any(x.startswith((".", "_")) for x in parts if x)
+
+
+def list_data_files(filesystem, prefix, root):
+    """
+    The data files under the prefix of the dataset at root, as pyarrow FileInfo
+    """
+    selector = pafs.FileSelector(prefix, recursive=True, allow_not_found=True)
+    return [
+        x
+        for x in filesystem.get_file_info(selector)
+        if x.type == pafs.FileType.File and _is_data_file(x.path, root)
+    ]
+
+
+def compact_files(filesystem, files, path, compression, row_group_size):
+    """
+    Merge the files into the one at path, in the order they were written, and remove
+    the others
+    Returns:
+    - tuple: The path, its rows and the paths of the merged files
+    """
+    files = sorted(files, key=lambda x: x.mtime)
+    table = pa.concat_tables(
+        [pq.read_table(filesystem.open_input_file(x.path)) for x in files],
+        promote_options="default",
+    )
+    replace_file(
+        table,
         path,
-        engine=engine,
+        filesystem,
         compression=compression,
-        index=index,
-        schema=schema,
+        row_group_size=row_group_size,
+    )
+    for file_info in files:
+        if file_info.path != path:
+            filesystem.delete_file(file_info.path)
+    return path, table.num_rows, [x.path for x in files]
+
+
+def _data_paths(paths):
+    # Skips the manifest and the other hidden files of a glob
+    return [x for x in paths if not os.path.basename(x).startswith((".", "_"))]
+
+
+def manifest_entries(paths, rows=None, written_at=None):
+    """
+    Manifest entries of the files at the paths relative to a dataset, with the
+    decoded values of their partitions
+    """
+    partitions = [
+        dict(
+            (col, unquote(val))
+            for col, _, val in (x.partition("=") for x in path.split("/"))
+            if val
+        )
+        for path in paths
+    ]
+    entries_df = pd.DataFrame(
+        {
+            "path": pd.Series(paths, dtype=object),
+            "rows": pd.Series(rows, index=range(len(paths)), dtype="Int64"),
+            "written_at": pd.Series(
+                written_at, index=range(len(paths)), dtype="datetime64[ns, UTC]"
+            ),
+        }
+    )
+    return pd.concat([entries_df, pd.DataFrame(partitions, dtype=object)], axis=1)
+
+
+def _equality_values(filters, col):
+    """
+    The values col can take under = and in filters, None if it is not restricted
+    """
+    if not filters or not all(isinstance(x, tuple) for x in filters):
+        return None  # No filters, or disjunctions of them
+    values = None
+    for column, op, value in filters:
+        if column != col or op not in ["=", "==", "in"]:
+            continue
+        value = list(value) if op == "in" else [value]
+        values = value if values is None else [x for x in values if x in value]
+    return values
+
+
+def write_table(table, path, compression=None, row_group_size=None):
+    """
+    Write an arrow table to one Parquet file of the platform file system.
+    The directories are only made locally: an object store has none.
+    """
+    if PLATFORM.name == "Local":
+        PLATFORM.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    pq.write_table(
+        table,
+        path,
+        compression=compression or PARQUET_COMPRESSION,
+        row_group_size=row_group_size,
+        filesystem=PLATFORM.fs,
     )
 
 
+def replace_file(table, path, filesystem=None, **kwargs):
+    """
+    Write an arrow table over the file at path at once: an object is replaced atomically
+    by its upload, and a local file by renaming a complete one over it
+    """
+    if PLATFORM.name != "Local":
+        pq.write_table(table, path, filesystem=filesystem, **kwargs)
+        return
+    temp_path = f"{os.path.dirname(path) or '.'}/_{uuid.uuid4()}.parquet"
+    pq.write_table(table, temp_path, filesystem=filesystem, **kwargs)
+    os.replace(temp_path, path)
+
+
+# Initialised process-wide pool of the partition writes
+PARQUET_WRITE_POOL = ThreadPoolExecutor(max_workers=PARQUET_WRITE_WORKERS)
+# Initialised process-wide lock of the read-modify-write of the manifests
+MANIFEST_LOCK = threading.Lock()
+
+
 if __name__ == "__main__":
     Parquet(PRODUCTIONS_PARQUET_LOCATION).read(
         columns=["productionId", "title", "date", "time", "performanceId"],
@@ -0,0 +1,202 @@
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from cloud.utils import log
+from python_roh.src.config import (
+    HTTP_RATE_LIMIT,
+    HTTP_RATE_BURST,
+    HTTP_MIN_RATE_LIMIT,
+    HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_BASE,
+    HTTP_BACKOFF_MAX,
+    HTTP_RETRY_STATUSES,
+)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket whose rate adapts to the origin:
+    it halves on every throttled response and recovers additively on every success.
+    """
+
+    def __init__(self, rate, capacity, min_rate=HTTP_MIN_RATE_LIMIT):
+        """
+        Args:
+        - rate (float): Maximum sustained requests per second
+        - capacity (int): Maximum burst of requests
+        - min_rate (float): Floor of the rate when the origin keeps throttling
+        """
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token and return how long to wait before using it
+        """
+        with self._lock:
+            now = time.monotonic()
+            refill = (now - self.updated) * self.rate
+            self.tokens = min(self.capacity, self.tokens + refill)
+            self.updated = now
+            self.tokens -= 1
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            return max(wait, self.paused_until - now)
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold every caller of this host back, e.g. for a Retry-After"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def on_throttled(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + 0.1)
+
+
+class RateLimiter:
+    """
+    Shared per-host rate limiting and retry policy for all the outbound HTTP calls.
+    Requests wait for a token of their host's bucket, and the responses with a status in
+    HTTP_RETRY_STATUSES (or a connection error) are retried with jittered exponential
+    backoff, honouring Retry-After when the server sends it.
+
+    Examples:
+    - RATE_LIMITER.call(lambda: session.get(url), url, (requests.ConnectionError,))
+    - await RATE_LIMITER.acall(lambda: client.get(url), url, (httpx.TransportError,))
+    """
+
+    def __init__(
+        self,
+        rate=HTTP_RATE_LIMIT,
+        burst=HTTP_RATE_BURST,
+        max_retries=HTTP_MAX_RETRIES,
+        backoff_base=HTTP_BACKOFF_BASE,
+        backoff_max=HTTP_BACKOFF_MAX,
+        retry_statuses=HTTP_RETRY_STATUSES,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_statuses = set(retry_statuses)
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            return self.buckets[host]
+
+    def call(self, send, url, retry_exceptions=()):
+        """
+        Call send() under the rate limit of the url's host, retrying as needed
+        """
+        bucket = self.bucket(url)
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            try:
+                response = send()
+            except retry_exceptions as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                log(f"Retrying {url} in {delay:.1f}s after {type(e).__name__}")
+                time.sleep(delay)
+                continue
+            delay = self._on_response(bucket, response, attempt)
+            if delay is None:
+                return response
+            log(f"Retrying {url} in {delay:.1f}s after {response.status_code}")
+            response.close()  # Returns a streamed response's connection to the pool
+            time.sleep(delay)
+        return response
+
+    async def acall(self, send, url, retry_exceptions=()):
+        """
+        Asyncio counterpart of call(): send() returns an awaitable
+        """
+        bucket = self.bucket(url)
+        for attempt in range(self.max_retries + 1):
+            await bucket.aacquire()
+            try:
+                response = await send()
+            except retry_exceptions as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                log(f"Retrying {url} in {delay:.1f}s after {type(e).__name__}")
+                await asyncio.sleep(delay)
+                continue
+            delay = self._on_response(bucket, response, attempt)
+            if delay is None:
+                return response
+            log(f"Retrying {url} in {delay:.1f}s after {response.status_code}")
+            await response.aclose()
+            await asyncio.sleep(delay)
+        return response
+
+    def _on_response(self, bucket, response, attempt):
+        """
+        Return None if the response is final, else the delay before the next attempt
+        """
+        if response.status_code not in self.retry_statuses:
+            bucket.on_success()
+            return None
+        if response.status_code == 429:
+            bucket.on_throttled()
+        if attempt == self.max_retries:
+            return None
+        retry_after = self._retry_after(response)
+        if retry_after is not None:
+            bucket.pause(retry_after)
+            return min(retry_after, self.backoff_max)
+        return self._backoff(attempt)
+
+    def _backoff(self, attempt):
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def _retry_after(self, response):
+        """Parse a Retry-After header given either in seconds or as an HTTP date"""
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, retry_at.timestamp() - time.time())
+
+
+# Initialised process-wide rate limiter
+RATE_LIMITER = RateLimiter()
@@ -0,0 +1,129 @@
+import sys
+import time
+import random
+import pandas as pd
+
+from python_roh.src.dtypes import compact_dtypes, frame_memory
+from python_roh.src.src import pre_process_df, join_seats_prices_zones
+from python_roh.src.config import (
+    SEATS_COMPACT_DTYPES,
+    EVENTS_COMPACT_DTYPES,
+    CASTS_COMPACT_DTYPES,
+    TICKETS_AND_EVENTS_URL,
+)
+from various.benchmarks.benchmark_seats_join import fake_payloads
+
+"""
+Memory of the seats, events and casts frames with their default dtypes and with the
+compact dtype policy, and the CPU time of the compaction. The frames are synthetic,
+shaped like the stored ones: a season of events, the casts of its past performances
+and the joined seats of one performance.
+Usage: python -m various.benchmarks.benchmark_compact_dtypes [n_seasons]
+"""
+
+N_PRODUCTIONS = 40
+N_PERFORMANCES = 12
+N_CAST = 30
+REPEATS = 20
+
+
+def fake_events_df(n_seasons=1, seed=0):
+    rnd = random.Random(seed)
+    rows = []
+    start = pd.Timestamp("2024-09-01 19:30", tz="Europe/London")
+    for production_id in range(N_PRODUCTIONS * n_seasons):
+        title = f"Production {production_id}"
+        slug = f"production-{production_id}"
+        location = rnd.choice(["Main Stage", "Linbury Theatre", "Clore Studio"])
+        for i in range(N_PERFORMANCES):
+            timestamp = start + pd.Timedelta(days=rnd.randint(0, 300 * n_seasons))
+            rows.append(
+                {
+                    "type": "events",
+                    "productionId": 10000 + production_id,
+                    "sourceType": "production",
+                    "carouselDescription": f"{title} description",
+                    "slug": slug,
+                    "isHiddenFromTicketsAndEvents": rnd.choice([False, None]),
+                    "performanceType": rnd.choice(["Opera", "Ballet"]),
+                    "timestamp": timestamp,
+                    "day": timestamp.day_name(),
+                    "url": f"{TICKETS_AND_EVENTS_URL}/{slug}-dates",
+                    "performanceId": str(100000 + production_id * 100 + i),
+                    "location": location,
+                    "date": timestamp.date(),
+                    "time": timestamp.time(),
+                    "title": title,
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def fake_casts_df(events_df, seed=0):
+    rnd = random.Random(seed)
+    rows = [
+        {
+            "role": f"Role {i}",
+            "name": f"Artist {rnd.randint(0, 400)}",
+            "is_replacing": False,
+            "replaced_name": None,
+            "url": f"https://www.rbo.org.uk/api/account-activities?ids={event.performanceId}",
+            "performance_id": event.performanceId,
+            "slug": event.slug,
+            "season_id": None,
+            "title": event.title,
+            "timestamp": event.timestamp,
+        }
+        for event in events_df.itertuples()
+        for i in range(N_CAST)
+    ]
+    return pd.DataFrame(rows)
+
+
+def fake_seats_df():
+    seats, prices, zones = fake_payloads([1])
+    seats_df = pd.DataFrame(seats).rename(columns={"Id": "SeatId"})
+    seats_df = seats_df.assign(SeatName=seats_df.SeatRow + seats_df.SeatNumber)
+    seats_price_df = join_seats_prices_zones(
+        seats_df, pd.DataFrame(prices), pre_process_df(zones, "zone_ids")
+    )
+    return seats_price_df.assign(
+        SeatStatusStr=seats_price_df.SeatStatusId.astype(str) + " (A)",
+        seat_available=seats_price_df.SeatStatusId == 0,
+    )
+
+
+def _values(df):
+    """The values of df as objects, with None for all the missing ones"""
+    return df.astype(object).where(df.notnull(), None)
+
+
+def cpu_time(fun, *args):
+    """Mean CPU time of fun over REPEATS calls"""
+    start = time.process_time()
+    for _ in range(REPEATS):
+        fun(*args)
+    return (time.process_time() - start) / REPEATS
+
+
+def benchmark_compact_dtypes(n_seasons=1):
+    events_df = fake_events_df(n_seasons)
+    frames = {
+        "seats": (fake_seats_df(), SEATS_COMPACT_DTYPES),
+        "events": (events_df, EVENTS_COMPACT_DTYPES),
+        "casts": (fake_casts_df(events_df), CASTS_COMPACT_DTYPES),
+    }
+    for name, (df, policy) in frames.items():
+        compact_df = compact_dtypes(df, policy)
+        pd.testing.assert_frame_equal(_values(df), _values(compact_df))
+        before, after = frame_memory(df), frame_memory(compact_df)
+        print(
+            f"{name}: {len(df)} rows, {before:.2f} MiB -> {after:.2f} MiB "
+            f"({before / after:.1f}x smaller), "
+            f"compacted in {cpu_time(compact_dtypes, df, policy) * 1000:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    benchmark_compact_dtypes(int(args[0]) if args else 1)
@@ -0,0 +1,173 @@
+import sys
+import json
+import time
+import pandas as pd
+
+from tools import FixtureStore
+from python_roh.src.config import ALL_EVENTS_URL
+from python_roh.src.src import _pre_process_events_df, adhoc_performance_id
+from python_roh.upcoming_events import get_locations_df, get_performances_df
+
+"""
+Benchmark of the columnar events normalization against the former apply(pd.Series) chain,
+on the recorded events payload scaled 1x/10x/100x.
+Record the payload first with: HTTP_REPLAY_MODE=record python main.py events
+Usage: python -m various.benchmarks.benchmark_events_normalization [payload.json]
+"""
+
+SCALES = [1, 10, 100]
+REPEATS = 3
+
+
+def legacy_pre_process_events_df(input_json):
+    events_df = pd.DataFrame(input_json["data"])
+    included_df = pd.DataFrame(input_json["included"])
+    events_attrs = events_df.attributes.apply(pd.Series)
+    events_attrs.drop(
+        columns=[
+            "description",
+            "dateFieldOverride",
+            "imageResult",
+            "imageTray",
+            "productionPageUrl",
+            "helpInformation",
+        ],
+        inplace=True,
+    )
+    events_rels = events_df.relationships.apply(pd.Series)
+    events_df = pd.concat([events_df, events_attrs, events_rels], axis=1)
+    events_df.query("isCancelled != True", inplace=True)
+    events_df.drop(
+        columns=[
+            "attributes",
+            "relationships",
+            "isCancelled",
+            "ctaBehaviour",
+            "cinemaBroadcastLink",
+        ],
+        inplace=True,
+    )
+    events_df.query("performances not in [[]]", inplace=True)
+    events_df.reset_index(drop=True, inplace=True)
+    events_df = events_df.explode("performances", ignore_index=True)
+    events_df.locations = events_df.locations.apply(lambda x: x["data"])
+    events_df = events_df.explode("locations", ignore_index=True)
+    events_df.locations = events_df.locations.apply(lambda x: x["id"])
+    events_df.rename(
+        columns={"locations": "locationId", "id": "productionId"}, inplace=True
+    )
+    return events_df, included_df
+
+
+def legacy_get_locations_df(included_df):
+    locations_df = included_df.query("type == 'locations'").drop(
+        columns=["type", "relationships"]
+    )
+    locations_attrs = locations_df.attributes.apply(pd.Series)
+    locations_df = pd.concat([locations_df, locations_attrs], axis=1)
+    locations_df.drop(columns=["attributes"], inplace=True)
+    locations_df.reset_index(drop=True, inplace=True)
+    locations_df.rename(columns={"id": "locationId", "title": "location"}, inplace=True)
+    return locations_df
+
+
+def legacy_get_performances_df(events_df):
+    performances_df = events_df.performances.apply(pd.Series)
+    performances_df = performances_df.assign(
+        timestamp=pd.to_datetime(performances_df.date, utc=True)
+    )
+    performances_df.timestamp = performances_df.timestamp.dt.tz_convert("Europe/London")
+    return performances_df
+
+
+def legacy_adhoc_performance_id(events_df):
+    return events_df.apply(lambda x: f"{x.productionId}-{x.date}-{x.time}", axis=1)
+
+
+def normalize(payload, pre_process, get_locations, get_performances, adhoc_id):
+    """
+    The normalization steps of handle_upcoming_events, up to the adhoc performance ids
+    """
+    events_df, included_df = pre_process(payload)
+    locations_df = get_locations(included_df)
+    events_df = events_df.merge(locations_df, on="locationId", how="left")
+    performances_df = get_performances(events_df)
+    events_df = pd.concat([events_df, performances_df], axis=1)
+    events_df.drop(columns=["performances", "date"], inplace=True)
+    events_df["date"] = events_df.timestamp.dt.date
+    events_df["time"] = events_df.timestamp.dt.time
+    return events_df.assign(adhoc_performance_id=adhoc_id(events_df))
+
+
+def scale_payload(payload, factor):
+    """
+    Repeat the events factor times, with distinct production ids
+    """
+    data = []
+    for k in range(factor):
+        for event in payload["data"]:
+            event_id = event["id"]
+            if k and event_id.isdigit():
+                event_id = str(int(event_id) + k * 10**7)
+            data.append({**event, "id": event_id})
+    return {**payload, "data": data}
+
+
+def load_payload(path=None):
+    if path is not None:
+        with open(path, "r") as f:
+            return json.load(f)
+    fixture = FixtureStore().load("GET", ALL_EVENTS_URL)
+    if fixture is None:
+        raise FileNotFoundError(f"No recorded fixture of {ALL_EVENTS_URL}")
+    return json.loads(fixture[2])
+
+
+def best_time(fun, *args):
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fun(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_events_normalization(path=None):
+    payload = load_payload(path)
+    legacy = (
+        legacy_pre_process_events_df,
+        legacy_get_locations_df,
+        legacy_get_performances_df,
+        legacy_adhoc_performance_id,
+    )
+    columnar = (
+        _pre_process_events_df,
+        get_locations_df,
+        get_performances_df,
+        adhoc_performance_id,
+    )
+    pd.testing.assert_frame_equal(
+        normalize(payload, *legacy), normalize(payload, *columnar)
+    )
+    results = []
+    for factor in SCALES:
+        scaled = scale_payload(payload, factor)
+        legacy_time = best_time(normalize, scaled, *legacy)
+        columnar_time = best_time(normalize, scaled, *columnar)
+        results.append(
+            {
+                "scale": f"{factor}x",
+                "events": len(scaled["data"]),
+                "legacy_s": round(legacy_time, 3),
+                "columnar_s": round(columnar_time, 3),
+                "speedup": round(legacy_time / columnar_time, 1),
+            }
+        )
+    results = pd.DataFrame(results)
+    print(results.to_string(index=False))
+    return results
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    benchmark_events_normalization(args[0] if args else None)
@@ -0,0 +1,103 @@
+import sys
+import time
+import tempfile
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from tools.parquet import Parquet
+from python_roh.src.config import (
+    EVENTS_PARTITION_COLS,
+    PRODUCTIONS_PARTITION_COLS,
+    PARQUET_PARTITION_COLS,
+    EVENTS_PYARROW_SCHEMA,
+)
+from various.benchmarks.benchmark_compact_dtypes import fake_events_df
+
+"""
+Files listed and opened, and wall time, of the small lookups of the events and
+productions datasets (load_seen_events_df, print_performance_info) with the direct
+dataset read of Parquet.read, against pq.read_table of the whole tree (the former
+direct path, which also read all the columns). The print_performance_info lookup
+filters on the last partition column, so its files are picked from the manifest. The datasets are synthetic and written
+to a temporary directory, in their hive layouts.
+Usage: python -m various.benchmarks.benchmark_parquet_read [n_seasons]
+"""
+
+REPEATS = 5
+
+
+def wall_time(fun, *args, **kwargs):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        fun(*args, **kwargs)
+    return (time.perf_counter() - start) / REPEATS
+
+
+def write_datasets(root, n_seasons):
+    events_df = fake_events_df(n_seasons)
+    events_df = events_df.assign(timestamp=events_df.timestamp.astype("int64") // 10**6)
+    events_path, productions_path = f"{root}/events", f"{root}/productions"
+    Parquet(events_path).write(events_df, partition_cols=EVENTS_PARTITION_COLS)
+    productions_df = events_df.loc[
+        :, ["title", "productionId", "date", "time", "performanceId", "timestamp"]
+    ].astype({"performanceId": int})
+    Parquet(productions_path).write(
+        productions_df, partition_cols=PRODUCTIONS_PARTITION_COLS
+    )
+    PARQUET_PARTITION_COLS[events_path] = EVENTS_PARTITION_COLS
+    PARQUET_PARTITION_COLS[productions_path] = PRODUCTIONS_PARTITION_COLS
+    return events_df, events_path, productions_path
+
+
+def lookup(name, path, filters, columns=None, schema=None, use_manifest=False):
+    parquet = Parquet(path)
+    _, dataset_path = parquet.dataset_filesystem()
+    full = ds.dataset(dataset_path, partitioning="hive", schema=schema)
+    manifest_df = parquet.read_manifest() if use_manifest else None
+    if manifest_df is None:
+        listed = sum(
+            len(ds.dataset(x, schema=schema).files)
+            for x in parquet.partition_prefixes(dataset_path, filters)
+        )
+        route = f"listed {listed} of {len(full.files)} files"
+    else:
+        picked = len(parquet.manifest_paths(manifest_df, filters))
+        route = f"picked {picked} of {len(manifest_df)} files from the manifest"
+    expression = pq.filters_to_expression(filters)
+    opened = len(list(full.get_fragments(filter=expression)))
+    args = (filters, columns, schema, manifest_df)
+    direct = wall_time(lambda: parquet.read_dataset(*args))
+    whole = wall_time(pq.read_table, path, filters=filters, schema=schema)
+    rows = parquet.read_dataset(*args).num_rows
+    print(
+        f"{name}: {rows} rows; {route}, opened {opened}; {direct * 1000:.0f} ms, "
+        f"against {whole * 1000:.0f} ms for pq.read_table of all the columns"
+    )
+
+
+def benchmark_parquet_read(n_seasons=1):
+    with tempfile.TemporaryDirectory() as root:
+        events_df, events_path, productions_path = write_datasets(root, n_seasons)
+        main_stage_ids = events_df.query("location == 'Main Stage'").performanceId
+        lookup(
+            "load_seen_events_df",
+            events_path,
+            [
+                ("location", "=", "Main Stage"),
+                ("title", "!=", "Friends Rehearsals"),
+                ("performanceId", "in", main_stage_ids.iloc[:20].tolist()),
+            ],
+            schema=EVENTS_PYARROW_SCHEMA,
+        )
+        lookup(
+            "print_performance_info",
+            productions_path,
+            [("performanceId", "in", [int(main_stage_ids.iloc[0])])],
+            columns=["title", "date", "time", "performanceId"],
+            use_manifest=True,
+        )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    benchmark_parquet_read(int(args[0]) if args else 1)
@@ -0,0 +1,242 @@
+import io
+import sys
+import time
+import threading
+import shutil
+import tempfile
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+import tools.parquet
+from tools.parquet import Parquet, manifest_entries
+from various.benchmarks.benchmark_compact_dtypes import fake_events_df
+
+"""
+Throughput of the partitioned Parquet writes of an events-shaped frame (the partitions
+of EVENTS_PARQUET_LOCATION: location, date, time and title), with pyarrow's
+write_to_dataset (the former single-threaded path) and with Parquet.write for each codec.
+On the local disk, and on an in-memory object store taking latency seconds to store
+each file, standing for GCS (no directories are made there).
+Usage: python -m various.benchmarks.benchmark_parquet_write [n_seasons] [latency]
+"""
+
+PARTITION_COLS = ["location", "date", "time", "title"]
+CODECS = ["zstd", "snappy", "gzip"]
+
+
+class LatencyStore(pafs.FileSystemHandler):
+    """
+    Object store keeping the files in memory, taking latency seconds to store each one
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.objects = {}
+        self.dirs_made = 0
+
+    def get_type_name(self):
+        return "latency-store"
+
+    def normalize_path(self, path):
+        return path
+
+    def create_dir(self, path, recursive):
+        self.dirs_made += 1
+
+    def get_file_info(self, paths):
+        return [
+            (
+                pafs.FileInfo(x, pafs.FileType.File, size=len(self.objects[x]))
+                if x in self.objects
+                else pafs.FileInfo(x, pafs.FileType.NotFound)
+            )
+            for x in paths
+        ]
+
+    def open_output_stream(self, path, metadata):
+        store = self
+
+        class Upload(io.BytesIO):
+            def close(self):
+                time.sleep(store.latency)
+                store.objects[path] = self.getvalue()
+                super().close()
+
+        return pa.PythonFile(Upload(), mode="w")
+
+    def get_file_info_selector(self, selector):
+        raise NotImplementedError
+
+    def delete_dir(self, path):
+        raise NotImplementedError
+
+    def delete_dir_contents(self, path, missing_dir_ok=False):
+        pass
+
+    def delete_root_dir_contents(self):
+        raise NotImplementedError
+
+    def delete_file(self, path):
+        raise NotImplementedError
+
+    def move(self, src, dest):
+        raise NotImplementedError
+
+    def copy_file(self, src, dest):
+        raise NotImplementedError
+
+    def open_input_stream(self, path):
+        return pa.BufferReader(self.objects[path])
+
+    def open_input_file(self, path):
+        return pa.BufferReader(self.objects[path])
+
+    def open_append_stream(self, path, metadata):
+        raise NotImplementedError
+
+    def __eq__(self, other):
+        return self is other
+
+    def __ne__(self, other):
+        return self is not other
+
+
+class LatencyPlatform:
+    """
+    GCP-like platform over a LatencyStore, which cannot be listed: the manifests start
+    empty, and are written if unchanged since read, by their generations, as on GCS
+    """
+
+    name = "GCP"
+
+    def __init__(self, store):
+        self.store = store
+        self.fs = pafs.PyFileSystem(store)
+        self.generations = {}
+        self._lock = threading.Lock()
+
+    def read_generation(self, path):
+        with self._lock:
+            if path in self.store.objects:
+                return self.store.objects[path], self.generations[path]
+        table = pa.Table.from_pandas(manifest_entries([]), preserve_index=False)
+        sink = pa.BufferOutputStream()
+        pq.write_table(table, sink)
+        return sink.getvalue().to_pybytes(), 0
+
+    def write_if_generation(self, path, data, generation):
+        time.sleep(self.store.latency)
+        with self._lock:
+            if self.generations.get(path, 0) != generation:
+                return False
+            self.store.objects[path] = data
+            self.generations[path] = generation + 1
+        return True
+
+
+def wall_time(fun, *args, **kwargs):
+    start = time.perf_counter()
+    fun(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def report(name, seconds, n_rows, n_files, n_bytes):
+    print(
+        f"  {name:<24} {seconds * 1000:8.1f} ms  {n_files / seconds:8.0f} files/s  "
+        f"{n_rows / seconds:9.0f} rows/s  {n_bytes / 2**10:7.0f} KiB"
+    )
+
+
+def benchmark_local(events_df):
+    print(f"Local disk, {len(events_df)} events")
+    root = tempfile.mkdtemp()
+    try:
+        path = f"{root}/write_to_dataset"
+        seconds = wall_time(
+            pq.write_to_dataset,
+            pa.Table.from_pandas(events_df),
+            path,
+            partition_cols=PARTITION_COLS,
+            basename_template="{i}.parquet",
+            # Beyond 1024 partitions, as in more than a season of events, it raises
+            max_partitions=len(events_df),
+        )
+        report("write_to_dataset", seconds, len(events_df), *dir_size(path))
+        for codec in CODECS:
+            path = f"{root}/{codec}"
+            parquet = Parquet(path)
+            seconds = wall_time(
+                parquet.write,
+                events_df,
+                partition_cols=PARTITION_COLS,
+                compression=codec,
+            )
+            report(f"Parquet.write {codec}", seconds, len(events_df), *dir_size(path))
+            assert pq.read_table(path).num_rows == len(events_df)
+    finally:
+        shutil.rmtree(root)
+
+
+def benchmark_object_store(events_df, latency):
+    print(
+        f"Object store taking {latency * 1000:.0f} ms per file, {len(events_df)} events"
+    )
+    store = LatencyStore(latency)
+    platform = tools.parquet.PLATFORM
+    tools.parquet.PLATFORM = LatencyPlatform(store)
+    try:
+        seconds = wall_time(
+            pq.write_to_dataset,
+            pa.Table.from_pandas(events_df),
+            "bucket/write_to_dataset",
+            partition_cols=PARTITION_COLS,
+            basename_template="{i}.parquet",
+            # Beyond 1024 partitions, as in more than a season of events, it raises
+            max_partitions=len(events_df),
+            filesystem=pafs.PyFileSystem(store),
+        )
+        report("write_to_dataset", seconds, len(events_df), *store_size(store))
+        for codec in CODECS:
+            store.objects, store.dirs_made = {}, 0
+            parquet = Parquet(f"gs://bucket/{codec}")
+            seconds = wall_time(
+                parquet.write,
+                events_df,
+                partition_cols=PARTITION_COLS,
+                compression=codec,
+            )
+            assert store.dirs_made == 0
+            report(
+                f"Parquet.write {codec}", seconds, len(events_df), *store_size(store)
+            )
+    finally:
+        tools.parquet.PLATFORM = platform
+
+
+def dir_size(path):
+    files = [
+        x
+        for x in pafs.LocalFileSystem().get_file_info(
+            pafs.FileSelector(path, recursive=True)
+        )
+        if x.type == pafs.FileType.File
+    ]
+    return len(files), sum(x.size for x in files)
+
+
+def store_size(store):
+    return len(store.objects), sum(len(x) for x in store.objects.values())
+
+
+def benchmark_parquet_write(n_seasons=1, latency=0.03):
+    events_df = fake_events_df(n_seasons)
+    benchmark_local(events_df)
+    benchmark_object_store(events_df, latency)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    benchmark_parquet_write(
+        int(args[0]) if args else 1, float(args[1]) if len(args) > 1 else 0.03
+    )
@@ -0,0 +1,170 @@
+import sys
+import time
+import random
+import pandas as pd
+
+from python_roh.src.config import VIEW_FROM_SEAT_URL, ZONE_HIERARCHY, ZONE_MAPPING
+from python_roh.src.src import (
+    pre_process_df,
+    join_seats_prices_zones,
+    _merge_keys,
+)
+
+"""
+Micro-benchmark of the per-request CPU time of the seats pipeline: the pre-processing
+of the payloads and the seats/prices/zones join down to the cheapest price per seat,
+columnar against the former row-wise version with its full sort and drop_duplicates. The seat positions and statuses steps are
+shared by both and left out; the SeatsViewUrl now comes with the positions from the
+SeatGeometry, so it is only built by the row-wise version. The payloads are synthetic, of the size of the ROH hall.
+Usage: python -m various.benchmarks.benchmark_seats_join [n_performances]
+"""
+
+N_SEATS = 2256
+N_PRICE_TYPES = 8
+REPEATS = 20
+
+
+def fake_payloads(performance_ids, seed=0):
+    """
+    Seats, Prices and ZoneAvailabilities payloads shaped like the API ones
+    """
+    rnd = random.Random(seed)
+    zone_names = list(ZONE_HIERARCHY.keys()) + list(ZONE_MAPPING.keys())
+    zones = [
+        {
+            "AvailableCount": rnd.randint(0, 50),
+            "Zone": {
+                "Id": zone_id,
+                "Description": name,
+                "AliasDescription": name,
+                "ZoneGroup": {"Id": 100 + zone_id, "Description": name},
+            },
+        }
+        for zone_id, name in enumerate(zone_names, start=1)
+    ]
+    seats = [
+        {
+            "Id": seat_id,
+            "SeatRow": chr(ord("A") + seat_id // 40 % 26),
+            "SeatNumber": str(seat_id % 40 + 1),
+            "ScreenId": seat_id // 200,
+            "SectionId": seat_id // 100,
+            "SeatStatusId": rnd.choice([0, 0, 0, 3, 4, 7]),
+            "ZoneId": seat_id % len(zones) + 1,
+        }
+        for seat_id in range(N_SEATS)
+    ]
+    prices = [
+        {
+            "PerformanceId": performance_id,
+            "ZoneId": zone["Zone"]["Id"],
+            "PriceTypeId": price_type_id,
+            "Price": float(rnd.choice([12, 25, 50, 95, 150, 250])),
+            "Enabled": rnd.random() > 0.1,
+        }
+        for performance_id in performance_ids
+        for zone in zones
+        for price_type_id in range(N_PRICE_TYPES)
+    ]
+    zones = [
+        {"PerformanceId": performance_id, **zone}
+        for performance_id in performance_ids
+        for zone in zones
+    ]
+    return seats, prices, zones
+
+
+def legacy_pre_process_seats_df(input_json):
+    seats_df = pd.DataFrame(input_json)
+    seats_df.rename(columns={"Id": "SeatId"}, inplace=True)
+    seats_df = seats_df.assign(SeatName=seats_df.SeatRow + seats_df.SeatNumber)
+    seat_slug = seats_df.apply(
+        lambda x: f"{x.SeatNumber}-{x.SeatRow}-{x.ScreenId}", axis=1
+    )
+    seats_view_url = seat_slug.apply(
+        lambda x: f"{VIEW_FROM_SEAT_URL}/seat-{x.replace(' ', '_')}.jpg"
+    )
+    return seats_df.assign(SeatsViewUrl=seats_view_url)
+
+
+def legacy_join_seats_prices_zones(seats_df, prices_df, zones_df):
+    seats_price_df = seats_df.merge(prices_df, on=_merge_keys(seats_df, prices_df))
+    seats_price_df = seats_price_df.merge(
+        zones_df, on=_merge_keys(seats_price_df, zones_df)
+    )
+    seats_price_df = seats_price_df.assign(
+        ZoneNameGeneral=seats_price_df.ZoneName.apply(lambda x: ZONE_MAPPING.get(x, x))
+    )
+    seats_price_df.query("ZoneNameGeneral in @ZONE_HIERARCHY.keys()", inplace=True)
+    return seats_price_df
+
+
+def legacy_pre_process_zone_df(input_json):
+    zone_availabilities_df = pd.DataFrame(input_json)
+    zones_df = zone_availabilities_df["Zone"].apply(pd.Series)
+    zones_df = zones_df.assign(PerformanceId=zone_availabilities_df.PerformanceId)
+    zones_df = zones_df.rename(columns={"Id": "ZoneId"})
+    _zone_groups = zones_df.ZoneGroup.apply(pd.Series)
+    zones_df = pd.concat([zones_df, _zone_groups], axis=1)
+    zones_df.drop(columns=["ZoneGroup", "Description"], inplace=True)
+    return zones_df.rename(
+        columns={"Id": "ZoneGroupId", "AliasDescription": "ZoneName"}
+    )
+
+
+def legacy_seats_pipeline(payloads):
+    seats, prices, zones = payloads
+    seats_df = legacy_pre_process_seats_df(seats)
+    prices_df = pre_process_df(prices, "prices")
+    zones_df = legacy_pre_process_zone_df(zones)
+    seats_price_df = legacy_join_seats_prices_zones(seats_df, prices_df, zones_df)
+    seats_price_df.sort_values(
+        by=["SeatId", "SectionId", "PerformanceId", "Price"], inplace=True
+    )
+    seats_price_df.drop_duplicates(
+        subset=["SeatId", "SectionId", "PerformanceId"], inplace=True
+    )
+    return seats_price_df.reset_index(drop=True)
+
+
+def columnar_seats_pipeline(payloads):
+    seats, prices, zones = payloads
+    seats_df = pre_process_df(seats, "seats")
+    prices_df = pre_process_df(prices, "prices")
+    zones_df = pre_process_df(zones, "zone_ids")
+    return join_seats_prices_zones(seats_df, prices_df, zones_df)
+
+
+def cpu_time(fun, *args):
+    """Mean CPU time of fun over REPEATS calls"""
+    start = time.process_time()
+    for _ in range(REPEATS):
+        fun(*args)
+    return (time.process_time() - start) / REPEATS
+
+
+def benchmark_seats_join(n_performances=1):
+    performance_ids = list(range(1, n_performances + 1))
+    payloads = fake_payloads(performance_ids)
+    legacy_df = legacy_seats_pipeline(payloads).drop(columns=["SeatsViewUrl"])
+    columnar_df = columnar_seats_pipeline(payloads)
+    # The columnar seats come with the compact dtypes, in the order of the payload
+    columnar_df = columnar_df.sort_values(["SeatId", "SectionId", "PerformanceId"])
+    pd.testing.assert_frame_equal(
+        legacy_df,
+        columnar_df.reset_index(drop=True).astype(legacy_df.dtypes.to_dict()),
+    )
+    legacy_time = cpu_time(legacy_seats_pipeline, payloads)
+    columnar_time = cpu_time(columnar_seats_pipeline, payloads)
+    print(
+        f"{N_SEATS} seats, {len(payloads[1])} prices: "
+        f"legacy {legacy_time * 1000:.1f} ms, columnar {columnar_time * 1000:.1f} ms, "
+        f"{(legacy_time - columnar_time) * 1000:.1f} ms CPU saved per request "
+        f"({legacy_time / columnar_time:.1f}x)"
+    )
+    return legacy_time, columnar_time
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    benchmark_seats_join(int(args[0]) if args else 1)
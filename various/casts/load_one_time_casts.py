@@ -1,9 +1,8 @@
 import sys
-import requests
 import pandas as pd
 from bs4 import BeautifulSoup
 from python_roh.src.config import *
-from tools import Parquet, Firestore
+from tools import Parquet, Firestore, HTTP_CLIENT
 from python_roh.src.api import get_query_dict
 from python_roh.casts import try_get_cast_for_current_performance
 
@@ -24,7 +23,7 @@ def try_get_cast_for_performance(
         except ValueError:
             return None
     print(f"Trying to get cast for {slug} {performance_id}")
-    cast_page = requests.get(url)
+    cast_page = HTTP_CLIENT.get(url)
     class_name = "sc-1wkkcn4-7"
 
     soup = BeautifulSoup(cast_page.content, "html.parser")
@@ -96,7 +95,7 @@ def get_historic_casts(refresh=False):
     # SPLIT
     casts = []
     for cast_sheet in cast_sheets:
-        cast_page = requests.get(cast_sheet)
+        cast_page = HTTP_CLIENT.get(cast_sheet)
         # JS equivalent: document.querySelectorAll('.sc-175uz2x-161 ul')
         from bs4 import BeautifulSoup
 
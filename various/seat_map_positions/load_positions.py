@@ -8,17 +8,21 @@ from cloud.utils import log
 from python_roh.src.src import API
 from python_roh.src.utils import JSON
 from python_roh.src.api import get_query_dict
+from python_roh.src.seat_geometry import SeatGeometry, seat_view_urls
 from python_roh.src.config import (
     SEAT_MAP_POSITIONS_CSV,
     SEAT_POSITIONS_JSON_LOCATION,
+    SEAT_GEOMETRY_LOCATION,
     PREFIX,
     TEXT_MAP_POSITIONS_CSV,
+    ZONE_MAPPING,
 )
 
 
 def load_positions(from_local=False):
     """
-    Load the seat map positions from the JSON file and write them to a CSV file.
+    Load the seat map positions from the JSON file and write them to a CSV file,
+    and compile them into the SeatGeometry used to position the seats of each request.
 
     Args:
     - from_local (bool): If True, the JSON file is loaded from the local file system.
@@ -46,9 +50,16 @@ def load_positions(from_local=False):
     seat_map = pd.DataFrame(seat_map_json)
     text_map, seat_map = seat_map.query("id == 'Text'"), seat_map.query("id != 'Text'")
 
-    seat_map = _process_seat_map(seat_map)
+    hall_seats_df = _query_hall_seats()
+    seat_map = _process_seat_map(seat_map, hall_seats_df)
     text_map = _process_text_map(text_map)
 
+    seat_geometry = SeatGeometry.compile(_join_hall_seats(seat_map, hall_seats_df))
+    seat_geometry.write(SEAT_GEOMETRY_LOCATION)
+    if PREFIX and from_local:
+        # Copy baked into the image, so that cold starts don't read it from storage
+        seat_geometry.write(SEAT_GEOMETRY_LOCATION.replace(PREFIX, ""))
+
     csv_name = SEAT_MAP_POSITIONS_CSV
     seat_map.to_csv(csv_name, index=False)
     Firestore(SEAT_MAP_POSITIONS_CSV).write(seat_map)
@@ -57,6 +68,43 @@ def load_positions(from_local=False):
     return csv_name
 
 
+def _query_hall_seats():
+    """
+    Query the seats of the hall with their general zone names and view-from-seat urls.
+    The SeatIds are the same for every performance.
+
+    Returns:
+    - seats_df (pd.DataFrame): SeatId, SeatName, ZoneName and SeatsViewUrl of each seat.
+    """
+    query_dict = get_query_dict()
+    api = API(query_dict)
+    seats_df = api.query_one_data("seats")
+    zones_df = api.query_one_data("zone_ids")
+    zones_df = zones_df.loc[:, ["ZoneId", "ZoneName"]].drop_duplicates("ZoneId")
+    seats_df = seats_df.merge(zones_df, on="ZoneId", how="left")
+    zone_names = seats_df.ZoneName
+    seats_df = seats_df.assign(
+        ZoneName=zone_names.map(ZONE_MAPPING).fillna(zone_names),
+        SeatsViewUrl=seat_view_urls(seats_df),
+    )
+    return seats_df.loc[:, ["SeatId", "SeatName", "ZoneName", "SeatsViewUrl"]]
+
+
+def _join_hall_seats(seat_map, hall_seats_df):
+    """
+    Add the SeatId and the SeatsViewUrl of each position of the seat map.
+
+    Args:
+    - seat_map (pd.DataFrame): The processed seat map data.
+    - hall_seats_df (pd.DataFrame): The seats of the hall from _query_hall_seats.
+
+    Returns:
+    - seat_map (pd.DataFrame): The seat map data with SeatId and SeatsViewUrl.
+    """
+    hall_seats_df = hall_seats_df.drop_duplicates(subset=["SeatName", "ZoneName"])
+    return seat_map.merge(hall_seats_df, on=["SeatName", "ZoneName"], how="left")
+
+
 def _process_text_map(text_map):
     """
     Process the text map data.
@@ -75,22 +123,20 @@ def _process_text_map(text_map):
     return text_map
 
 
-def _process_seat_map(seat_map):
+def _process_seat_map(seat_map, hall_seats_df):
     """
     Process the seat map data.
 
     Args:
     - seat_map (pd.DataFrame): The seat map data.
+    - hall_seats_df (pd.DataFrame): The seats of the hall from _query_hall_seats.
 
     Returns:
     - seat_map (pd.DataFrame): The processed seat map data.
     """
     seat_map.rename(columns={"cx": "x", "cy": "y"}, inplace=True)
 
-    # Get the seats data from the API
-    query_dict = get_query_dict()
-    seats_df = API(query_dict).query_one_data("seats")
-    seats_df = seats_df.loc[:, ["SeatId", "SeatName"]]
+    seats_df = hall_seats_df.loc[:, ["SeatId", "SeatName"]]
 
     # Handle two type of seats in the seat map
     seat_map_syos = seat_map.query("id.str.contains('syos-')")